@@ -0,0 +1,249 @@
+"""Approximate nearest-neighbour search with an inverted-file (IVF) index.
+
+Rows are clustered with spherical k-means; each centroid owns a posting list
+of row ids. A query scores only the rows in its ``n_probe`` closest lists, so
+``n_probe`` trades recall for latency. Everything runs on CPU with NumPy.
+"""
+
+import math
+import os
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+from vector_search import drop_excluded, normalize, top_k
+
+CENTROIDS_FILE = "ivf_centroids{tag}.npy"
+# Raw int32 list id per row; appends only write the new rows
+ASSIGNMENTS_FILE = "ivf_assignments{tag}.i32"
+
+# Below this many rows exact search is cheap enough and clusters are too noisy
+MIN_TRAIN_ROWS = 10_000
+# Upper bound on the rows k-means is fitted on (e.g. ~21k rows at 3072 dimensions)
+MAX_TRAIN_SAMPLE_BYTES = 256 * 2 ** 20
+
+
+class IVFIndex(object):
+    """Incrementally maintained IVF index over a row-major matrix of unit vectors.
+
+    Searches read one immutable snapshot (centroids, posting lists, rows
+    indexed), so a sync can run in another thread while they do. Rows past
+    the indexed ones, appended since the last sync, are scored exactly.
+    """
+
+    def __init__(self, path: Optional[str] = None, seed: int = 0, tag: str = "") -> None:
+        self.path = path
+        self.seed = seed
+        # Distinguishes index files of different store generations
+        self.tag = tag
+        self.trained_rows = 0
+        self._state: Tuple[Optional[np.ndarray], List[np.ndarray], int] = (None, [], 0)
+        if path:
+            self._load()
+
+    @property
+    def centroids(self) -> Optional[np.ndarray]:
+        return self._state[0]
+
+    @property
+    def is_trained(self) -> bool:
+        return self._state[0] is not None
+
+    @property
+    def n_indexed(self) -> int:
+        return self._state[2]
+
+    # ------------------------------------------------------------------
+    # Build
+    # ------------------------------------------------------------------
+    def train(self, matrix: np.ndarray, iterations: int = 10) -> None:
+        """Fit centroids on a sample of the matrix and (re)assign every row."""
+        n = matrix.shape[0]
+        n_lists = max(1, int(4 * math.sqrt(n)))
+        rng = np.random.default_rng(self.seed)
+        budget_rows = MAX_TRAIN_SAMPLE_BYTES // (matrix.shape[1] * 4)
+        sample_size = min(n, n_lists * 64, max(n_lists * 4, budget_rows))
+        sample = np.asarray(matrix[np.sort(rng.choice(n, sample_size, replace=False))])
+
+        centroids = sample[rng.choice(sample_size, n_lists, replace=False)].copy()
+        for _ in range(iterations):
+            assign = _assign(sample, centroids)
+            order = np.argsort(assign, kind="stable")
+            counts = np.bincount(assign, minlength=n_lists)
+            starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+            filled = counts > 0
+            sums = np.add.reduceat(sample[order], starts[filled], axis=0)
+            centroids[filled] = normalize(sums)
+            # Re-seed empty clusters with random sample points
+            empty = np.flatnonzero(~filled)
+            if empty.size:
+                centroids[empty] = sample[rng.choice(sample_size, empty.size, replace=False)]
+
+        centroids = centroids.astype(np.float32)
+        assignments = _assign(matrix, centroids)
+        self._save_all(centroids, assignments)
+        self._state = (centroids, _build_lists(assignments, n_lists, 0), n)
+        self.trained_rows = n
+
+    def remove_files(self) -> None:
+        """Delete this index's files from disk."""
+        if self.path:
+            remove_files(self.path, self.tag)
+
+    def clear(self) -> None:
+        """Drop the trained index; the next sync retrains from scratch."""
+        self._state = (None, [], 0)
+        self.trained_rows = 0
+
+    def add(self, matrix: np.ndarray) -> None:
+        """Assign rows of the matrix that are not indexed yet."""
+        centroids, lists, start = self._state
+        if centroids is None or matrix.shape[0] <= start:
+            return
+        assign = _assign(matrix[start:], centroids)
+        if self.path:
+            _write_at(self._assignments_path(), start * 4, assign.tobytes())
+        lists = list(lists)
+        for list_id, rows in _group_rows(assign, start):
+            lists[list_id] = np.concatenate([lists[list_id], rows])
+        self._state = (centroids, lists, matrix.shape[0])
+
+    def take(self, rows: np.ndarray, path: Optional[str] = None, tag: str = "") -> "IVFIndex":
+        """Index of the given rows only, renumbered 0..n-1, keeping the trained centroids.
+
+        ``rows`` must be sorted; rows not indexed yet are left for the next sync.
+        """
+        centroids, lists, n_indexed = self._state
+        index = IVFIndex(seed=self.seed, tag=tag)
+        index.path = path
+        if centroids is None:
+            return index
+        assignments = np.empty(n_indexed, dtype=np.int32)
+        for list_id, list_rows in enumerate(lists):
+            assignments[list_rows] = list_id
+        assignments = assignments[rows[rows < n_indexed]]
+        index._save_all(centroids, assignments)
+        index._state = (centroids, _build_lists(assignments, len(centroids), 0), int(assignments.size))
+        index.trained_rows = self.trained_rows
+        return index
+
+    def sync(self, matrix: np.ndarray) -> None:
+        """Bring the index up to date with the matrix, training or retraining as needed."""
+        n = matrix.shape[0]
+        if n < MIN_TRAIN_ROWS:
+            return
+        # Retrain once the corpus has grown well past what the centroids were fit on
+        if not self.is_trained or n >= 8 * self.trained_rows:
+            self.train(matrix)
+        else:
+            self.add(matrix)
+
+    # ------------------------------------------------------------------
+    # Search
+    # ------------------------------------------------------------------
+    def search(
+        self,
+        matrix: np.ndarray,
+        query: np.ndarray,
+        k: int,
+        n_probe: int = 8,
+        exclude: Optional[np.ndarray] = None,
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """Score only the rows in the n_probe lists closest to the query, skipping ``exclude``."""
+        query = normalize(query)
+        centroids, lists, n_indexed = self._state
+        probe = top_k(centroids @ query, min(n_probe, len(lists)))
+        tail = np.arange(n_indexed, matrix.shape[0], dtype=np.int64)
+        # Sorted ids keep the gather from the memory-mapped matrix sequential
+        candidates = np.sort(np.concatenate([lists[i] for i in probe] + [tail]))
+        if candidates.size == 0:
+            return candidates, np.empty(0, dtype=np.float32)
+        scores = np.asarray(matrix[candidates]) @ query
+        if exclude is not None and exclude.size:
+            scores[np.isin(candidates, exclude, assume_unique=True)] = -np.inf
+        best = top_k(scores, k)
+        return drop_excluded(candidates[best], scores[best])
+
+    # ------------------------------------------------------------------
+    # Persistence
+    # ------------------------------------------------------------------
+    def _assignments_path(self) -> str:
+        return os.path.join(self.path, ASSIGNMENTS_FILE.format(tag=self.tag))
+
+    def _centroids_path(self) -> str:
+        return os.path.join(self.path, CENTROIDS_FILE.format(tag=self.tag))
+
+    def _save_all(self, centroids: np.ndarray, assignments: np.ndarray) -> None:
+        if not self.path:
+            return
+        # Assignments first: a crash in between leaves them to be rejected by _load
+        tmp_path = self._assignments_path() + ".tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(assignments.astype(np.int32).tobytes())
+        os.replace(tmp_path, self._assignments_path())
+        tmp_path = self._centroids_path() + ".tmp"
+        with open(tmp_path, "wb") as f:
+            np.save(f, centroids)
+        os.replace(tmp_path, self._centroids_path())
+
+    def _load(self) -> None:
+        if not (os.path.exists(self._centroids_path()) and os.path.exists(self._assignments_path())):
+            return
+        centroids = np.load(self._centroids_path())
+        assignments = np.fromfile(self._assignments_path(), dtype=np.int32)
+        if assignments.size and assignments.max() >= len(centroids):
+            # Centroids and assignments come from different trainings
+            return
+        self._state = (centroids, _build_lists(assignments, len(centroids), 0), int(assignments.size))
+        self.trained_rows = int(assignments.size)
+
+    def file_signature(self) -> Tuple[int, int]:
+        """(centroids mtime, assignments size) on disk, to notice syncs by other processes."""
+        try:
+            return (
+                os.stat(self._centroids_path()).st_mtime_ns,
+                os.stat(self._assignments_path()).st_size,
+            )
+        except (FileNotFoundError, TypeError):
+            return 0, 0
+
+
+def remove_files(path: str, tag: str = "") -> None:
+    """Delete the index files of one store generation."""
+    for name in (CENTROIDS_FILE, ASSIGNMENTS_FILE):
+        try:
+            os.remove(os.path.join(path, name.format(tag=tag)))
+        except FileNotFoundError:
+            pass
+
+
+def _write_at(path: str, offset: int, data: bytes) -> None:
+    """Write data at ``offset``, dropping anything after it."""
+    mode = "r+b" if os.path.exists(path) else "w+b"
+    with open(path, mode) as f:
+        f.truncate(offset)
+        f.seek(offset)
+        f.write(data)
+
+
+def _group_rows(assign: np.ndarray, start: int):
+    """Yield (list id, row ids) for every list that received rows."""
+    order = np.argsort(assign, kind="stable")
+    rows = order.astype(np.int64) + start
+    list_ids, bounds = np.unique(assign[order], return_index=True)
+    return zip(list_ids, np.split(rows, bounds[1:]))
+
+
+def _build_lists(assign: np.ndarray, n_lists: int, start: int) -> List[np.ndarray]:
+    lists = [np.empty(0, dtype=np.int64) for _ in range(n_lists)]
+    for list_id, rows in _group_rows(assign, start):
+        lists[list_id] = rows
+    return lists
+
+
+def _assign(rows: np.ndarray, centroids: np.ndarray, block: int = 8192) -> np.ndarray:
+    """Index of the closest centroid for every row, computed in blocks."""
+    assign = np.empty(rows.shape[0], dtype=np.int32)
+    for start in range(0, rows.shape[0], block):
+        assign[start:start + block] = np.argmax(rows[start:start + block] @ centroids.T, axis=1)
+    return assign
@@ -0,0 +1,92 @@
+"""Semantic answer cache in front of the generate node."""
+
+import threading
+import time
+from typing import Optional
+
+import numpy as np
+
+from vector_search import normalize
+
+
+class SemanticAnswerCache(object):
+    """Reuses answers for questions whose embeddings are near-identical.
+
+    A lookup hits when the cosine similarity between the new question and a
+    cached one reaches ``threshold`` and the answer was produced against the
+    current corpus version. Any change in corpus version drops every entry,
+    so answers never outlive the documents they were grounded in. Full caches
+    evict the least recently used entry.
+    """
+
+    def __init__(self, threshold: float = 0.95, max_entries: int = 1000) -> None:
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+        self._lock = threading.Lock()
+        self._version: Optional[int] = None
+        self._matrix: Optional[np.ndarray] = None
+        self._answers: list = []
+        self._last_used = np.zeros(max_entries)
+
+    def _check_version(self, corpus_version: int) -> None:
+        if corpus_version != self._version:
+            if self._answers:
+                self.invalidations += 1
+            self._version = corpus_version
+            self._matrix = None
+            self._answers = []
+
+    def _best(self, query: np.ndarray) -> tuple:
+        if not self._answers:
+            return -1, -1.0
+        scores = self._matrix[:len(self._answers)] @ query
+        best = int(np.argmax(scores))
+        return best, float(scores[best])
+
+    def lookup(self, embedding: list, corpus_version: int) -> Optional[str]:
+        """Cached answer for a question embedding, or None."""
+        query = normalize(embedding)
+        with self._lock:
+            self._check_version(corpus_version)
+            slot, score = self._best(query)
+            if score >= self.threshold:
+                self.hits += 1
+                self._last_used[slot] = time.monotonic()
+                return self._answers[slot]
+            self.misses += 1
+            return None
+
+    def store(self, embedding: list, corpus_version: int, answer: str) -> None:
+        """Remember an answer; a near-identical cached question is overwritten."""
+        query = normalize(embedding)
+        with self._lock:
+            self._check_version(corpus_version)
+            if self._matrix is None:
+                self._matrix = np.zeros((self.max_entries, query.shape[0]), dtype=np.float32)
+
+            slot, score = self._best(query)
+            if score < self.threshold:
+                if len(self._answers) < self.max_entries:
+                    slot = len(self._answers)
+                    self._answers.append(answer)
+                else:
+                    slot = int(np.argmin(self._last_used))
+                    self.evictions += 1
+            self._matrix[slot] = query
+            self._answers[slot] = answer
+            self._last_used[slot] = time.monotonic()
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "entries": len(self._answers),
+            "evictions": self.evictions,
+            "invalidations": self.invalidations,
+        }
@@ -0,0 +1,75 @@
+"""Recall@k vs. latency of the IVF index against exact search.
+
+Builds the index incrementally (in batches, the way ``store_documents`` adds
+chunks) over a clustered synthetic corpus, then sweeps ``n_probe``.
+
+  python -m benchmarks.ann --size 200000 --dim 256 --probes 1 2 4 8 16 32 64
+"""
+
+import argparse
+import time
+
+import numpy as np
+
+from ann_index import IVFIndex
+from vector_search import normalize, search
+
+
+def _clustered_matrix(n: int, dim: int, n_topics: int, seed: int = 0) -> np.ndarray:
+    """Unit vectors drawn around random topic centres, like real document chunks."""
+    rng = np.random.default_rng(seed)
+    centres = normalize(rng.standard_normal((n_topics, dim), dtype=np.float32))
+    topics = rng.integers(0, n_topics, size=n)
+    noise = rng.standard_normal((n, dim), dtype=np.float32) * 0.08
+    return normalize(centres[topics] + noise)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--size", type=int, default=200_000)
+    parser.add_argument("--dim", type=int, default=256)
+    parser.add_argument("--k", type=int, default=4)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--batch", type=int, default=20_000, help="rows added per store_documents call")
+    parser.add_argument("--probes", type=int, nargs="+", default=[1, 2, 4, 8, 16, 32, 64])
+    args = parser.parse_args()
+
+    matrix = _clustered_matrix(args.size, args.dim, n_topics=max(10, args.size // 500))
+    rng = np.random.default_rng(1)
+    queries = normalize(
+        matrix[rng.integers(0, args.size, args.queries)]
+        + rng.standard_normal((args.queries, args.dim), dtype=np.float32) * 0.05
+    )
+
+    index = IVFIndex()
+    start = time.perf_counter()
+    for stop in range(args.batch, args.size + args.batch, args.batch):
+        index.sync(matrix[:min(stop, args.size)])
+    build_s = time.perf_counter() - start
+    print(f"built IVF over {index.n_indexed} rows in {build_s:.1f}s ({len(index.centroids)} lists)")
+
+    exact_ids, exact_ms = [], []
+    for q in queries:
+        t0 = time.perf_counter()
+        ids, _ = search(matrix, q, args.k)
+        exact_ms.append((time.perf_counter() - t0) * 1000)
+        exact_ids.append(set(ids.tolist()))
+    print(f"{'mode':>12} {'recall@k':>9} {'p50 ms':>8} {'p95 ms':>8}")
+    print(f"{'exact':>12} {1.0:>9.3f} {np.percentile(exact_ms, 50):>8.2f} {np.percentile(exact_ms, 95):>8.2f}")
+
+    for n_probe in args.probes:
+        hits, timings = 0, []
+        for q, truth in zip(queries, exact_ids):
+            t0 = time.perf_counter()
+            ids, _ = index.search(matrix, q, args.k, n_probe=n_probe)
+            timings.append((time.perf_counter() - t0) * 1000)
+            hits += len(truth & set(ids.tolist()))
+        recall = hits / (len(queries) * args.k)
+        print(
+            f"{'ivf/' + str(n_probe):>12} {recall:>9.3f} "
+            f"{np.percentile(timings, 50):>8.2f} {np.percentile(timings, 95):>8.2f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,149 @@
+"""Many conversations at once: sync graph on a thread pool vs. async graph on one event loop.
+
+The sync path runs ``rag.graph.invoke`` in a ``ThreadPoolExecutor``, which
+is what one Streamlit script thread per session amounts to. Each turn holds
+a thread for the whole time it waits on the providers. The async path runs
+``rag.graph.ainvoke`` as tasks on the shared event loop
+(``embedding_scheduler.shared_loop``), so a turn waiting on the network
+holds no thread. The embedding and chat stand-ins simulate provider latency
+with ``time.sleep`` in their sync methods and ``asyncio.sleep`` in their
+async ones, like a blocking vs. a non-blocking HTTP client.
+
+  python -m benchmarks.async_graph --conversations 8 32 128 --threads 16
+
+Reports turns/s, turn latency p50/p95 and the peak number of live threads
+for each mode and concurrency level.
+"""
+
+import argparse
+import asyncio
+import logging
+import os
+import random
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import List
+
+import numpy as np
+
+
+class ThreadSampler(object):
+    """Records the peak ``threading.active_count()`` while it runs."""
+
+    def __init__(self, interval: float = 0.005) -> None:
+        self.interval = interval
+        self.peak = threading.active_count()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            self.peak = max(self.peak, threading.active_count())
+
+    def __enter__(self) -> "ThreadSampler":
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self._stop.set()
+        self._thread.join()
+
+
+def _report(mode: str, conversations: int, seconds: float, latencies: List[float], threads: int) -> None:
+    ms = np.asarray(latencies) * 1000
+    print(
+        f"{mode:<6} {conversations:>13} {len(latencies) / seconds:>8.1f} "
+        f"{np.percentile(ms, 50):>8.0f} {np.percentile(ms, 95):>8.0f} {threads:>12}"
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--conversations", type=int, nargs="+", default=[8, 32, 128])
+    parser.add_argument("--turns", type=int, default=3, help="turns per conversation")
+    parser.add_argument("--threads", type=int, default=16, help="thread pool size for the sync graph")
+    parser.add_argument("--chunks", type=int, default=2000)
+    parser.add_argument("--dim", type=int, default=256)
+    parser.add_argument("--embedding-latency", type=float, default=0.05, help="seconds per embedding request")
+    parser.add_argument("--chat-latency", type=float, default=0.3, help="seconds to the first token")
+    parser.add_argument("--chat-token-latency", type=float, default=0.002, help="seconds per token")
+    args = parser.parse_args()
+
+    os.environ.setdefault("OPENAI_API_KEY", "benchmark")
+    os.environ.setdefault("GROQ_API_KEY", "benchmark")
+    os.environ["VECTOR_STORE_DIR"] = tempfile.mkdtemp(prefix="async-bench-")
+
+    from langchain_core.messages import HumanMessage
+
+    import llms
+    import rag
+    import retriever
+    from benchmarks.fakes import FakeChatModel, FakeEmbeddings
+    from benchmarks.suite import _WORDS, _synthetic_text
+    from embedding_cache import QueryCachedEmbeddings, QueryEmbeddingCache
+    from embedding_scheduler import run_sync
+
+    logging.disable(logging.INFO)
+    rng = random.Random(0)
+    texts = _synthetic_text(args.chunks * 200, rng, _WORDS).splitlines()[:args.chunks]
+    # Ingest without latency; only the query path is being measured
+    embeddings = FakeEmbeddings(size=args.dim)
+    llms.get_embeddings.set(QueryCachedEmbeddings(embeddings, QueryEmbeddingCache("async-bench")))
+    llms.get_chat_model.set(FakeChatModel(
+        messages=iter(lambda: "Based on the context, " + "the policy applies " * 20, None),
+        latency=args.chat_latency,
+        token_latency=args.chat_token_latency,
+    ))
+    retriever.get_vector_store().add_texts(texts)
+    rag.retriever.invoke(texts[0])  # first query builds lazy state
+    embeddings.latency = args.embedding_latency
+
+    def turn_input(mode: str, conversation: int, turn: int) -> dict:
+        # Unique questions, so neither the query nor the answer cache hides the latency
+        question = f"{mode} {conversation} {turn}: {rng.choice(_WORDS)} {rng.choice(_WORDS)}?"
+        return {"messages": [HumanMessage(content=question)]}
+
+    def run_threads(conversations: int) -> List[float]:
+        def conversation(c: int) -> List[float]:
+            config = rag.session_config(f"sync-{conversations}-{c}", bypass_answer_cache=True)
+            latencies = []
+            for t in range(args.turns):
+                start = time.perf_counter()
+                rag.graph.invoke(turn_input("sync", c, t), config=config)
+                latencies.append(time.perf_counter() - start)
+            return latencies
+
+        with ThreadPoolExecutor(args.threads) as pool:
+            return [s for result in pool.map(conversation, range(conversations)) for s in result]
+
+    def run_async(conversations: int) -> List[float]:
+        async def conversation(c: int) -> List[float]:
+            config = rag.session_config(f"async-{conversations}-{c}", bypass_answer_cache=True)
+            latencies = []
+            for t in range(args.turns):
+                start = time.perf_counter()
+                await rag.graph.ainvoke(turn_input("async", c, t), config=config)
+                latencies.append(time.perf_counter() - start)
+            return latencies
+
+        async def run_all() -> List[float]:
+            results = await asyncio.gather(*(conversation(c) for c in range(conversations)))
+            return [s for result in results for s in result]
+
+        return run_sync(run_all())
+
+    run_sync(asyncio.sleep(0))  # start the shared loop before sampling threads
+    print(f"{'mode':<6} {'conversations':>13} {'turns/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'peak threads':>12}")
+    for conversations in args.conversations:
+        for mode, run in (("sync", run_threads), ("async", run_async)):
+            with ThreadSampler() as sampler:
+                start = time.perf_counter()
+                latencies = run(conversations)
+                seconds = time.perf_counter() - start
+            _report(mode, conversations, seconds, latencies, sampler.peak)
+
+
+if __name__ == "__main__":
+    main()
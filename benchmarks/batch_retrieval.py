@@ -0,0 +1,75 @@
+"""Throughput of batched vs. one-at-a-time retrieval for large question sets.
+
+Engine level: 10k queries against the index, either as one matrix-vector
+product per query or as blocked matrix-matrix products (``search_many``).
+Retriever level: ``DocumentRetriever.batch`` against ``invoke`` in a loop,
+on a throwaway store with fake embeddings.
+
+  python -m benchmarks.batch_retrieval --rows 100000 --queries 10000 --dim 256
+"""
+
+import argparse
+import os
+import tempfile
+import time
+
+import numpy as np
+
+from vector_search import normalize, search, search_many
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=100_000)
+    parser.add_argument("--queries", type=int, default=10_000)
+    parser.add_argument("--dim", type=int, default=256)
+    parser.add_argument("--k", type=int, default=4)
+    parser.add_argument("--retriever-rows", type=int, default=20_000)
+    parser.add_argument("--retriever-queries", type=int, default=2_000)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    matrix = normalize(rng.standard_normal((args.rows, args.dim), dtype=np.float32))
+    queries = rng.standard_normal((args.queries, args.dim), dtype=np.float32)
+
+    start = time.perf_counter()
+    looped = [search(matrix, q, args.k)[0] for q in queries]
+    loop_s = time.perf_counter() - start
+    start = time.perf_counter()
+    batched, _ = search_many(matrix, queries, args.k)
+    batch_s = time.perf_counter() - start
+    # Matrix-matrix and matrix-vector products round differently, so near ties may swap
+    same = np.mean([set(a.tolist()) == set(b.tolist()) for a, b in zip(looped, batched)])
+    print(f"engine, {args.queries} queries x {args.rows} rows (identical top-k: {same:.2%}):")
+    print(f"  per-query : {loop_s:7.2f}s  {args.queries / loop_s:9.0f} queries/s")
+    print(f"  batched   : {batch_s:7.2f}s  {args.queries / batch_s:9.0f} queries/s")
+
+    os.environ.setdefault("OPENAI_API_KEY", "benchmark")
+    os.environ.setdefault("GROQ_API_KEY", "benchmark")
+    os.environ["VECTOR_STORE_DIR"] = tempfile.mkdtemp(prefix="batch-bench-")
+    import llms
+    import retriever
+    from benchmarks.fakes import FakeEmbeddings
+
+    llms.get_embeddings.set(FakeEmbeddings(size=args.dim))
+    texts = [f"chunk {i}" for i in range(args.retriever_rows)]
+    for start in range(0, len(texts), 5000):
+        retriever.get_vector_store().add_texts(texts[start:start + 5000])
+    questions = [f"question {i}" for i in range(args.retriever_queries)]
+    r = retriever.DocumentRetriever(k=args.k)
+
+    print(f"retriever, {len(questions)} questions x {args.retriever_rows} chunks (fake embeddings):")
+    start = time.perf_counter()
+    expected = [r.invoke(q) for q in questions]
+    loop_s = time.perf_counter() - start
+    start = time.perf_counter()
+    results = r.batch(questions)
+    batch_s = time.perf_counter() - start
+    same = np.mean([{d.id for d in a} == {d.id for d in b} for a, b in zip(results, expected)])
+    print(f"  identical top-k: {same:.2%}")
+    print(f"  invoke loop : {loop_s:7.2f}s  {len(questions) / loop_s:9.0f} queries/s")
+    print(f"  batch       : {batch_s:7.2f}s  {len(questions) / batch_s:9.0f} queries/s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+"""Checkpoint bytes and latency per turn over a long chat, with and without history compaction.
+
+Runs the real graph against a throwaway index with fake embeddings and a
+fake chat model, so no network is needed. "bytes written" is what the
+checkpointer stored for that turn; without compaction it grows with the
+conversation, with compaction it levels off once the history window is full.
+
+  python -m benchmarks.conversation_history --turns 200 --answer-chars 800
+"""
+
+import argparse
+import itertools
+import os
+import tempfile
+import time
+
+
+def _saved_bytes(saver) -> int:
+    size = sum(len(t) + len(b) for t, b in saver.blobs.values())
+    for namespaces in saver.storage.values():
+        for checkpoints in namespaces.values():
+            for checkpoint, metadata, _ in checkpoints.values():
+                size += len(checkpoint[1]) + len(metadata[1])
+    for writes in saver.writes.values():
+        size += sum(len(w[2][1]) for w in writes.values())
+    return size
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--turns", type=int, default=200)
+    parser.add_argument("--answer-chars", type=int, default=800)
+    parser.add_argument("--report-every", type=int, default=25)
+    args = parser.parse_args()
+
+    os.environ.setdefault("OPENAI_API_KEY", "benchmark")
+    os.environ.setdefault("GROQ_API_KEY", "benchmark")
+    os.environ["VECTOR_STORE_DIR"] = tempfile.mkdtemp(prefix="history-bench-")
+
+    from langchain_core.language_models.fake_chat_models import GenericFakeChatModel
+    from langchain_core.messages import AIMessage, HumanMessage
+    from langgraph.checkpoint.memory import MemorySaver
+
+    import llms
+    import rag
+    import retriever
+    from benchmarks.fakes import FakeEmbeddings
+
+    embeddings = FakeEmbeddings(size=64)
+    llms.get_embeddings.set(embeddings)
+    retriever.get_vector_store().add_texts([f"policy section {i}" for i in range(100)])
+    answer = AIMessage(content=("The policy says " + "x" * args.answer_chars)[:args.answer_chars])
+    llms.get_chat_model.set(GenericFakeChatModel(messages=itertools.repeat(answer)))
+
+    window = (rag.HISTORY_MAX_TURNS, rag.HISTORY_MAX_TOKENS)
+    for mode, (max_turns, max_tokens) in [("unbounded", (10 ** 9, 10 ** 9)), ("compacted", window)]:
+        rag.HISTORY_MAX_TURNS, rag.HISTORY_MAX_TOKENS = max_turns, max_tokens
+        saver = MemorySaver()
+        graph = rag.builder.compile(checkpointer=saver)
+        config = rag.session_config(mode, bypass_answer_cache=True)
+        print(f"{mode} (keep {min(max_turns, 10 ** 6)} turns):")
+        print(f"{'turn':>6} {'bytes written':>14} {'turn ms':>9} {'messages':>9}")
+        total = 0
+        for turn in range(1, args.turns + 1):
+            before = _saved_bytes(saver)
+            start = time.perf_counter()
+            state = graph.invoke({"messages": [HumanMessage(content=f"Question {turn}?")]}, config=config)
+            seconds = time.perf_counter() - start
+            written = _saved_bytes(saver) - before
+            total += written
+            if turn == 1 or turn % args.report_every == 0:
+                print(f"{turn:>6} {written:>14,} {seconds * 1000:>9.1f} {len(state['messages']):>9}")
+        print(f"{'total':>6} {total:>14,}\n")
+    rag.HISTORY_MAX_TURNS, rag.HISTORY_MAX_TOKENS = window
+
+
+if __name__ == "__main__":
+    main()
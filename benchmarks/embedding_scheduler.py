@@ -0,0 +1,56 @@
+"""Serial vs. scheduled batch embedding against a simulated provider.
+
+The fake provider adds per-request latency and answers a share of requests
+with HTTP 429, so the run exercises batching, concurrency, the TPM budget
+and retry with backoff. Output order is checked against direct embedding.
+
+  python -m benchmarks.embedding_scheduler --chunks 4000 --latency 0.2 --error-rate 0.1
+"""
+
+import argparse
+import time
+
+from benchmarks.fakes import FakeEmbeddings
+from embedding_scheduler import ScheduledEmbeddings
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--chunks", type=int, default=4000)
+    parser.add_argument("--chunk-chars", type=int, default=1000)
+    parser.add_argument("--latency", type=float, default=0.2, help="seconds per request")
+    parser.add_argument("--latency-per-token", type=float, default=2e-6)
+    parser.add_argument("--error-rate", type=float, default=0.1, help="share of requests answered with 429")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 8, 16])
+    parser.add_argument("--tpm", type=int, default=5_000_000)
+    args = parser.parse_args()
+
+    texts = [f"chunk {i} " + "x" * args.chunk_chars for i in range(args.chunks)]
+
+    serial = FakeEmbeddings(latency=args.latency, latency_per_token=args.latency_per_token)
+    start = time.perf_counter()
+    expected = serial.embed_documents(texts)
+    print(f"{'serial':>14}: {time.perf_counter() - start:6.2f}s  requests={serial.requests}")
+
+    for concurrency in args.concurrency:
+        fake = FakeEmbeddings(
+            latency=args.latency,
+            latency_per_token=args.latency_per_token,
+            error_rate=args.error_rate,
+            seed=concurrency,
+        )
+        scheduled = ScheduledEmbeddings(
+            fake, max_concurrency=concurrency, tokens_per_minute=args.tpm, base_delay=0.05
+        )
+        start = time.perf_counter()
+        vectors = scheduled.embed_documents(texts)
+        seconds = time.perf_counter() - start
+        assert vectors == expected, "scheduled output is out of order"
+        print(
+            f"{'concurrency=' + str(concurrency):>14}: {seconds:6.2f}s  requests={fake.requests} "
+            f"429s={fake.rate_limited} retries={scheduled.retries} peak_in_flight={fake.peak_in_flight}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,185 @@
+"""Local stand-ins for the OpenAI and Groq clients used by the benchmarks.
+
+They need no network, are deterministic, and can simulate provider latency
+and failures (HTTP 429 rate limits) so the scheduling, caching and
+concurrency code paths can be exercised offline.
+"""
+
+import asyncio
+import hashlib
+import random
+import re
+import threading
+import time
+from typing import Any, AsyncIterator, Iterator, List, Optional
+
+import numpy as np
+
+from langchain_core.embeddings import Embeddings
+from langchain_core.language_models.fake_chat_models import GenericFakeChatModel
+from langchain_core.messages import AIMessageChunk, BaseMessage
+from langchain_core.outputs import ChatGenerationChunk, ChatResult
+
+from embedding_scheduler import estimate_tokens
+
+
+class FakeRateLimitError(Exception):
+    """Looks like openai.RateLimitError to the retry logic."""
+
+    status_code = 429
+
+
+class FakeEmbeddings(Embeddings):
+    """Deterministic embeddings with simulated request latency and 429s.
+
+    Each ``embed_documents`` call is split into requests of ``request_size``
+    inputs, like ``OpenAIEmbeddings``; every request sleeps
+    ``latency + tokens * latency_per_token`` and fails with probability
+    ``error_rate``.
+    """
+
+    def __init__(
+        self,
+        size: int = 256,
+        latency: float = 0.0,
+        latency_per_token: float = 0.0,
+        error_rate: float = 0.0,
+        request_size: int = 1000,
+        seed: int = 0,
+    ):
+        self.size = size
+        self.latency = latency
+        self.latency_per_token = latency_per_token
+        self.error_rate = error_rate
+        self.request_size = request_size
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.rate_limited = 0
+        self.in_flight = 0
+        self.peak_in_flight = 0
+
+    def vector(self, text: str) -> List[float]:
+        seed = int.from_bytes(hashlib.sha256(text.encode("utf-8")).digest()[:8], "little")
+        return np.random.default_rng(seed).standard_normal(self.size).astype(np.float32).tolist()
+
+    def _begin(self, texts: List[str]) -> float:
+        with self._lock:
+            self.requests += 1
+            self.in_flight += 1
+            self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+            fail = self._rng.random() < self.error_rate
+        if fail:
+            with self._lock:
+                self.rate_limited += 1
+                self.in_flight -= 1
+            raise FakeRateLimitError("429 Too Many Requests")
+        return self.latency + self.latency_per_token * sum(estimate_tokens(t) for t in texts)
+
+    def _end(self) -> None:
+        with self._lock:
+            self.in_flight -= 1
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        out = []
+        for start in range(0, len(texts), self.request_size):
+            batch = texts[start:start + self.request_size]
+            time.sleep(self._begin(batch))
+            self._end()
+            out.extend(self.vector(t) for t in batch)
+        return out
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        out = []
+        for start in range(0, len(texts), self.request_size):
+            batch = texts[start:start + self.request_size]
+            await asyncio.sleep(self._begin(batch))
+            self._end()
+            out.extend(self.vector(t) for t in batch)
+        return out
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embed_documents([text])[0]
+
+    async def aembed_query(self, text: str) -> List[float]:
+        return (await self.aembed_documents([text]))[0]
+
+
+class FakeChatModel(GenericFakeChatModel):
+    """Fake chat model that answers with a provider's timing.
+
+    Waits ``latency`` seconds before the first token and ``token_latency``
+    seconds per whitespace-separated token, whether invoked or streamed, and
+    fails with probability ``error_rate`` like a rate-limited provider. The
+    async methods wait with ``asyncio.sleep``, like a non-blocking HTTP client.
+    """
+
+    latency: float = 0.0
+    token_latency: float = 0.0
+    error_rate: float = 0.0
+
+    def _maybe_fail(self) -> None:
+        if self.error_rate and random.random() < self.error_rate:
+            raise FakeRateLimitError("429 Too Many Requests")
+
+    def _generate(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Any = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        self._maybe_fail()
+        result = super()._generate(messages, stop=stop, run_manager=run_manager, **kwargs)
+        tokens = len(str(result.generations[0].message.content).split())
+        time.sleep(self.latency + self.token_latency * tokens)
+        return result
+
+    def _stream(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Any = None,
+        **kwargs: Any,
+    ) -> Iterator[ChatGenerationChunk]:
+        self._maybe_fail()
+        message = super()._generate(messages, stop=stop, **kwargs).generations[0].message
+        time.sleep(self.latency)
+        for token in re.split(r"(\s)", str(message.content)):
+            if token.strip():
+                time.sleep(self.token_latency)
+            chunk = ChatGenerationChunk(message=AIMessageChunk(content=token, id=message.id))
+            if run_manager:
+                run_manager.on_llm_new_token(token, chunk=chunk)
+            yield chunk
+
+    async def _agenerate(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Any = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        self._maybe_fail()
+        result = super()._generate(messages, stop=stop, **kwargs)
+        tokens = len(str(result.generations[0].message.content).split())
+        await asyncio.sleep(self.latency + self.token_latency * tokens)
+        return result
+
+    async def _astream(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Any = None,
+        **kwargs: Any,
+    ) -> AsyncIterator[ChatGenerationChunk]:
+        self._maybe_fail()
+        message = super()._generate(messages, stop=stop, **kwargs).generations[0].message
+        await asyncio.sleep(self.latency)
+        for token in re.split(r"(\s)", str(message.content)):
+            if token.strip():
+                await asyncio.sleep(self.token_latency)
+            chunk = ChatGenerationChunk(message=AIMessageChunk(content=token, id=message.id))
+            if run_manager:
+                await run_manager.on_llm_new_token(token, chunk=chunk)
+            yield chunk
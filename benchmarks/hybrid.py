@@ -0,0 +1,82 @@
+"""Query latency of vector, BM25 and hybrid (reciprocal rank fusion) retrieval.
+
+Builds a throwaway MmapVectorStore of synthetic chunks with fake embeddings.
+Every chunk mentions a campaign code such as "CMP-01234". Each query asks
+about one code, and the hit rate shows whether that code's chunk came back
+in the top k. Fake embeddings carry no meaning, so only the latency of the
+vector mode is reported.
+
+  python -m benchmarks.hybrid --sizes 10000 100000
+"""
+
+import argparse
+import random
+import tempfile
+import time
+
+import numpy as np
+
+from benchmarks.fakes import FakeEmbeddings
+from vector_store import MmapVectorStore
+
+WORDS = ["campaign", "lead", "MQL", "SQL", "attribution", "budget", "channel", "policy",
+         "pipeline", "conversion", "segment", "quarter", "forecast", "owner", "review",
+         "email", "webinar", "paid", "social", "launch", "region", "target", "spend"]
+
+
+def _chunks(n: int, seed: int = 0):
+    rng = random.Random(seed)
+    for i in range(n):
+        body = " ".join(rng.choice(WORDS) for _ in range(rng.randint(60, 160)))
+        yield f"Campaign CMP-{i:05d}: {body}."
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000])
+    parser.add_argument("--dim", type=int, default=256)
+    parser.add_argument("--k", type=int, default=4)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--batch", type=int, default=5000)
+    args = parser.parse_args()
+
+    for size in args.sizes:
+        store = MmapVectorStore(FakeEmbeddings(size=args.dim), tempfile.mkdtemp(prefix="hybrid-bench-"))
+        texts = _chunks(size)
+        start = time.perf_counter()
+        while True:
+            batch = [t for _, t in zip(range(args.batch), texts)]
+            if not batch:
+                break
+            store.add_texts(batch)
+        print(f"\n{size} chunks indexed in {time.perf_counter() - start:.1f}s")
+        start = time.perf_counter()
+        store.lexical_search_with_score("warm up")
+        print(f"BM25 index built on first keyword query in {time.perf_counter() - start:.1f}s")
+
+        rng = random.Random(1)
+        targets = [rng.randrange(size) for _ in range(args.queries)]
+        queries = [f"What budget does CMP-{t:05d} have?" for t in targets]
+        modes = {
+            "vector": lambda q: store.similarity_search(q, k=args.k),
+            "bm25": lambda q: [d for d, _ in store.lexical_search_with_score(q, k=args.k)],
+            "hybrid": lambda q: [d for d, _ in store.hybrid_search(q, k=args.k)],
+        }
+        print(f"{'mode':>8} {'p50 ms':>8} {'p95 ms':>8} {'code hit@k':>11}")
+        for mode, run in modes.items():
+            run(queries[0])  # warm up
+            timings, hits = [], 0
+            for query, target in zip(queries, targets):
+                t0 = time.perf_counter()
+                docs = run(query)
+                timings.append((time.perf_counter() - t0) * 1000)
+                hits += any(f"CMP-{target:05d}" in d.page_content for d in docs)
+            hit_rate = "-" if mode == "vector" else f"{hits / len(queries):.2f}"
+            print(
+                f"{mode:>8} {np.percentile(timings, 50):>8.2f} "
+                f"{np.percentile(timings, 95):>8.2f} {hit_rate:>11}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+"""Cold start of the app: module import times and the first run of the Streamlit script.
+
+Every measurement runs in a fresh interpreter, so nothing is already imported:
+  - import time of each app module, plus any provider SDK or document
+    parser the import pulled in (those should only load on first use)
+  - first paint: the first run of ``streamlit_app.py`` through Streamlit's
+    AppTest (imports, page and chat tab drawn), then a rerun in the same
+    process, which is what every later interaction costs
+
+  python -m benchmarks.import_time --repeat 5
+
+Exits 1 if importing an app module loads one of the deferred dependencies.
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+MODULES = ["document_loader", "llms", "retriever", "rag"]
+
+# Imported on first use only: model clients, and parsers for one file type each
+DEFERRED = [
+    "openai", "langchain_openai", "groq", "langchain_groq", "langchain.embeddings",
+    "langchain_community", "pypdf", "unstructured",
+]
+
+_IMPORT = """
+import json, sys, time
+start = time.perf_counter()
+import {module}
+seconds = time.perf_counter() - start
+print(json.dumps({{"seconds": seconds, "loaded": [m for m in {deferred!r} if m in sys.modules]}}))
+"""
+
+_FIRST_PAINT = """
+import json, time
+from streamlit.testing.v1 import AppTest
+start = time.perf_counter()
+app = AppTest.from_file({script!r}, default_timeout=300)
+app.run()
+first = time.perf_counter() - start
+errors = [e.message for e in app.exception]
+import llms
+llms.preload().join()  # keep background client creation out of the rerun
+start = time.perf_counter()
+app.run()
+rerun = time.perf_counter() - start
+print(json.dumps({{"first_paint": first, "rerun": rerun, "errors": errors}}))
+"""
+
+
+def _run(code: str) -> dict:
+    env = {
+        **os.environ,
+        "OPENAI_API_KEY": os.environ.get("OPENAI_API_KEY", "benchmark"),
+        "GROQ_API_KEY": os.environ.get("GROQ_API_KEY", "benchmark"),
+        "PYTHONPATH": ROOT,
+    }
+    work_dir = tempfile.mkdtemp(prefix="import-bench-")
+    env["VECTOR_STORE_DIR"] = os.path.join(work_dir, "index")
+    # Run from a scratch directory so ./cache is not created in the repo
+    out = subprocess.run(
+        [sys.executable, "-c", code], cwd=work_dir, env=env, check=True, capture_output=True, text=True
+    ).stdout.strip().splitlines()[-1]
+    return json.loads(out)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=5, help="fresh processes per measurement (median reported)")
+    parser.add_argument("--output", help="write the results as JSON")
+    args = parser.parse_args()
+
+    results, problems = {"imports": {}}, []
+    print(f"{'module':<16} {'import ms':>10}  deferred modules loaded")
+    for module in MODULES:
+        runs = [_run(_IMPORT.format(module=module, deferred=DEFERRED)) for _ in range(args.repeat)]
+        seconds = statistics.median(r["seconds"] for r in runs)
+        loaded = runs[0]["loaded"]
+        results["imports"][module] = {"ms": seconds * 1000, "deferred_loaded": loaded}
+        print(f"{module:<16} {seconds * 1000:>10.0f}  {', '.join(loaded) or '-'}")
+        if loaded:
+            problems.append(f"importing {module} loads {', '.join(loaded)}")
+
+    script = os.path.join(ROOT, "streamlit_app.py")
+    runs = [_run(_FIRST_PAINT.format(script=script)) for _ in range(args.repeat)]
+    for r in runs:
+        problems.extend(f"streamlit_app.py raised: {e}" for e in r["errors"])
+    first = statistics.median(r["first_paint"] for r in runs)
+    rerun = statistics.median(r["rerun"] for r in runs)
+    results.update(first_paint_ms=first * 1000, rerun_ms=rerun * 1000)
+    print(f"\nfirst paint (cold process) {first * 1000:>8.0f} ms")
+    print(f"rerun                      {rerun * 1000:>8.0f} ms")
+
+    for problem in problems:
+        print(problem)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+    if problems:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
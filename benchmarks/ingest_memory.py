@@ -0,0 +1,116 @@
+"""Peak RSS of ingestion as the upload grows: streaming pipeline vs. all-at-once.
+
+Each run happens in a fresh subprocess against a throwaway index with local
+fake embeddings, so no network is needed and the numbers do not mix.
+
+  python -m benchmarks.ingest_memory --files 2 8 32 --file-kb 256 --dim 1536
+
+"eager" reproduces the previous behaviour: parse every file, split every
+document, then embed and index everything in one call.
+"""
+
+import argparse
+import json
+import os
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+
+class _Upload(object):
+    """Stand-in for Streamlit's UploadedFile."""
+
+    def __init__(self, name: str, data: bytes):
+        self.name = name
+        self._data = data
+
+    def getbuffer(self) -> memoryview:
+        return memoryview(self._data)
+
+
+def _synthetic_text(n_bytes: int, seed: int) -> bytes:
+    rng = random.Random(seed)
+    words = ["campaign", "lead", "MQL", "attribution", "budget", "channel", "policy",
+             "pipeline", "conversion", "segment", "quarter", "forecast", "owner", "review"]
+    out, size = [], 0
+    while size < n_bytes:
+        sentence = " ".join(rng.choice(words) for _ in range(rng.randint(8, 20))) + ".\n"
+        out.append(sentence)
+        size += len(sentence)
+    return "".join(out).encode("utf-8")
+
+
+def _worker(mode: str, n_files: int, file_kb: int, dim: int) -> None:
+    os.environ.setdefault("OPENAI_API_KEY", "benchmark")
+    os.environ.setdefault("GROQ_API_KEY", "benchmark")
+    os.environ["VECTOR_STORE_DIR"] = tempfile.mkdtemp(prefix="ingest-bench-")
+
+    from langchain_core.embeddings import DeterministicFakeEmbedding
+
+    import llms
+    import retriever
+
+    llms.get_embeddings.set(DeterministicFakeEmbedding(size=dim))
+    rag_retriever = retriever.DocumentRetriever(parse_workers=1)
+    files = [_Upload(f"doc{i}.txt", _synthetic_text(file_kb * 1024, i)) for i in range(n_files)]
+    baseline_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    start = time.perf_counter()
+    if mode == "streaming":
+        rag_retriever.add_documents_from_uploads(files)
+    else:
+        from document_loader import load_document
+
+        docs = []
+        for f in files:
+            path = os.path.join(retriever.get_vector_store().path, f.name)
+            with open(path, "wb") as out:
+                out.write(f.getbuffer())
+            docs.extend(load_document(path))
+        chunks = list(rag_retriever._split(docs))
+        retriever.get_vector_store().add_documents(chunks)
+    seconds = time.perf_counter() - start
+
+    peak_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    print(json.dumps({
+        "chunks": len(retriever.get_vector_store()),
+        "seconds": seconds,
+        "peak_mb": peak_kb / 1024,
+        "growth_mb": (peak_kb - baseline_kb) / 1024,
+    }))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--files", type=int, nargs="+", default=[2, 8, 32])
+    parser.add_argument("--file-kb", type=int, default=256)
+    parser.add_argument("--dim", type=int, default=1536)
+    parser.add_argument("--modes", nargs="+", default=["streaming", "eager"])
+    parser.add_argument("--worker", nargs=4, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        mode, n_files, file_kb, dim = args.worker
+        _worker(mode, int(n_files), int(file_kb), int(dim))
+        return
+
+    print(f"{'mode':>10} {'files':>6} {'MB in':>7} {'chunks':>7} {'secs':>7} {'peak RSS MB':>12} {'growth MB':>10}")
+    for mode in args.modes:
+        for n_files in args.files:
+            out = subprocess.run(
+                [sys.executable, "-m", "benchmarks.ingest_memory", "--worker",
+                 mode, str(n_files), str(args.file_kb), str(args.dim)],
+                check=True, capture_output=True, text=True,
+            ).stdout.strip().splitlines()[-1]
+            r = json.loads(out)
+            print(
+                f"{mode:>10} {n_files:>6} {n_files * args.file_kb / 1024:>7.1f} {r['chunks']:>7} "
+                f"{r['seconds']:>7.1f} {r['peak_mb']:>12.0f} {r['growth_mb']:>10.0f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,317 @@
+"""Many chat sessions at once against the shared retriever, vector store and checkpointer.
+
+Each simulated session runs in its own thread, the way Streamlit runs one
+script thread per browser session. A session uploads its own files through
+``DocumentRetriever.add_documents_from_uploads`` and then streams a series
+of questions through ``rag.stream_turn``. Every other turn is filtered to
+the session's own files. OpenAI and Groq are replaced by local stand-ins
+with configurable latency and 429 rates. The embedding stand-in sits behind
+the same cache and scheduler stack as ``llms.py``.
+
+  python -m benchmarks.load_test --sessions 1 4 16 32 --questions 10 --error-rate 0.02
+
+Every concurrency level runs in a fresh subprocess. The report shows turn
+throughput, latency percentiles, injected provider errors and two kinds of
+problems:
+  - failures: unexpected exceptions, a turn whose state holds another
+    session's question, filtered retrieval returning another session's
+    chunks, or a store whose chunk count disagrees with the ingest manifest
+  - lock contention: time threads spent waiting to acquire the shared locks,
+    as a share of total session time, plus the most contended lock
+"""
+
+import argparse
+import json
+import logging
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import traceback
+from typing import Dict, List
+
+import numpy as np
+
+from benchmarks.ingest_memory import _synthetic_text, _Upload
+
+
+class TimedLock(object):
+    """Wraps a Lock/RLock and records how long acquiring it had to wait."""
+
+    def __init__(self, lock, name: str) -> None:
+        self._lock = lock
+        self.name = name
+        self.acquisitions = 0
+        self.wait_seconds = 0.0
+        self.max_wait = 0.0
+        self._stats_lock = threading.Lock()
+
+    def acquire(self, blocking: bool = True, timeout: float = -1) -> bool:
+        start = time.perf_counter()
+        acquired = self._lock.acquire(blocking, timeout)
+        waited = time.perf_counter() - start
+        with self._stats_lock:
+            self.acquisitions += 1
+            self.wait_seconds += waited
+            self.max_wait = max(self.max_wait, waited)
+        return acquired
+
+    def release(self) -> None:
+        self._lock.release()
+
+    def __enter__(self) -> bool:
+        return self.acquire()
+
+    def __exit__(self, *exc) -> None:
+        self.release()
+
+
+def _instrument(objects: Dict[str, object]) -> List[TimedLock]:
+    locks = []
+    for name, obj in objects.items():
+        for attr in ("_lock", "_write_lock"):
+            if hasattr(obj, attr):
+                timed = TimedLock(getattr(obj, attr), f"{name}.{attr}")
+                setattr(obj, attr, timed)
+                locks.append(timed)
+    return locks
+
+
+def _worker(args: argparse.Namespace) -> dict:
+    os.environ.setdefault("OPENAI_API_KEY", "benchmark")
+    os.environ.setdefault("GROQ_API_KEY", "benchmark")
+    work_dir = tempfile.mkdtemp(prefix="load-test-")
+    os.environ["VECTOR_STORE_DIR"] = os.path.join(work_dir, "index")
+
+    from langchain.embeddings import CacheBackedEmbeddings
+    from langchain.storage import EncoderBackedStore
+    from langchain_core.messages import HumanMessage
+
+    import llms
+    import rag
+    import retriever
+    from benchmarks.fakes import FakeChatModel, FakeEmbeddings, FakeRateLimitError
+    from embedding_cache import (
+        QueryCachedEmbeddings,
+        QueryEmbeddingCache,
+        SQLiteByteStore,
+        decode_vector,
+        encode_vector,
+        text_key,
+    )
+    from embedding_scheduler import ScheduledEmbeddings
+
+    logging.disable(logging.WARNING)
+    fake = FakeEmbeddings(
+        size=args.dim, latency=args.embed_latency, error_rate=args.error_rate, seed=args.sessions
+    )
+    scheduled = ScheduledEmbeddings(fake, max_concurrency=4, base_delay=0.05)
+    byte_store = SQLiteByteStore(os.path.join(work_dir, "embeddings.sqlite"))
+    embeddings = QueryCachedEmbeddings(
+        CacheBackedEmbeddings(
+            scheduled,
+            EncoderBackedStore(
+                byte_store,
+                key_encoder=lambda text: text_key("fake", text),
+                value_serializer=encode_vector,
+                value_deserializer=decode_vector,
+            ),
+        ),
+        QueryEmbeddingCache("fake", store=byte_store),
+    )
+    llms.get_embeddings.set(embeddings)
+    llms.get_chat_model.set(FakeChatModel(
+        messages=iter(lambda: "According to the documents " + "the answer is grounded " * 20, None),
+        latency=args.chat_latency,
+        token_latency=args.chat_token_latency,
+        error_rate=args.error_rate,
+    ))
+    store = retriever.get_vector_store()
+    locks = _instrument({
+        "vector_store": store,
+        "bm25": store._bm25,
+        "metadata": store._metadata,
+        "checkpointer": rag.memory,
+        "answer_cache": rag.answer_cache,
+        "manifest": retriever.get_manifest(),
+        "sqlite_cache": byte_store,
+        "query_cache": embeddings.query_cache,
+    })
+
+    turns, ttfts, uploads = [], [], []
+    injected, failures = [], []
+    record = threading.Lock()
+    start_line = threading.Barrier(args.sessions)
+
+    def session(sid: int) -> None:
+        rng = random.Random(sid)
+        names = [f"s{sid}-doc{j}.txt" for j in range(args.uploads)]
+        files = [_Upload(name, _synthetic_text(args.file_kb * 1024, sid * 100 + j)) for j, name in enumerate(names)]
+        thread_id = f"load-{sid}"
+        start_line.wait()
+        try:
+            t0 = time.perf_counter()
+            results = rag.retriever.add_documents_from_uploads(files, owner=thread_id)
+            with record:
+                uploads.append(time.perf_counter() - t0)
+            names = [r.name for r in results if not r.error]
+        except FakeRateLimitError:
+            with record:
+                injected.append("upload")
+            names = []
+        except Exception:
+            with record:
+                failures.append(f"session {sid} upload: {traceback.format_exc(limit=3)}")
+            return
+
+        for q in range(args.questions):
+            question = f"session {sid} question {q}: " + " ".join(
+                rng.choice(["campaign", "budget", "policy", "forecast", "owner"]) for _ in range(5)
+            )
+            filtered = bool(names) and q % 2 == 1
+            config = rag.session_config(
+                thread_id,
+                bypass_answer_cache=True,
+                retrieval_filter={"source": names} if filtered else None,
+            )
+            turn: dict = {}
+            t0 = time.perf_counter()
+            try:
+                for _ in rag.stream_turn({"messages": [HumanMessage(content=question)]}, config, turn):
+                    pass
+            except FakeRateLimitError:
+                with record:
+                    injected.append("turn")
+                continue
+            except Exception:
+                with record:
+                    failures.append(f"session {sid} turn {q}: {traceback.format_exc(limit=3)}")
+                continue
+            seconds = time.perf_counter() - t0
+
+            problems = []
+            asked = [m.content for m in turn["state"]["messages"] if isinstance(m, HumanMessage)]
+            if not asked or asked[-1] != question:
+                problems.append(f"session {sid} turn {q}: state ends with another question {asked[-1:]}")
+            if filtered:
+                leaked = {d.metadata.get("source") for d in turn["state"].get("docs", [])} - set(names)
+                if leaked:
+                    problems.append(f"session {sid} turn {q}: filtered retrieval returned {sorted(leaked)}")
+            with record:
+                turns.append(seconds)
+                ttfts.append(turn["ttft_seconds"])
+                failures.extend(problems)
+            if args.think_time:
+                time.sleep(rng.uniform(0, 2 * args.think_time))
+
+    threads = [threading.Thread(target=session, args=(sid,)) for sid in range(args.sessions)]
+    start = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    wall = time.perf_counter() - start
+
+    expected_chunks = sum(entry["chunks"] for entry in retriever.get_manifest()._read().values())
+    if len(store) != expected_chunks:
+        failures.append(f"store holds {len(store)} chunks, manifest recorded {expected_chunks}")
+
+    def pct(values: list, p: int) -> float:
+        return float(np.percentile(values, p) * 1000) if values else 0.0
+
+    hottest = max(locks, key=lambda lock: lock.wait_seconds)
+    session_seconds = wall * args.sessions
+    return {
+        "sessions": args.sessions,
+        "turns": len(turns),
+        "wall_seconds": wall,
+        "turns_per_s": len(turns) / wall,
+        "turn_p50_ms": pct(turns, 50),
+        "turn_p95_ms": pct(turns, 95),
+        "turn_p99_ms": pct(turns, 99),
+        "ttft_p95_ms": pct(ttfts, 95),
+        "upload_p95_ms": pct(uploads, 95),
+        "injected_errors": len(injected),
+        "embedding_429s": fake.rate_limited,
+        "embedding_retries": scheduled.retries,
+        "failures": failures,
+        "lock_wait_share": sum(lock.wait_seconds for lock in locks) / session_seconds,
+        "hottest_lock": hottest.name,
+        "hottest_lock_wait_s": hottest.wait_seconds,
+        "hottest_lock_max_wait_ms": hottest.max_wait * 1000,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sessions", type=int, nargs="+", default=[1, 4, 16, 32])
+    parser.add_argument("--questions", type=int, default=10, help="questions per session")
+    parser.add_argument("--uploads", type=int, default=2, help="files uploaded per session")
+    parser.add_argument("--file-kb", type=int, default=32)
+    parser.add_argument("--dim", type=int, default=256)
+    parser.add_argument("--embed-latency", type=float, default=0.05, help="seconds per embedding request")
+    parser.add_argument("--chat-latency", type=float, default=0.2, help="seconds to the first token")
+    parser.add_argument("--chat-token-latency", type=float, default=0.002, help="seconds per token")
+    parser.add_argument("--error-rate", type=float, default=0.02, help="share of provider calls answered with 429")
+    parser.add_argument("--think-time", type=float, default=0.0, help="mean pause between questions")
+    parser.add_argument("--contention-threshold", type=float, default=0.05,
+                        help="flag lock waits above this share of session time")
+    parser.add_argument("--output", help="write the per-level results as JSON")
+    parser.add_argument("--level", type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.level is not None:
+        args.sessions = args.level
+        print(json.dumps(_worker(args)))
+        return
+
+    levels = args.sessions
+    passthrough = list(sys.argv[1:])
+    if "--sessions" in passthrough:
+        i = passthrough.index("--sessions")
+        j = i + 1
+        while j < len(passthrough) and not passthrough[j].startswith("--"):
+            j += 1
+        del passthrough[i:j]
+
+    print(
+        f"{'sessions':>8} {'turns':>6} {'turns/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} "
+        f"{'ttft p95':>9} {'429s':>5} {'failures':>8} {'lock wait':>9}  hottest lock"
+    )
+    results, problems = [], []
+    for level in levels:
+        out = subprocess.run(
+            [sys.executable, "-m", "benchmarks.load_test", *passthrough, "--level", str(level)],
+            check=True, capture_output=True, text=True,
+        ).stdout.strip().splitlines()[-1]
+        r = json.loads(out)
+        results.append(r)
+        print(
+            f"{level:>8} {r['turns']:>6} {r['turns_per_s']:>8.2f} {r['turn_p50_ms']:>8.0f} "
+            f"{r['turn_p95_ms']:>8.0f} {r['turn_p99_ms']:>8.0f} {r['ttft_p95_ms']:>9.0f} "
+            f"{r['injected_errors'] + r['embedding_429s']:>5} {len(r['failures']):>8} "
+            f"{r['lock_wait_share']:>9.1%}  {r['hottest_lock']} "
+            f"(max wait {r['hottest_lock_max_wait_ms']:.0f} ms)"
+        )
+        for failure in r["failures"][:5]:
+            problems.append(f"FAILURE at {level} sessions: {failure.strip()}")
+        if r["lock_wait_share"] > args.contention_threshold:
+            problems.append(
+                f"CONTENTION at {level} sessions: {r['lock_wait_share']:.1%} of session time waiting "
+                f"on locks, mostly {r['hottest_lock']} ({r['hottest_lock_wait_s']:.2f}s)"
+            )
+
+    for problem in problems:
+        print(problem)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+    if any(r["failures"] for r in results):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
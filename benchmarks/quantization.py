@@ -0,0 +1,84 @@
+"""Memory, latency and recall of compressed vector search, with and without rescoring.
+
+Compares float16, int8 and truncated-dimension (Matryoshka) copies of a
+synthetic corpus against exact float32 search. The variance of the corpus
+decays across dimensions, as it does in Matryoshka-trained embeddings, so
+prefixes carry most of the signal. Recall on real text-embedding-3 vectors
+should be measured before turning truncation on in production.
+
+  python -m benchmarks.quantization --size 100000 --dim 1024 --prefix-dims 256 512
+"""
+
+import argparse
+import time
+
+import numpy as np
+
+from quantization import QuantizedIndex
+from vector_search import normalize, search
+
+
+def _matryoshka_like(n: int, dim: int, n_topics: int, seed: int = 0) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    decay = (1.0 / np.sqrt(np.arange(1, dim + 1))).astype(np.float32)
+    centres = rng.standard_normal((n_topics, dim), dtype=np.float32) * decay
+    matrix = np.empty((n, dim), dtype=np.float32)
+    for start in range(0, n, 50_000):
+        stop = min(start + 50_000, n)
+        topics = rng.integers(0, n_topics, size=stop - start)
+        noise = rng.standard_normal((stop - start, dim), dtype=np.float32) * decay * 0.3
+        matrix[start:stop] = normalize(centres[topics] + noise)
+    return matrix
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--size", type=int, default=100_000)
+    parser.add_argument("--dim", type=int, default=1024)
+    parser.add_argument("--prefix-dims", type=int, nargs="+", default=[256, 512])
+    parser.add_argument("--k", type=int, default=4)
+    parser.add_argument("--queries", type=int, default=100)
+    parser.add_argument("--rescore-factors", type=int, nargs="+", default=[1, 4, 16])
+    args = parser.parse_args()
+
+    matrix = _matryoshka_like(args.size, args.dim, n_topics=max(10, args.size // 200))
+    rng = np.random.default_rng(1)
+    queries = normalize(
+        matrix[rng.integers(0, args.size, args.queries)]
+        + rng.standard_normal((args.queries, args.dim), dtype=np.float32) * 0.02
+    )
+
+    truth, timings = [], []
+    for q in queries:
+        t0 = time.perf_counter()
+        ids, _ = search(matrix, q, args.k)
+        timings.append((time.perf_counter() - t0) * 1000)
+        truth.append(set(ids.tolist()))
+    mb_per_million = lambda nbytes: nbytes / args.size * 1e6 / 2 ** 20
+    print(f"{args.size} rows x {args.dim} dims; MB/1M = resident bytes per million chunks")
+    print(f"{'setting':>18} {'rescore':>8} {'MB/1M':>8} {'p50 ms':>8} {'recall@k':>9}")
+    print(f"{'float32 exact':>18} {'-':>8} {mb_per_million(matrix.nbytes):>8.0f} "
+          f"{np.percentile(timings, 50):>8.2f} {1.0:>9.3f}")
+
+    settings = [("float16", None), ("int8", None)]
+    settings += [(codec, d) for d in args.prefix_dims for codec in ("float32", "int8")]
+    for codec, dims in settings:
+        index = QuantizedIndex(codec, dims)
+        index.sync(matrix)
+        label = codec + (f"@{dims}" if dims else "")
+        for factor in args.rescore_factors:
+            hits, timings = 0, []
+            for q, expected in zip(queries, truth):
+                t0 = time.perf_counter()
+                ids, _ = index.search(q, args.k, matrix=matrix, rescore_factor=factor)
+                timings.append((time.perf_counter() - t0) * 1000)
+                hits += len(expected & set(ids.tolist()))
+            rescore = "off" if factor <= 1 else f"x{factor}"
+            print(
+                f"{label:>18} {rescore:>8} {mb_per_million(index.nbytes):>8.0f} "
+                f"{np.percentile(timings, 50):>8.2f} {hits / (len(queries) * args.k):>9.3f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
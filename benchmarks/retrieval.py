@@ -0,0 +1,99 @@
+"""Query latency of exact top-k search at 10k / 100k / 1M chunks.
+
+Compares the vectorized engine in ``vector_search`` (one matrix-vector product
+plus a partial sort) with a full sort and, for the smaller sizes, with the
+per-record scoring path of LangChain's InMemoryVectorStore.
+
+  python -m benchmarks.retrieval --sizes 10000 100000 1000000 --dim 256
+
+1M chunks at the production dimension (3072) needs ~12 GB of RAM; the default
+dimension is smaller so the benchmark runs on a laptop.
+"""
+
+import argparse
+import time
+from typing import Callable, List
+
+import numpy as np
+
+from langchain_core.vectorstores import InMemoryVectorStore
+
+from vector_search import normalize, search, top_k
+
+
+def _random_matrix(n: int, dim: int, seed: int = 0) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    matrix = np.empty((n, dim), dtype=np.float32)
+    step = 100_000
+    for start in range(0, n, step):
+        stop = min(start + step, n)
+        matrix[start:stop] = rng.standard_normal((stop - start, dim), dtype=np.float32)
+    return normalize(matrix)
+
+
+def _time_ms(fn: Callable[[np.ndarray], object], queries: np.ndarray) -> List[float]:
+    fn(queries[0])  # warm up caches and BLAS threads
+    timings = []
+    for q in queries:
+        start = time.perf_counter()
+        fn(q)
+        timings.append((time.perf_counter() - start) * 1000)
+    return timings
+
+
+def _full_sort(matrix: np.ndarray, query: np.ndarray, k: int):
+    scores = matrix @ normalize(query)
+    return np.argsort(-scores)[:k]
+
+
+def _in_memory_store(matrix: np.ndarray) -> InMemoryVectorStore:
+    store = InMemoryVectorStore(embedding=None)
+    for i, row in enumerate(matrix):
+        store.store[str(i)] = {"id": str(i), "vector": row.tolist(), "text": "", "metadata": {}}
+    return store
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000, 1_000_000])
+    parser.add_argument("--dim", type=int, default=256)
+    parser.add_argument("--k", type=int, default=4)
+    parser.add_argument("--queries", type=int, default=50)
+    parser.add_argument(
+        "--baseline-max",
+        type=int,
+        default=10_000,
+        help="largest corpus to run through the InMemoryVectorStore baseline",
+    )
+    args = parser.parse_args()
+
+    queries = np.random.default_rng(1).standard_normal((args.queries, args.dim), dtype=np.float32)
+
+    print(f"{'chunks':>10} {'engine':>22} {'p50 ms':>9} {'p95 ms':>9}")
+    for n in args.sizes:
+        matrix = _random_matrix(n, args.dim)
+        engines = {
+            "matvec+argpartition": lambda q: search(matrix, q, args.k),
+            "matvec+argsort": lambda q: _full_sort(matrix, q, args.k),
+        }
+        if n <= args.baseline_max:
+            store = _in_memory_store(matrix)
+            engines["InMemoryVectorStore"] = lambda q: store.similarity_search_by_vector(
+                q.tolist(), k=args.k
+            )
+
+        for name, fn in engines.items():
+            timings = _time_ms(fn, queries)
+            print(
+                f"{n:>10} {name:>22} {np.percentile(timings, 50):>9.2f} "
+                f"{np.percentile(timings, 95):>9.2f}"
+            )
+
+        # Sanity check: both exact engines must agree
+        expected = _full_sort(matrix, queries[0], args.k)
+        assert np.array_equal(top_k(matrix @ normalize(queries[0]), args.k), expected)
+        del matrix
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,239 @@
+"""End-to-end benchmark suite with a stored baseline for catching regressions.
+
+Runs the real ingest and query paths offline: ``load_document`` ->
+``DocumentRetriever.store_documents`` for ``knowledge_base.json`` plus a
+synthetic text corpus, then ``rag.retriever.invoke`` and ``rag.graph.invoke``
+against it. Embeddings and the chat model are local fakes; the chat model
+simulates provider latency. Each scale runs in a fresh subprocess so peak
+RSS is per scale.
+
+  python -m benchmarks.suite                               # 1k and 100k chunks
+  python -m benchmarks.suite --scales 1000 100000 1000000 --output results.json
+  python -m benchmarks.suite --save-baseline               # accept current numbers
+
+Results are printed (and written with ``--output``) as JSON. They are then
+compared with ``benchmarks/baseline.json``: any metric worse than the
+baseline by more than ``--tolerance`` is reported and the exit status is 1.
+Baselines are machine specific; record one on the machine that runs the
+comparison.
+"""
+
+import argparse
+import json
+import logging
+import os
+import platform
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+BASELINE = os.path.join(os.path.dirname(__file__), "baseline.json")
+
+# Metrics where a larger number is better; for every other one smaller is better
+HIGHER_IS_BETTER = {"ingest_docs_per_s", "ingest_chunks_per_s"}
+
+_WORDS = [
+    "campaign", "lead", "MQL", "attribution", "budget", "channel", "policy", "pipeline",
+    "conversion", "segment", "quarter", "forecast", "owner", "review", "transformer",
+    "attention", "embedding", "retrieval", "governance", "approval", "workflow", "audit",
+]
+
+
+def _synthetic_text(n_bytes: int, rng: random.Random, vocabulary: list) -> str:
+    out, size = [], 0
+    while size < n_bytes:
+        sentence = " ".join(rng.choice(vocabulary) for _ in range(rng.randint(8, 20))) + ".\n"
+        out.append(sentence)
+        size += len(sentence)
+    return "".join(out)
+
+
+def _percentiles(seconds: list, prefix: str) -> dict:
+    ms = np.asarray(seconds) * 1000
+    return {f"{prefix}_p{p}_ms": float(np.percentile(ms, p)) for p in (50, 95, 99)}
+
+
+def _worker(args: argparse.Namespace) -> dict:
+    os.environ.setdefault("OPENAI_API_KEY", "benchmark")
+    os.environ.setdefault("GROQ_API_KEY", "benchmark")
+    os.environ["VECTOR_STORE_DIR"] = tempfile.mkdtemp(prefix="suite-bench-")
+
+    from langchain_core.messages import HumanMessage
+
+    import llms
+    import rag
+    import retriever
+    from benchmarks.fakes import FakeChatModel, FakeEmbeddings
+    from document_loader import load_document, load_knowledge_base
+
+    # load_document logs every parsed document at INFO level
+    logging.disable(logging.INFO)
+    embeddings = FakeEmbeddings(size=args.dim)
+    llms.get_embeddings.set(embeddings)
+    llms.get_chat_model.set(FakeChatModel(
+        messages=iter(lambda: "Based on the context, " + "the policy applies " * 40, None),
+        latency=args.chat_latency,
+        token_latency=args.chat_token_latency,
+    ))
+    rng = random.Random(args.seed)
+    vocabulary = _WORDS + [f"term{i}" for i in range(5000)]
+    store = rag.retriever
+    data_dir = tempfile.mkdtemp(prefix="suite-docs-")
+
+    # Parsers are imported on first use; that one-off cost belongs to benchmarks.import_time
+    warm_up = os.path.join(data_dir, "warm_up.txt")
+    with open(warm_up, "w", encoding="utf-8") as f:
+        f.write("warm up")
+    load_document(warm_up)
+    os.remove(warm_up)
+
+    start = time.perf_counter()
+    knowledge_base = load_knowledge_base(args.knowledge_base)
+    chunks = store.store_documents(knowledge_base)
+    n_docs, n_files = len(knowledge_base), 1
+    while chunks < args.scale:
+        path = os.path.join(data_dir, f"doc{n_files}.txt")
+        # The last file is cut short so the corpus lands close to the target size
+        remaining = (args.scale - chunks) * (store.chunk_size - store.chunk_overlap)
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(_synthetic_text(min(args.file_kb * 1024, remaining), rng, vocabulary))
+        docs = load_document(path)
+        chunks += store.store_documents(docs, {"source": os.path.basename(path)})
+        n_docs += len(docs)
+        n_files += 1
+        os.remove(path)
+    ingest_s = time.perf_counter() - start
+
+    topics = [doc.page_content[:80] for doc in knowledge_base]
+    questions = [
+        rng.choice(topics) if i % 4 == 0 else " ".join(rng.choice(vocabulary) for _ in range(8)) + "?"
+        for i in range(args.queries)
+    ]
+    store.invoke(questions[0])  # first query builds lazy state; keep it out of the timings
+    retrieval = []
+    for question in questions:
+        t0 = time.perf_counter()
+        store.invoke(question)
+        retrieval.append(time.perf_counter() - t0)
+
+    turns = []
+    for i, question in enumerate(questions[:args.turns]):
+        config = rag.session_config(f"suite-{i % 4}", bypass_answer_cache=True)
+        t0 = time.perf_counter()
+        rag.graph.invoke({"messages": [HumanMessage(content=question)]}, config=config)
+        turns.append(time.perf_counter() - t0)
+
+    return {
+        "chunks": len(retriever.get_vector_store()),
+        "files": n_files,
+        "ingest_seconds": ingest_s,
+        "ingest_docs_per_s": n_docs / ingest_s,
+        "ingest_chunks_per_s": chunks / ingest_s,
+        **_percentiles(retrieval, "retrieval"),
+        **_percentiles(turns, "turn"),
+        "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    }
+
+
+def compare(results: dict, baseline: dict, tolerance: float, min_delta_ms: float = 1.0) -> list:
+    """Return (scale, metric, baseline, current, change) for every regression.
+
+    Latencies must also be ``min_delta_ms`` slower in absolute terms, so
+    sub-millisecond timer noise on small corpora is not flagged.
+    """
+    regressions = []
+    for scale, metrics in results["scales"].items():
+        for metric, expected in baseline.get("scales", {}).get(scale, {}).items():
+            current = metrics.get(metric)
+            if current is None or metric in ("chunks", "files") or not expected:
+                continue
+            change = (current - expected) / expected
+            worse = -change if metric in HIGHER_IS_BETTER else change
+            if metric.endswith("_ms") and current - expected < min_delta_ms:
+                continue
+            if worse > tolerance:
+                regressions.append((scale, metric, expected, current, change))
+    return regressions
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scales", type=int, nargs="+", default=[1_000, 100_000], help="target chunk counts")
+    parser.add_argument("--dim", type=int, default=256)
+    parser.add_argument("--file-kb", type=int, default=256, help="size of each synthetic document")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--turns", type=int, default=30)
+    parser.add_argument("--chat-latency", type=float, default=0.1, help="seconds to the first token")
+    parser.add_argument("--chat-token-latency", type=float, default=0.001, help="seconds per token")
+    parser.add_argument("--knowledge-base", default="knowledge_base.json")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="also write the results JSON to this file")
+    parser.add_argument("--baseline", default=BASELINE)
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed relative slowdown")
+    parser.add_argument("--min-delta-ms", type=float, default=1.0, help="ignore smaller latency changes")
+    parser.add_argument("--save-baseline", action="store_true", help="write the results as the new baseline")
+    parser.add_argument("--scale", type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.scale is not None:
+        print(json.dumps(_worker(args)))
+        return
+
+    ignored = ("output", "baseline", "tolerance", "min_delta_ms", "save_baseline", "scale")
+    settings = {k: v for k, v in vars(args).items() if k not in ignored}
+    results = {
+        "environment": {
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "machine": platform.machine(),
+            "cpus": os.cpu_count(),
+        },
+        "settings": settings,
+        "scales": {},
+    }
+    passthrough = [a for a in sys.argv[1:] if a != "--save-baseline"]
+    for scale in args.scales:
+        out = subprocess.run(
+            [sys.executable, "-m", "benchmarks.suite", *passthrough, "--scale", str(scale)],
+            check=True, capture_output=True, text=True,
+        ).stdout.strip().splitlines()[-1]
+        results["scales"][str(scale)] = json.loads(out)
+        print(f"scale {scale}: done", file=sys.stderr)
+
+    text = json.dumps(results, indent=2)
+    print(text)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    if args.save_baseline:
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+        print(f"Baseline written to {args.baseline}", file=sys.stderr)
+        return
+
+    try:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+    except FileNotFoundError:
+        print(f"No baseline at {args.baseline}; run with --save-baseline to record one", file=sys.stderr)
+        return
+    if baseline.get("settings") != settings:
+        print("Warning: baseline was recorded with different settings", file=sys.stderr)
+    regressions = compare(results, baseline, args.tolerance, args.min_delta_ms)
+    for scale, metric, expected, current, change in regressions:
+        print(
+            f"REGRESSION scale={scale} {metric}: {expected:.3f} -> {current:.3f} ({change:+.0%})",
+            file=sys.stderr,
+        )
+    if regressions:
+        sys.exit(1)
+    print(f"No regressions beyond {args.tolerance:.0%} against {args.baseline}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,187 @@
+"""In-memory LangGraph checkpointer with bounded memory.
+
+``MemorySaver`` keeps every checkpoint of every thread forever. On a
+long-running Streamlit server that is one thread per browser session, each
+holding a full copy of the message list for every step of every turn.
+``BoundedMemorySaver`` keeps only the newest checkpoints of each thread and
+drops whole threads once they sit idle past a TTL, or least recently used
+first once there are too many threads or they use too many bytes.
+"""
+
+import logging
+import threading
+import time
+from collections import OrderedDict, defaultdict
+from typing import Any, Dict, Optional, Set, Tuple
+
+from langchain_core.runnables import RunnableConfig
+from langgraph.checkpoint.memory import MemorySaver
+
+
+def _typed_size(value: Tuple[str, bytes]) -> int:
+    return len(value[0]) + len(value[1])
+
+
+class BoundedMemorySaver(MemorySaver):
+    """MemorySaver that evicts idle threads (TTL, then LRU) and caps total bytes.
+
+    Sizes are the serialized checkpoint, blob and pending-write bytes, which
+    is what the saver actually holds. The thread being written is never
+    evicted mid-turn, so a single oversized thread can still exceed
+    ``max_bytes`` until it goes idle.
+    """
+
+    def __init__(
+        self,
+        max_threads: int = 1000,
+        ttl_seconds: float = 2 * 3600,
+        max_bytes: int = 256 * 1024 ** 2,
+        max_checkpoints_per_thread: int = 10,
+        **kwargs: Any,
+    ) -> None:
+        super().__init__(**kwargs)
+        self.max_threads = max_threads
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = max_bytes
+        self.max_checkpoints_per_thread = max_checkpoints_per_thread
+        self.evictions = 0
+        self._lock = threading.RLock()
+        # thread_id -> last access time, least recently used first
+        self._last_used: "OrderedDict[str, float]" = OrderedDict()
+        self._bytes: Dict[str, int] = defaultdict(int)
+        # (thread_id, ns) -> checkpoint_id -> channel versions it reads
+        self._versions: Dict[Tuple[str, str], Dict[str, dict]] = defaultdict(dict)
+        # (thread_id, ns) -> blob keys stored for it
+        self._blob_keys: Dict[Tuple[str, str], Set[tuple]] = defaultdict(set)
+
+    def _touch(self, thread_id: str) -> None:
+        self._last_used[thread_id] = time.time()
+        self._last_used.move_to_end(thread_id)
+
+    def get_tuple(self, config: RunnableConfig):
+        thread_id = config["configurable"]["thread_id"]
+        with self._lock:
+            if thread_id in self._last_used:
+                self._touch(thread_id)
+            return super().get_tuple(config)
+
+    def put(
+        self,
+        config: RunnableConfig,
+        checkpoint: dict,
+        metadata: dict,
+        new_versions: dict,
+    ) -> RunnableConfig:
+        thread_id = config["configurable"]["thread_id"]
+        ns = config["configurable"]["checkpoint_ns"]
+        blob_keys = [(thread_id, ns, channel, version) for channel, version in new_versions.items()]
+        with self._lock:
+            before = sum(_typed_size(self.blobs[key]) for key in blob_keys if key in self.blobs)
+            result = super().put(config, checkpoint, metadata, new_versions)
+            saved = self.storage[thread_id][ns][checkpoint["id"]]
+            after = sum(_typed_size(self.blobs[key]) for key in blob_keys)
+            self._bytes[thread_id] += after - before + _typed_size(saved[0]) + _typed_size(saved[1])
+            self._blob_keys[(thread_id, ns)].update(blob_keys)
+            self._versions[(thread_id, ns)][checkpoint["id"]] = dict(checkpoint["channel_versions"])
+            self._touch(thread_id)
+            self._prune(thread_id, ns)
+            self._evict(keep=thread_id)
+            return result
+
+    def put_writes(self, config: RunnableConfig, writes: Any, task_id: str, *args: Any, **kwargs: Any) -> None:
+        thread_id = config["configurable"]["thread_id"]
+        key = (
+            thread_id,
+            config["configurable"].get("checkpoint_ns", ""),
+            config["configurable"]["checkpoint_id"],
+        )
+        with self._lock:
+            before = self._writes_size(key)
+            super().put_writes(config, writes, task_id, *args, **kwargs)
+            self._bytes[thread_id] += self._writes_size(key) - before
+            self._touch(thread_id)
+
+    def _writes_size(self, key: tuple) -> int:
+        writes = self.writes.get(key) or {}
+        return sum(_typed_size(w[2]) for w in writes.values())
+
+    def _prune(self, thread_id: str, ns: str) -> None:
+        """Drop all but the newest checkpoints of a thread, with their writes and unused blobs."""
+        checkpoints = self.storage[thread_id][ns]
+        excess = len(checkpoints) - self.max_checkpoints_per_thread
+        if excess <= 0:
+            return
+        versions = self._versions[(thread_id, ns)]
+        freed = 0
+        # Checkpoint ids sort in creation order
+        for checkpoint_id in sorted(checkpoints)[:excess]:
+            saved = checkpoints.pop(checkpoint_id)
+            freed += _typed_size(saved[0]) + _typed_size(saved[1])
+            freed += self._writes_size((thread_id, ns, checkpoint_id))
+            self.writes.pop((thread_id, ns, checkpoint_id), None)
+            versions.pop(checkpoint_id, None)
+
+        live = {
+            (thread_id, ns, channel, version)
+            for channel_versions in versions.values()
+            for channel, version in channel_versions.items()
+        }
+        blob_keys = self._blob_keys[(thread_id, ns)]
+        for key in blob_keys - live:
+            value = self.blobs.pop(key, None)
+            if value is not None:
+                freed += _typed_size(value)
+        blob_keys &= live
+        self._bytes[thread_id] -= freed
+
+    def _evict(self, keep: Optional[str] = None) -> None:
+        """Drop idle threads, then least recently used ones while over a limit."""
+        cutoff = time.time() - self.ttl_seconds
+        while True:
+            candidates = [t for t in self._last_used if t != keep]
+            if not candidates:
+                return
+            oldest = candidates[0]
+            if not (
+                self._last_used[oldest] < cutoff
+                or len(self._last_used) > self.max_threads
+                or self.total_bytes() > self.max_bytes
+            ):
+                return
+            self.delete_thread(oldest)
+            self.evictions += 1
+            logging.info("Evicted checkpoints of idle thread %s", oldest)
+
+    def evict_idle(self) -> None:
+        """Apply the TTL and limits without waiting for the next write."""
+        with self._lock:
+            self._evict()
+
+    def delete_thread(self, thread_id: str) -> None:
+        """Release every checkpoint, write and blob of a thread."""
+        with self._lock:
+            self.storage.pop(thread_id, None)
+            for key in [k for k in self.writes if k[0] == thread_id]:
+                del self.writes[key]
+            for key in [k for k in self._versions if k[0] == thread_id]:
+                del self._versions[key]
+            for key in [k for k in self._blob_keys if k[0] == thread_id]:
+                for blob_key in self._blob_keys.pop(key):
+                    self.blobs.pop(blob_key, None)
+            self._last_used.pop(thread_id, None)
+            self._bytes.pop(thread_id, None)
+
+    async def adelete_thread(self, thread_id: str) -> None:
+        self.delete_thread(thread_id)
+
+    def total_bytes(self) -> int:
+        return sum(self._bytes.values())
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "threads": len(self._last_used),
+                "bytes": self.total_bytes(),
+                "max_bytes": self.max_bytes,
+                "evictions": self.evictions,
+            }
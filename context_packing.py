@@ -0,0 +1,90 @@
+"""Token-budgeted packing of retrieved chunks into the prompt context.
+
+Chunks are split with ``chunk_overlap``, so neighbouring chunks of the same
+page repeat part of each other's text. ``pack_context`` merges chunks of
+the same file (``ingest_key``) and page that overlap or touch (using the
+``start_index`` recorded at split time), drops exact duplicates, and then
+adds the merged spans in relevance order until the token budget is spent.
+"""
+
+from typing import Dict, List, Tuple
+
+from langchain_core.documents import Document
+
+from embedding_scheduler import estimate_tokens
+
+# A span that overflows the budget is cut down only if this much of it fits
+MIN_TRUNCATED_TOKENS = 64
+
+
+class _Span(object):
+    def __init__(self, rank: int, doc: Document):
+        self.rank = rank
+        self.text = doc.page_content
+        self.start = doc.metadata.get("start_index")
+        self.end = None if self.start is None else self.start + len(self.text)
+
+    def absorb(self, other: "_Span") -> bool:
+        """Merge a later-starting chunk of the same file and page if it overlaps or touches this one."""
+        if self.end is None or other.start is None or other.start > self.end:
+            return False
+        if other.end > self.end:
+            self.text += other.text[self.end - other.start:]
+            self.end = other.end
+        self.rank = min(self.rank, other.rank)
+        return True
+
+
+def _merge(docs: List[Document]) -> List[_Span]:
+    groups: Dict[tuple, List[_Span]] = {}
+    seen = set()
+    for rank, doc in enumerate(docs):
+        # ingest_key tells apart different files uploaded under the same name
+        group = (doc.metadata.get("ingest_key"), doc.metadata.get("source"), doc.metadata.get("page"))
+        if (group, doc.page_content) in seen:
+            continue
+        seen.add((group, doc.page_content))
+        groups.setdefault(group, []).append(_Span(rank, doc))
+
+    merged: List[_Span] = []
+    for spans in groups.values():
+        located = sorted((s for s in spans if s.start is not None), key=lambda s: s.start)
+        current = None
+        for span in located:
+            if current is None or not current.absorb(span):
+                current = span
+                merged.append(current)
+        # Chunks indexed before start_index was recorded cannot be merged
+        merged.extend(s for s in spans if s.start is None)
+    return sorted(merged, key=lambda s: s.rank)
+
+
+def pack_context(docs: List[Document], max_tokens: int) -> Tuple[str, dict]:
+    """Build the context string for ``docs`` (most relevant first) within ``max_tokens``.
+
+    Returns the context and a stats dict: chunk and span counts, the tokens
+    a plain join would have used, the tokens actually packed, and the
+    difference.
+    """
+    raw_tokens = sum(estimate_tokens(d.page_content) for d in docs)
+    packed: List[str] = []
+    used = 0
+    for span in _merge(docs):
+        tokens = estimate_tokens(span.text)
+        remaining = max_tokens - used
+        if tokens > remaining:
+            if packed or remaining < MIN_TRUNCATED_TOKENS:
+                continue
+            span.text = span.text[:(remaining - 1) * 4]
+            tokens = estimate_tokens(span.text)
+        packed.append(span.text)
+        used += tokens
+
+    stats = {
+        "chunks": len(docs),
+        "spans": len(packed),
+        "raw_tokens": raw_tokens,
+        "packed_tokens": used,
+        "saved_tokens": raw_tokens - used,
+    }
+    return "\n\n".join(packed), stats
@@ -1,27 +1,195 @@
 """Utility functions for document loading."""
 
+import hashlib
+import json
 import logging
+import multiprocessing
 import os
 import pathlib
 import tempfile
-from typing import Any
-
-from langchain_community.document_loaders.epub import UnstructuredEPubLoader
-from langchain_community.document_loaders.pdf import PyPDFLoader
-from langchain_community.document_loaders.text import TextLoader
-from langchain_community.document_loaders.word_document import (
-    UnstructuredWordDocumentLoader
-)
+import time
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from contextlib import nullcontext
+from itertools import islice
+from typing import Any, Iterator, NamedTuple, Optional
+
 from langchain_core.documents import Document
 from streamlit.logger import get_logger
 
+from embedding_cache import SQLiteByteStore
+
 logging.basicConfig(encoding="utf-8", level=logging.INFO)
 LOGGER = get_logger(__name__)
 
 
-class EpubReader(UnstructuredEPubLoader):
-    def __init__(self, file_path: str | list[str], **unstructured_kwargs: Any):
-        super().__init__(file_path, **unstructured_kwargs, mode="elements", strategy="fast")
+# Parsers (pypdf, unstructured, the langchain_community loaders) are imported
+# when a file of their type is first loaded, not when this module is imported
+
+
+def _text_loader(file_path: str) -> Any:
+    from langchain_community.document_loaders.text import TextLoader
+
+    return TextLoader(file_path)
+
+
+def _epub_loader(file_path: str) -> Any:
+    from langchain_community.document_loaders.epub import UnstructuredEPubLoader
+
+    return UnstructuredEPubLoader(file_path, mode="elements", strategy="fast")
+
+
+def _word_loader(file_path: str) -> Any:
+    from langchain_community.document_loaders.word_document import (
+        UnstructuredWordDocumentLoader
+    )
+
+    return UnstructuredWordDocumentLoader(file_path)
+
+
+# Page entries text extraction depends on; /Parent, /Annots etc. would pull in other pages
+_PAGE_KEYS = ("/Contents", "/Resources", "/Rotate", "/MediaBox", "/CropBox")
+
+
+def _feed(digest: Any, obj: Any, memo: dict) -> None:
+    """Hash a PDF object and everything it references, each indirect object once per file."""
+    from pypdf.generic import ArrayObject, DictionaryObject, IndirectObject, StreamObject
+
+    if isinstance(obj, IndirectObject):
+        ref = (obj.idnum, obj.generation)
+        if ref not in memo:
+            memo[ref] = b"cycle"
+            sub = hashlib.sha256()
+            _feed(sub, obj.get_object(), memo)
+            memo[ref] = sub.digest()
+        digest.update(b"R" + memo[ref])
+    elif isinstance(obj, DictionaryObject):
+        digest.update(b"<<%d" % len(obj))
+        for key in sorted(obj):
+            if key != "/Parent":
+                digest.update(key.encode("utf-8", "surrogatepass"))
+                _feed(digest, obj.raw_get(key), memo)
+        if isinstance(obj, StreamObject):
+            # Still-encoded bytes: hashing them needs no decompression
+            data = obj._data if isinstance(obj._data, bytes) else obj._data.encode("latin-1")
+            digest.update(b"stream%d:" % len(data) + data)
+    elif isinstance(obj, ArrayObject):
+        digest.update(b"[%d" % len(obj))
+        for item in obj:
+            _feed(digest, item, memo)
+    else:
+        value = repr(obj).encode("utf-8", "surrogatepass")
+        digest.update(b"%s%d:" % (type(obj).__name__.encode(), len(value)) + value)
+
+
+def _page_key(page: Any, memo: dict) -> Optional[str]:
+    """Digest of one page's content streams and the resources (fonts, images, forms) they use.
+
+    Pages an edit elsewhere in the file leaves alone keep their key. None if
+    the page cannot be hashed; its text is then extracted and not cached.
+    """
+    import pypdf
+
+    digest = hashlib.sha256(pypdf.__version__.encode())
+    try:
+        for key in _PAGE_KEYS:
+            digest.update(key.encode())
+            if key in page:
+                _feed(digest, page.raw_get(key), memo)
+    except Exception as e:
+        LOGGER.warning("Not caching the text of a page that could not be hashed: %s", e)
+        return None
+    return "page:" + digest.hexdigest()
+
+
+def _extract_pages(file_path: str, page_numbers: list[int]) -> list[str]:
+    """Extract the text of the given pages (runs in a worker process)."""
+    import pypdf
+
+    reader = pypdf.PdfReader(file_path)
+    return [reader.pages[i].extract_text(extraction_mode="plain") for i in page_numbers]
+
+
+class ParallelPdfReader(object):
+    """PDF loader that extracts page ranges in parallel and caches page text.
+
+    Output matches PyPDFLoader (one Document per page, ``source``/``page``
+    metadata). Page text is cached by a digest of the page's own content
+    streams and resources, so re-ingesting a revised manual only extracts
+    the pages that changed.
+    """
+
+    page_cache_path = "./cache/pdf_pages.sqlite"
+    pages_per_task = 25
+    # Below this size a process pool costs more than it saves
+    min_pages_parallel = 50
+
+    def __init__(self, file_path: str, max_workers: Optional[int] = None):
+        self.file_path = file_path
+        self.max_workers = max_workers
+
+    def _workers(self, n_pages: int) -> int:
+        # Already inside a pool worker (several files parsed at once): stay serial
+        if multiprocessing.parent_process() is not None or n_pages < self.min_pages_parallel:
+            return 1
+        return min(self.max_workers or os.cpu_count() or 1, -(-n_pages // self.pages_per_task))
+
+    def lazy_load(self) -> Iterator[Document]:
+        """Yield pages in order, extracting one window of page ranges at a time.
+
+        Only one window (workers x pages_per_task pages) of text is held in
+        memory, so a 2000-page manual streams through with bounded memory.
+        """
+        import pypdf
+
+        reader = pypdf.PdfReader(self.file_path)
+        n_pages = len(reader.pages)
+        workers = self._workers(n_pages)
+        window = workers * self.pages_per_task
+        cache = SQLiteByteStore(self.page_cache_path)
+        memo: dict = {}  # digests of objects shared between pages (fonts, images)
+        extracted = 0
+
+        with ProcessPoolExecutor(max_workers=workers) if workers > 1 else nullcontext() as pool:
+            for start in range(0, n_pages, window):
+                page_numbers = range(start, min(start + window, n_pages))
+                keys = [_page_key(reader.pages[i], memo) for i in page_numbers]
+                hashed = [key for key in keys if key is not None]
+                cached = dict(zip(hashed, cache.mget(hashed)))
+                values = [cached.get(key) for key in keys]
+                missing = [i for i, value in zip(page_numbers, values) if value is None]
+
+                if missing:
+                    ranges = [
+                        missing[i:i + self.pages_per_task]
+                        for i in range(0, len(missing), self.pages_per_task)
+                    ]
+                    if pool is None:
+                        parts = [_extract_pages(self.file_path, r) for r in ranges]
+                    else:
+                        parts = pool.map(_extract_pages, [self.file_path] * len(ranges), ranges)
+                    texts = dict(zip(missing, (text for part in parts for text in part)))
+                    cache.mset([
+                        (keys[i - start], texts[i].encode("utf-8"))
+                        for i in missing if keys[i - start] is not None
+                    ])
+                    extracted += len(missing)
+
+                for page_number, value in zip(page_numbers, values):
+                    text = value.decode("utf-8") if value is not None else texts[page_number]
+                    yield Document(
+                        page_content=text,
+                        metadata={"source": self.file_path, "page": page_number},
+                    )
+
+        LOGGER.info(
+            "Extracted %d of %d pages from %s (%d from cache)",
+            extracted, n_pages, self.file_path, n_pages - extracted,
+        )
+
+    def load(self) -> list[Document]:
+        return list(self.lazy_load())
 
 
 class DocumentLoaderException(Exception):
@@ -31,28 +199,176 @@ class DocumentLoaderException(Exception):
 class DocumentLoader(object):
     """Loads in a document with a supported extension."""
 
+    # Extension -> callable that builds a loader for a file path
     supported_extensions = {
-        ".pdf": PyPDFLoader,
-        ".txt": TextLoader,
-        ".epub": EpubReader,
-        ".docx": UnstructuredWordDocumentLoader,
-        ".doc": UnstructuredWordDocumentLoader,
+        ".pdf": ParallelPdfReader,
+        ".txt": _text_loader,
+        ".epub": _epub_loader,
+        ".docx": _word_loader,
+        ".doc": _word_loader,
     }
 
 
-def load_document(temp_filepath: str) -> list[Document]:
-    """Load a file and return it as a list of documents.
-
-    Doesn't handle a lot of errors at the moment.
-    """
+def _get_loader(temp_filepath: str) -> Any:
     ext = pathlib.Path(temp_filepath).suffix
     loader = DocumentLoader.supported_extensions.get(ext)
     if not loader:
         raise DocumentLoaderException(
             f"Invalid extension type {ext}, cannot load this type of file"
         )
+    return loader(temp_filepath)
 
-    loaded = loader(temp_filepath)
-    docs = loaded.load()
+
+def load_document(temp_filepath: str) -> list[Document]:
+    """Load a file and return it as a list of documents.
+
+    Doesn't handle a lot of errors at the moment.
+    """
+    docs = _get_loader(temp_filepath).load()
     logging.info(docs)
     return docs
+
+
+def load_knowledge_base(path: str = "knowledge_base.json") -> list[Document]:
+    """Load a JSON list of {"content", "metadata"} records (source, page, topic)."""
+    with open(path, encoding="utf-8") as f:
+        records = json.load(f)
+    return [Document(page_content=r["content"], metadata=r.get("metadata", {})) for r in records]
+
+
+def lazy_load_document(temp_filepath: str) -> Iterator[Document]:
+    """Load a file one document (page / element) at a time."""
+    yield from _get_loader(temp_filepath).lazy_load()
+
+
+class ParseResult(NamedTuple):
+    """Outcome of parsing one file."""
+
+    name: str
+    docs: list[Document]
+    seconds: float
+    error: Optional[str] = None
+    sections: int = 0
+
+
+class DocumentStream(object):
+    """Lazily iterates over one file's documents while timing the parser.
+
+    A parse error ends the stream instead of raising; ``result()`` reports it
+    together with the time spent inside the parser.
+    """
+
+    def __init__(self, temp_filepath: str, name: str):
+        self.temp_filepath = temp_filepath
+        self.name = name
+        self.seconds = 0.0
+        self.sections = 0
+        self.error: Optional[str] = None
+
+    def __iter__(self) -> Iterator[Document]:
+        docs = None
+        while True:
+            start = time.perf_counter()
+            try:
+                if docs is None:
+                    docs = lazy_load_document(self.temp_filepath)
+                doc = next(docs)
+            except StopIteration:
+                break
+            except Exception as e:
+                self.error = f"{type(e).__name__}: {e}"
+                break
+            finally:
+                self.seconds += time.perf_counter() - start
+            self.sections += 1
+            yield doc
+        LOGGER.info("Parsed %s in %.2fs (%d docs)", self.name, self.seconds, self.sections)
+
+    def result(self) -> ParseResult:
+        return ParseResult(self.name, [], self.seconds, self.error, self.sections)
+
+
+def _parse_file(temp_filepath: str, name: str) -> ParseResult:
+    """Parse one file, turning failures into a ParseResult instead of raising."""
+    start = time.perf_counter()
+    try:
+        docs = load_document(temp_filepath)
+        error = None
+    except Exception as e:
+        docs, error = [], f"{type(e).__name__}: {e}"
+    seconds = time.perf_counter() - start
+    LOGGER.info("Parsed %s in %.2fs (%d docs)", name, seconds, len(docs))
+    return ParseResult(name, docs, seconds, error, len(docs))
+
+
+def _submit(pool: ProcessPoolExecutor, path: str, name: str) -> Future:
+    """Submit a parse; a pool that is already broken yields a failed future instead of raising."""
+    try:
+        return pool.submit(_parse_file, path, name)
+    except BrokenProcessPool as e:
+        future: Future = Future()
+        future.set_exception(e)
+        return future
+
+
+def _parse_file_isolated(path: str, name: str) -> ParseResult:
+    """Parse one file in a process of its own, so a worker crash is pinned on this file."""
+    with ProcessPoolExecutor(max_workers=1) as pool:
+        try:
+            return pool.submit(_parse_file, path, name).result()
+        except BrokenProcessPool as e:
+            return ParseResult(name, [], 0.0, f"{type(e).__name__}: the parser process died")
+
+
+def _succeeded(future: Future) -> bool:
+    return future.done() and not future.cancelled() and future.exception() is None
+
+
+def iter_documents_parallel(
+    temp_filepaths: list[str],
+    names: Optional[list[str]] = None,
+    max_workers: Optional[int] = None,
+) -> Iterator[ParseResult]:
+    """Parse several files across a process pool.
+
+    The PDF/DOCX/EPUB parsers are CPU-bound and hold the GIL, so threads do not
+    help. Results are yielded in input order. At most two files per worker are
+    in flight, so parsing never runs far ahead of a slower consumer.
+
+    A parse error only affects its own file. A worker process that dies (a
+    parser crash, ``os._exit``, the OOM killer) breaks the whole pool: the file
+    being waited on is then re-parsed alone to see whether it was the cause,
+    and the unfinished files are resubmitted to a fresh pool.
+    """
+    names = names or list(temp_filepaths)
+    workers = min(max_workers or os.cpu_count() or 1, len(temp_filepaths))
+    if workers <= 1:
+        for path, name in zip(temp_filepaths, names):
+            yield _parse_file(path, name)
+        return
+
+    jobs = iter(zip(temp_filepaths, names))
+    pool = ProcessPoolExecutor(max_workers=workers)
+    try:
+        in_flight = deque(
+            (_submit(pool, path, name), path, name) for path, name in islice(jobs, 2 * workers)
+        )
+        while in_flight:
+            future, path, name = in_flight.popleft()
+            try:
+                result = future.result()
+            except BrokenProcessPool:
+                LOGGER.warning("A parser process died while %s was in flight; retrying it alone", name)
+                pool.shutdown(wait=False, cancel_futures=True)
+                result = _parse_file_isolated(path, name)
+                pool = ProcessPoolExecutor(max_workers=workers)
+                in_flight = deque(
+                    (f if _succeeded(f) else _submit(pool, p, n), p, n) for f, p, n in in_flight
+                )
+            except Exception as e:
+                result = ParseResult(name, [], 0.0, f"{type(e).__name__}: {e}")
+            for next_path, next_name in islice(jobs, 1):
+                in_flight.append((_submit(pool, next_path, next_name), next_path, next_name))
+            yield result
+    finally:
+        pool.shutdown(cancel_futures=True)
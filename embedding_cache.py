@@ -0,0 +1,296 @@
+"""Caches for embeddings: a single-file document cache and a query cache.
+
+``SQLiteByteStore`` replaces ``LocalFileStore("./cache/")``, which wrote one
+file per chunk embedding and grew without limit. Everything lives in one
+SQLite database (WAL mode, so several processes can share it). Entries are
+evicted least-recently-used once the total value size passes a byte budget.
+Embeddings are stored as raw float32 bytes instead of JSON text.
+"""
+
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from langchain_core.embeddings import Embeddings
+from langchain_core.stores import BaseStore
+
+# SQLite's default limit on bound parameters per statement is 999
+_CHUNK = 500
+
+
+def encode_vector(vector: List[float]) -> bytes:
+    return np.asarray(vector, dtype=np.float32).tobytes()
+
+
+def decode_vector(data: bytes) -> List[float]:
+    return np.frombuffer(data, dtype=np.float32).tolist()
+
+
+def text_key(namespace: str, text: str) -> str:
+    """Cache key for a text under a namespace (usually the embedding model name)."""
+    return f"{namespace}:{hashlib.sha256(text.encode('utf-8')).hexdigest()}"
+
+
+class SQLiteByteStore(BaseStore[str, bytes]):
+    """Byte store in one SQLite file with an LRU byte budget and hit/miss/eviction counters."""
+
+    def __init__(self, path: str, max_bytes: int = 2 * 1024 ** 3) -> None:
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.path = path
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS cache ("
+            " key TEXT PRIMARY KEY, value BLOB NOT NULL,"
+            " size INTEGER NOT NULL, atime REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS cache_atime ON cache (atime)")
+        self._conn.commit()
+        self._bytes = self._total_bytes()
+
+    def _total_bytes(self) -> int:
+        return int(self._conn.execute("SELECT total(size) FROM cache").fetchone()[0])
+
+    def mget(self, keys: Sequence[str]) -> List[Optional[bytes]]:
+        found = {}
+        now = time.time()
+        with self._lock:
+            for start in range(0, len(keys), _CHUNK):
+                chunk = list(keys[start:start + _CHUNK])
+                marks = ",".join("?" * len(chunk))
+                rows = self._conn.execute(
+                    f"SELECT key, value FROM cache WHERE key IN ({marks})", chunk
+                ).fetchall()
+                found.update(rows)
+                if rows:
+                    hit_keys = [key for key, _ in rows]
+                    with self._conn:
+                        self._conn.execute(
+                            f"UPDATE cache SET atime = ? WHERE key IN ({','.join('?' * len(hit_keys))})",
+                            [now, *hit_keys],
+                        )
+            values = [found.get(key) for key in keys]
+            hits = sum(value is not None for value in values)
+            self.hits += hits
+            self.misses += len(keys) - hits
+        return values
+
+    def mset(self, key_value_pairs: Sequence[Tuple[str, bytes]]) -> None:
+        if not key_value_pairs:
+            return
+        now = time.time()
+        with self._lock:
+            keys = [key for key, _ in key_value_pairs]
+            replaced = 0
+            for start in range(0, len(keys), _CHUNK):
+                chunk = keys[start:start + _CHUNK]
+                marks = ",".join("?" * len(chunk))
+                replaced += int(self._conn.execute(
+                    f"SELECT total(size) FROM cache WHERE key IN ({marks})", chunk
+                ).fetchone()[0])
+            with self._conn:
+                self._conn.executemany(
+                    "INSERT OR REPLACE INTO cache (key, value, size, atime) VALUES (?, ?, ?, ?)",
+                    [(key, value, len(value), now) for key, value in key_value_pairs],
+                )
+            self._bytes += sum(len(value) for _, value in key_value_pairs) - replaced
+            if self._bytes > self.max_bytes:
+                self._evict()
+
+    def _evict(self) -> None:
+        """Drop least recently used entries until usage is back under 90% of the budget."""
+        # Other processes may have written or evicted since we last looked
+        self._bytes = self._total_bytes()
+        target = int(self.max_bytes * 0.9)
+        while self._bytes > target:
+            rows = self._conn.execute(
+                "SELECT key, size FROM cache ORDER BY atime LIMIT 1000"
+            ).fetchall()
+            if not rows:
+                break
+            doomed, freed = [], 0
+            for key, size in rows:
+                if self._bytes - freed <= target:
+                    break
+                doomed.append(key)
+                freed += size
+            with self._conn:
+                self._conn.executemany("DELETE FROM cache WHERE key = ?", [(key,) for key in doomed])
+            self._bytes -= freed
+            self.evictions += len(doomed)
+
+    def mdelete(self, keys: Sequence[str]) -> None:
+        with self._lock:
+            with self._conn:
+                self._conn.executemany("DELETE FROM cache WHERE key = ?", [(key,) for key in keys])
+            self._bytes = self._total_bytes()
+
+    def yield_keys(self, *, prefix: Optional[str] = None) -> Iterator[str]:
+        with self._lock:
+            if prefix is None:
+                rows = self._conn.execute("SELECT key FROM cache").fetchall()
+            else:
+                rows = self._conn.execute(
+                    "SELECT key FROM cache WHERE substr(key, 1, ?) = ?", (len(prefix), prefix)
+                ).fetchall()
+        for (key,) in rows:
+            yield key
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "evictions": self.evictions,
+            "bytes": self._bytes,
+            "max_bytes": self.max_bytes,
+        }
+
+
+def normalize_query(text: str) -> str:
+    """Collapse whitespace and case so trivially different phrasings share a key."""
+    return " ".join(text.split()).casefold()
+
+
+class QueryEmbeddingCache(object):
+    """LRU + TTL cache for query embeddings, optionally backed by a persistent store.
+
+    Keyed by the normalized query text and the embedding model name. The
+    in-process LRU serves repeats within one worker; the persistent store (if
+    given) shares them across workers and restarts.
+    """
+
+    def __init__(
+        self,
+        model: str,
+        max_entries: int = 10_000,
+        ttl_seconds: float = 24 * 3600,
+        store: Optional[BaseStore[str, bytes]] = None,
+    ) -> None:
+        self.model = model
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.store = store
+        self.hits = 0
+        self.misses = 0
+        self.miss_seconds = 0.0
+        self._lru: "OrderedDict[str, Tuple[float, List[float]]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _key(self, text: str) -> str:
+        return text_key(f"query:{self.model}", normalize_query(text))
+
+    def get(self, text: str) -> Optional[List[float]]:
+        key = self._key(text)
+        now = time.time()
+        with self._lock:
+            entry = self._lru.get(key)
+            if entry is not None and entry[0] > now:
+                self._lru.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            self._lru.pop(key, None)
+
+        if self.store is not None:
+            data = self.store.mget([key])[0]
+            if data is not None:
+                expires_at = float(np.frombuffer(data[:8], dtype=np.float64)[0])
+                if expires_at > now:
+                    vector = decode_vector(data[8:])
+                    self._remember(key, expires_at, vector)
+                    with self._lock:
+                        self.hits += 1
+                    return vector
+
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def put(self, text: str, vector: List[float], seconds: float = 0.0) -> None:
+        """Store a freshly computed embedding; ``seconds`` is what computing it cost."""
+        key = self._key(text)
+        expires_at = time.time() + self.ttl_seconds
+        self._remember(key, expires_at, vector)
+        with self._lock:
+            self.miss_seconds += seconds
+        if self.store is not None:
+            data = np.float64(expires_at).tobytes() + encode_vector(vector)
+            self.store.mset([(key, data)])
+
+    def _remember(self, key: str, expires_at: float, vector: List[float]) -> None:
+        with self._lock:
+            self._lru[key] = (expires_at, vector)
+            self._lru.move_to_end(key)
+            while len(self._lru) > self.max_entries:
+                self._lru.popitem(last=False)
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        avg_miss = self.miss_seconds / self.misses if self.misses else 0.0
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "entries": len(self._lru),
+            "avg_miss_seconds": avg_miss,
+            # Remote round trips avoided, valued at the average miss latency
+            "saved_seconds": self.hits * avg_miss,
+        }
+
+
+class QueryCachedEmbeddings(Embeddings):
+    """Embeddings wrapper that serves ``embed_query`` from a QueryEmbeddingCache."""
+
+    def __init__(self, underlying: Embeddings, query_cache: QueryEmbeddingCache) -> None:
+        self.underlying = underlying
+        self.query_cache = query_cache
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self.underlying.embed_documents(texts)
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        return await self.underlying.aembed_documents(texts)
+
+    def embed_query(self, text: str) -> List[float]:
+        vector = self.query_cache.get(text)
+        if vector is None:
+            start = time.perf_counter()
+            vector = self.underlying.embed_query(text)
+            self.query_cache.put(text, vector, time.perf_counter() - start)
+        return vector
+
+    def embed_queries(self, texts: List[str]) -> List[List[float]]:
+        """Embed many queries; cache misses go to the provider as one batched call."""
+        vectors = [self.query_cache.get(text) for text in texts]
+        missing = list(dict.fromkeys(t for t, vector in zip(texts, vectors) if vector is None))
+        if missing:
+            # OpenAI embeds queries and documents the same way, so the batched
+            # document path (scheduled, cached) serves queries too
+            start = time.perf_counter()
+            computed = dict(zip(missing, self.underlying.embed_documents(missing)))
+            seconds = (time.perf_counter() - start) / len(missing)
+            for text, vector in computed.items():
+                self.query_cache.put(text, vector, seconds)
+            vectors = [computed.get(t) if v is None else v for t, v in zip(texts, vectors)]
+        return vectors
+
+    async def aembed_query(self, text: str) -> List[float]:
+        vector = self.query_cache.get(text)
+        if vector is None:
+            start = time.perf_counter()
+            vector = await self.underlying.aembed_query(text)
+            self.query_cache.put(text, vector, time.perf_counter() - start)
+        return vector
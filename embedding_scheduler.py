@@ -0,0 +1,226 @@
+"""Concurrent, rate-limit-aware batch embedding.
+
+``ScheduledEmbeddings`` wraps a provider's embeddings (``OpenAIEmbeddings``
+in ``llms.py``). Cache misses from ``CacheBackedEmbeddings`` arrive as one
+``embed_documents`` call. The wrapper splits that call into token-sized
+batches. It runs them concurrently with asyncio, keeping within a
+tokens-per-minute budget and one concurrency limit per event loop shared by
+every caller, and retries rate-limited or transient failures with jittered
+exponential backoff. This is the only retry layer: the wrapped client should
+be created with ``max_retries=0``. Output order matches input order.
+"""
+
+import asyncio
+import math
+import random
+import threading
+import time
+import weakref
+from typing import Any, Awaitable, Callable, Coroutine, List, Optional, TypeVar
+
+from langchain_core.embeddings import Embeddings
+
+# Status codes worth retrying: rate limited, or the provider had a bad moment
+RETRYABLE_STATUS = {408, 409, 429, 500, 502, 503, 504}
+RETRYABLE_ERRORS = {"RateLimitError", "APITimeoutError", "APIConnectionError", "InternalServerError"}
+
+T = TypeVar("T")
+
+
+def estimate_tokens(text: str) -> int:
+    """Cheap token estimate (~4 characters per token) used for batching and budgeting."""
+    return len(text) // 4 + 1
+
+
+def _is_retryable(error: Exception) -> bool:
+    if getattr(error, "status_code", None) in RETRYABLE_STATUS:
+        return True
+    return type(error).__name__ in RETRYABLE_ERRORS
+
+
+def _retry_after(error: Exception) -> Optional[float]:
+    """Seconds the provider asked us to wait, if it said so."""
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None) or {}
+    try:
+        return float(headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
+
+
+class TokenBucket(object):
+    """Tokens-per-minute budget shared by every batch, whichever event loop it runs on."""
+
+    def __init__(self, tokens_per_minute: int):
+        self.capacity = float(tokens_per_minute)
+        self.rate = tokens_per_minute / 60.0
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _reserve(self, tokens: int) -> float:
+        """Take tokens (possibly going into debt) and return how long to wait."""
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            self._tokens -= min(tokens, self.capacity)
+            return max(0.0, -self._tokens / self.rate)
+
+    async def acquire(self, tokens: int) -> None:
+        delay = self._reserve(tokens)
+        if delay:
+            await asyncio.sleep(delay)
+
+
+_LOOP: Optional[asyncio.AbstractEventLoop] = None
+_LOOP_LOCK = threading.Lock()
+
+
+def shared_loop() -> asyncio.AbstractEventLoop:
+    """The process-wide background event loop, started on first use.
+
+    Every async provider call runs here. One long-lived loop (rather than
+    ``asyncio.run`` per call) lets async HTTP clients keep their pooled
+    connections between calls, since those connections belong to one loop.
+    """
+    global _LOOP
+    with _LOOP_LOCK:
+        if _LOOP is None:
+            _LOOP = asyncio.new_event_loop()
+            threading.Thread(target=_LOOP.run_forever, name="async-loop", daemon=True).start()
+    return _LOOP
+
+
+def run_sync(coro: Coroutine) -> Any:
+    """Run a coroutine on the shared background event loop and wait for it."""
+    try:
+        running = asyncio.get_running_loop()
+    except RuntimeError:
+        running = None
+    if running is not None and running is _LOOP:
+        raise RuntimeError("run_sync() cannot be called from the shared loop itself; await instead")
+    return asyncio.run_coroutine_threadsafe(coro, shared_loop()).result()
+
+
+class ScheduledEmbeddings(Embeddings):
+    """Embeddings wrapper that issues batched requests concurrently under a TPM budget."""
+
+    def __init__(
+        self,
+        underlying: Embeddings,
+        max_concurrency: int = 4,
+        tokens_per_minute: int = 1_000_000,
+        max_batch_tokens: int = 100_000,
+        max_batch_size: int = 1000,
+        max_retries: int = 6,
+        base_delay: float = 0.5,
+        max_delay: float = 30.0,
+    ):
+        self.underlying = underlying
+        self.max_concurrency = max_concurrency
+        self.max_batch_tokens = max_batch_tokens
+        self.max_batch_size = max_batch_size
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.budget = TokenBucket(tokens_per_minute)
+        self.retries = 0
+        # One limit shared by every call on a loop (asyncio primitives cannot span loops)
+        self._semaphores: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, asyncio.Semaphore]" = (
+            weakref.WeakKeyDictionary()
+        )
+        self._semaphores_lock = threading.Lock()
+
+    def _semaphore(self) -> asyncio.Semaphore:
+        loop = asyncio.get_running_loop()
+        with self._semaphores_lock:
+            semaphore = self._semaphores.get(loop)
+            if semaphore is None:
+                semaphore = self._semaphores[loop] = asyncio.Semaphore(self.max_concurrency)
+        return semaphore
+
+    def _batches(self, texts: List[str]) -> List[List[int]]:
+        """Group text indices into batches.
+
+        Batches are capped by max_batch_size and max_batch_tokens. They are also
+        kept small enough that there is at least one batch per concurrency slot.
+        """
+        tokens = [estimate_tokens(t) for t in texts]
+        target = min(self.max_batch_tokens, math.ceil(sum(tokens) / self.max_concurrency))
+        batches, current, current_tokens = [], [], 0
+        for i, n in enumerate(tokens):
+            if current and (current_tokens + n > target or len(current) >= self.max_batch_size):
+                batches.append(current)
+                current, current_tokens = [], 0
+            current.append(i)
+            current_tokens += n
+        if current:
+            batches.append(current)
+        return batches
+
+    def _backoff(self, attempt: int, error: Exception) -> Optional[float]:
+        """Seconds to wait before retrying after ``error``, or None to give up."""
+        if attempt == self.max_retries or not _is_retryable(error):
+            return None
+        self.retries += 1
+        # Full jitter, unless the provider told us how long to back off
+        delay = _retry_after(error)
+        if delay is None:
+            delay = random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+        return delay
+
+    async def _call_with_retry(self, call: Callable[[], Awaitable[T]], tokens: int = 0) -> T:
+        """Await ``call()``, retrying retryable errors; ``tokens`` are taken from the budget first."""
+        for attempt in range(self.max_retries + 1):
+            if tokens:
+                await self.budget.acquire(tokens)
+            try:
+                return await call()
+            except Exception as e:
+                delay = self._backoff(attempt, e)
+                if delay is None:
+                    raise
+                await asyncio.sleep(delay)
+        raise AssertionError("unreachable")
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        if not texts:
+            return []
+        semaphore = self._semaphore()
+
+        async def run(batch: List[int]) -> List[List[float]]:
+            batch_texts = [texts[i] for i in batch]
+            async with semaphore:
+                return await self._call_with_retry(
+                    lambda: self.underlying.aembed_documents(batch_texts),
+                    sum(estimate_tokens(t) for t in batch_texts),
+                )
+
+        batches = self._batches(texts)
+        results = await asyncio.gather(*(run(batch) for batch in batches))
+        out: List[List[float]] = [[] for _ in texts]
+        for batch, vectors in zip(batches, results):
+            for i, vector in zip(batch, vectors):
+                out[i] = vector
+        return out
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return run_sync(self.aembed_documents(texts))
+
+    # Queries skip the budget and the concurrency limit, so a large upload
+    # does not hold up a chat turn, but get the same retries
+
+    async def aembed_query(self, text: str) -> List[float]:
+        return await self._call_with_retry(lambda: self.underlying.aembed_query(text))
+
+    def embed_query(self, text: str) -> List[float]:
+        for attempt in range(self.max_retries + 1):
+            try:
+                return self.underlying.embed_query(text)
+            except Exception as e:
+                delay = self._backoff(attempt, e)
+                if delay is None:
+                    raise
+                time.sleep(delay)
+        raise AssertionError("unreachable")
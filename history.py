@@ -0,0 +1,75 @@
+"""Rolling compaction of the conversation history kept in graph state.
+
+``add_messages`` only ever appends, and every checkpoint stores the whole
+message list, so the cost of a turn grows with the length of the
+conversation. ``compact_messages`` keeps the last few turns verbatim and
+folds older ones into a short extractive summary with a fixed token budget.
+"""
+
+from typing import List, Tuple
+
+from langchain_core.messages import BaseMessage, HumanMessage
+
+from embedding_scheduler import estimate_tokens
+
+# Characters of each question / answer kept in a summary line
+SUMMARY_SNIPPET_CHARS = 160
+
+
+def _text(message: BaseMessage) -> str:
+    content = message.content
+    if not isinstance(content, str):
+        content = " ".join(str(part) for part in content)
+    return " ".join(content.split())
+
+
+def split_turns(messages: List[BaseMessage]) -> List[List[BaseMessage]]:
+    """Group messages into turns, each starting at a human message."""
+    turns: List[List[BaseMessage]] = []
+    for message in messages:
+        if isinstance(message, HumanMessage) or not turns:
+            turns.append([])
+        turns[-1].append(message)
+    return turns
+
+
+def summarize_turn(turn: List[BaseMessage]) -> str:
+    """One summary line: the start of the question and of the final answer."""
+    question = _text(turn[0])[:SUMMARY_SNIPPET_CHARS]
+    answer = _text(turn[-1])[:SUMMARY_SNIPPET_CHARS] if len(turn) > 1 else ""
+    return f"Q: {question} | A: {answer}"
+
+
+def compact_messages(
+    messages: List[BaseMessage],
+    summary: str,
+    max_turns: int,
+    max_tokens: int,
+    summary_tokens: int,
+) -> Tuple[List[BaseMessage], str]:
+    """Decide which messages to drop and what the summary becomes.
+
+    The newest turns are kept while there are at most ``max_turns`` of them
+    and they fit in ``max_tokens``; the latest turn is always kept. Dropped
+    turns are appended to ``summary``, whose oldest lines are then discarded
+    until it fits ``summary_tokens`` (0 drops old turns without a summary).
+    Returns ``(dropped messages, new summary)``.
+    """
+    turns = split_turns(messages)
+    kept, tokens = 0, 0
+    for turn in reversed(turns):
+        turn_tokens = sum(estimate_tokens(_text(m)) for m in turn)
+        if kept and (kept >= max_turns or tokens + turn_tokens > max_tokens):
+            break
+        kept += 1
+        tokens += turn_tokens
+
+    folded = turns[:len(turns) - kept]
+    if not folded:
+        return [], summary
+
+    lines = summary.splitlines() if summary else []
+    lines.extend(summarize_turn(turn) for turn in folded)
+    while lines and estimate_tokens("\n".join(lines)) > summary_tokens:
+        lines.pop(0)
+    return [m for turn in folded for m in turn], "\n".join(lines)
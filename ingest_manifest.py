@@ -0,0 +1,188 @@
+"""Ingestion manifest: remembers which file contents are already indexed."""
+
+import hashlib
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterable, Iterator, List, Optional
+
+try:
+    import fcntl
+except ImportError:  # Windows: single writer per directory is assumed
+    fcntl = None
+
+MANIFEST_FILE = "manifest.json"
+
+
+class IngestManifest(object):
+    """Persistent set of ingested files keyed by content hash and splitter settings.
+
+    Lives next to the vector store it describes, so deleting the index also
+    forgets what was ingested. Each entry lists its ``owners`` (upload sessions;
+    ``""`` for files no session owns, like the knowledge base), so one open
+    session replacing or clearing a file never removes another one's copy.
+    A file being indexed is listed as ``pending`` from before its first chunk
+    is written, so only the session that reserved it writes or cleans up its
+    chunks.
+    """
+
+    def __init__(self, path: str) -> None:
+        self.path = os.path.join(path, MANIFEST_FILE)
+        self._lock = threading.Lock()
+        self._entries: Dict[str, dict] = self._read()
+
+    @staticmethod
+    def key(data: bytes, settings: str) -> str:
+        """Manifest key for file contents processed with the given splitter settings."""
+        digest = hashlib.sha256(data).hexdigest()
+        return f"{digest}:{settings}"
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._entries
+
+    def get(self, key: str) -> Optional[dict]:
+        return self._entries.get(key)
+
+    def keys_named(self, name: str, owner: Optional[str] = None) -> List[str]:
+        """Keys of every indexed version of the file with this name (held by ``owner`` if given)."""
+        return [
+            key for key, entry in self._entries.items()
+            if entry["name"] == name and (owner is None or owner in _owners(entry))
+        ]
+
+    def owners(self, key: str) -> List[str]:
+        """Owners holding an indexed file (empty if it is not indexed)."""
+        entry = self._entries.get(key)
+        return _owners(entry) if entry else []
+
+    def keys_owned(self, owner: str) -> List[str]:
+        """Keys of every file ``owner`` holds."""
+        return [key for key, entry in self._entries.items() if owner in _owners(entry)]
+
+    def sources(self) -> List[str]:
+        """Every ``source`` value the indexed chunks carry, sorted (without reading the index)."""
+        return sorted({s for entry in self._entries.values() for s in entry.get("sources", [entry["name"]])})
+
+    def add(
+        self, key: str, name: str, chunks: int, sources: Optional[List[str]] = None, owner: str = ""
+    ) -> None:
+        """Record a successfully indexed file, held by ``owner``.
+
+        ``sources`` are the chunks' ``source`` values when they are not just ``name``.
+        """
+        with self._locked():
+            # Merge with entries written by other processes since we loaded
+            entries = self._read()
+            entries.update(self._entries)
+            owners = _owners(entries[key]) if key in entries else []
+            entries[key] = {
+                "name": name,
+                "chunks": chunks,
+                "sources": sources or [name],
+                "owners": sorted(set(owners) | {owner}),
+                "ingested_at": time.time(),
+            }
+            self._write(entries)
+
+    def reserve(self, key: str, name: str, owner: str) -> bool:
+        """List a file as being indexed by ``owner``. False if it is already listed.
+
+        Atomic across processes: of several sessions ingesting the same new
+        file at once, exactly one gets True and indexes it.
+        """
+        with self._locked():
+            entries = self._read()
+            entries.update(self._entries)
+            if key in entries:
+                self._entries = entries
+                return False
+            entries[key] = {
+                "name": name,
+                "chunks": 0,
+                "sources": [name],
+                "owners": [owner],
+                "pending": True,
+                # Lets a process tell an abandoned reservation from one in progress
+                "pid": os.getpid(),
+                "ingested_at": time.time(),
+            }
+            self._write(entries)
+            return True
+
+    def is_pending(self, key: str) -> bool:
+        """Whether the file is still being indexed."""
+        return bool((self._entries.get(key) or {}).get("pending"))
+
+    def claim(self, key: str, owner: str) -> bool:
+        """Add ``owner`` to an indexed file's owners. False if the file is not indexed."""
+        with self._locked():
+            entries = self._read()
+            entries.update(self._entries)
+            if key not in entries:
+                return False
+            entries[key]["owners"] = sorted(set(_owners(entries[key])) | {owner})
+            self._write(entries)
+            return True
+
+    def release(self, keys: Iterable[str], owners: Iterable[str]) -> List[str]:
+        """Drop ``owners`` from these files' owners and return the keys nobody holds any more.
+
+        The returned files stay listed until ``remove`` is called for them,
+        once their chunks are deleted. Pending files are never returned: the
+        session indexing them finishes or cleans them up.
+        """
+        with self._locked():
+            entries = self._read()
+            entries.update(self._entries)
+            released, orphaned = set(owners), []
+            for key in keys:
+                if key not in entries:
+                    continue
+                remaining = [o for o in _owners(entries[key]) if o not in released]
+                entries[key]["owners"] = remaining
+                if not remaining and not entries[key].get("pending"):
+                    orphaned.append(key)
+            self._write(entries)
+            return orphaned
+
+    def remove(self, keys: Iterable[str]) -> None:
+        """Forget files whose chunks were deleted from the store."""
+        with self._locked():
+            entries = self._read()
+            entries.update(self._entries)
+            for key in keys:
+                entries.pop(key, None)
+            self._write(entries)
+
+    @contextmanager
+    def _locked(self) -> Iterator[None]:
+        """Exclusive lock for a read-modify-write, shared with other processes."""
+        with self._lock, open(self.path + ".lock", "a") as lock_file:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _write(self, entries: Dict[str, dict]) -> None:
+        self._entries = entries
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(entries, f, indent=1)
+        os.replace(tmp_path, self.path)
+
+    def _read(self) -> Dict[str, dict]:
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+
+
+def _owners(entry: dict) -> List[str]:
+    # Entries written before owners were tracked belong to nobody in particular
+    return entry.get("owners", [""])
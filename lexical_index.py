@@ -0,0 +1,119 @@
+"""In-process inverted index with BM25 scoring.
+
+Embedding search is weak on exact tokens such as acronyms ("MQL"), SKUs and
+campaign codes. This index keeps one posting list of (row id, term
+frequency) per term. A query only touches the postings of its own terms, so
+a lookup costs far less than a full vector scan.
+"""
+
+import re
+import threading
+from array import array
+from collections import Counter
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from vector_search import top_k
+
+# Words, numbers and joined codes such as "sku-1234", "q3_2024" or "v2.1"
+_TOKEN = re.compile(r"[0-9a-z]+(?:[-_./][0-9a-z]+)*")
+_JOINERS = re.compile(r"[-_./]")
+
+
+def tokenize(text: str) -> List[str]:
+    """Case-folded tokens; joined codes are kept whole and also split into their parts."""
+    tokens = _TOKEN.findall(text.casefold())
+    for token in [t for t in tokens if _JOINERS.search(t)]:
+        tokens.extend(_JOINERS.split(token))
+    return tokens
+
+
+class BM25Index(object):
+    """Append-only BM25 index over rows identified by their position in the vector store."""
+
+    def __init__(self, k1: float = 1.2, b: float = 0.75) -> None:
+        self.k1 = k1
+        self.b = b
+        self._lock = threading.Lock()
+        self._rows: Dict[str, array] = {}
+        self._freqs: Dict[str, array] = {}
+        self._lengths = array("I")
+        self._total_length = 0
+
+    @property
+    def n_indexed(self) -> int:
+        return len(self._lengths)
+
+    def add(self, texts: Iterable[str]) -> None:
+        """Index texts as the next rows."""
+        with self._lock:
+            for text in texts:
+                row = len(self._lengths)
+                counts = Counter(tokenize(text))
+                for token, count in counts.items():
+                    rows = self._rows.get(token)
+                    if rows is None:
+                        rows = self._rows[token] = array("i")
+                        self._freqs[token] = array("H")
+                    rows.append(row)
+                    self._freqs[token].append(min(count, 65535))
+                length = sum(counts.values())
+                self._lengths.append(length)
+                self._total_length += length
+
+    def clear(self) -> None:
+        with self._lock:
+            self._rows, self._freqs = {}, {}
+            self._lengths = array("I")
+            self._total_length = 0
+
+    def search(
+        self,
+        query: str,
+        k: int,
+        rows: Optional[np.ndarray] = None,
+        exclude: Optional[np.ndarray] = None,
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """Return (row ids, BM25 scores) of the k best rows containing a query term.
+
+        ``rows`` restricts the result to those row ids; ``exclude`` rows are never returned.
+        """
+        terms = set(tokenize(query))
+        with self._lock:
+            n = len(self._lengths)
+            if n == 0 or not terms:
+                return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+            lengths = np.frombuffer(self._lengths, dtype=np.uint32)
+            avg_length = self._total_length / n
+            scores = np.zeros(n, dtype=np.float32)
+            for term in terms:
+                postings = self._rows.get(term)
+                if postings is None:
+                    continue
+                ids = np.frombuffer(postings, dtype=np.int32)
+                tf = np.frombuffer(self._freqs[term], dtype=np.uint16).astype(np.float32)
+                idf = np.log1p((n - len(ids) + 0.5) / (len(ids) + 0.5))
+                norm = self.k1 * (1 - self.b + self.b * lengths[ids] / avg_length)
+                scores[ids] += idf * tf * (self.k1 + 1) / (tf + norm)
+                # Release the buffer views so appends can resize the arrays again
+                del ids, tf
+            del lengths
+        if exclude is not None and exclude.size:
+            scores[exclude[exclude < n]] = 0
+        if rows is None:
+            matched = np.flatnonzero(scores)
+        else:
+            rows = rows[rows < n]
+            matched = rows[scores[rows] > 0]
+        best = matched[top_k(scores[matched], k)]
+        return best, scores[best]
+
+
+def reciprocal_rank_fusion(rankings: List[np.ndarray], k: int, rrf_k: int = 60) -> List[Tuple[int, float]]:
+    """Fuse ranked row-id lists: each list adds 1 / (rrf_k + rank) to a row's score."""
+    fused: Dict[int, float] = {}
+    for ranking in rankings:
+        for rank, row in enumerate(ranking):
+            fused[int(row)] = fused.get(int(row), 0.0) + 1.0 / (rrf_k + rank + 1)
+    return sorted(fused.items(), key=lambda item: -item[1])[:k]
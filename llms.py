@@ -1,47 +1,200 @@
+"""Loading LLMs and Embeddings.
+
+Clients are created on first use by the ``get_*`` factories, and the
+provider SDKs are imported only then, so importing this module is cheap.
+``chat_model`` and ``EMBEDDINGS`` still resolve as module attributes.
+"""
+
+import asyncio
 import os
-"""Loading LLMs and Embeddings."""
+import threading
+import weakref
+from typing import Any, List
+
+from langchain_core.embeddings import Embeddings
 
 from config import set_environment
+from embedding_cache import (
+    QueryCachedEmbeddings,
+    QueryEmbeddingCache,
+    SQLiteByteStore,
+    decode_vector,
+    encode_vector,
+    text_key,
+)
+from embedding_scheduler import ScheduledEmbeddings
+from metrics import METRICS
+from resources import shared_resource
 
 set_environment()
 
 # Ensure local cache directory exists (Streamlit Cloud uses ephemeral FS)
 os.makedirs("./cache", exist_ok=True)
 
-# --- LangChain imports (version-safe) ---
-try:
-    # Newer LangChain locations
-    from langchain.embeddings.cache import CacheBackedEmbeddings
-except Exception:
-    # Older LangChain fallback
-    from langchain.embeddings import CacheBackedEmbeddings
-
-try:
-    from langchain.storage import LocalFileStore
-except Exception:
-    # Older fallback (rare)
-    from langchain.storage import LocalFileStore
-
-from langchain_openai import OpenAIEmbeddings
-from langchain_groq import ChatGroq
-
-chat_model = ChatGroq(
-    model="llama-3.3-70b-versatile",
-    temperature=0,
-    max_tokens=None,
-    timeout=None,
-    max_retries=2,
-)
+EMBEDDING_MODEL = "text-embedding-3-large"
 
-store = LocalFileStore("./cache/")
+# Open connections kept per provider and event loop for async requests (shared by every session)
+HTTP_MAX_CONNECTIONS = int(os.environ.get("HTTP_MAX_CONNECTIONS", "100"))
 
-underlying_embeddings = OpenAIEmbeddings(
-    model="text-embedding-3-large",
-)
 
-# Cache embeddings to avoid repeat costs
-EMBEDDINGS = CacheBackedEmbeddings.from_bytes_store(
-    underlying_embeddings,
-    store,
-    namespace=underlying_embeddings.model,
-)
+def _async_http_pool() -> Any:
+    """Keep-alive connection pools for one provider's async client, one per event loop.
+
+    httpx connections belong to the loop that opened them, so one shared pool
+    fails ("Event loop is closed") as soon as a second ``asyncio.run`` reuses
+    it. Requests are sent through a client owned by the running loop instead,
+    so the async entry points work from ``embedding_scheduler.shared_loop()``
+    and from any other loop alike.
+    """
+    import httpx
+
+    limits = httpx.Limits(
+        max_connections=HTTP_MAX_CONNECTIONS,
+        max_keepalive_connections=HTTP_MAX_CONNECTIONS,
+    )
+
+    class PerLoopAsyncClient(httpx.AsyncClient):
+        def __init__(self) -> None:
+            super().__init__(limits=limits)
+            # A loop's pool is dropped along with the loop
+            self._loop_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, httpx.AsyncClient]" = (
+                weakref.WeakKeyDictionary()
+            )
+            self._loop_clients_lock = threading.Lock()
+
+        def _loop_client(self) -> httpx.AsyncClient:
+            loop = asyncio.get_running_loop()
+            with self._loop_clients_lock:
+                client = self._loop_clients.get(loop)
+                if client is None:
+                    client = self._loop_clients[loop] = httpx.AsyncClient(limits=limits)
+            return client
+
+        async def send(self, request: httpx.Request, **kwargs: Any) -> httpx.Response:
+            return await self._loop_client().send(request, **kwargs)
+
+        async def aclose(self) -> None:
+            with self._loop_clients_lock:
+                client = self._loop_clients.pop(asyncio.get_running_loop(), None)
+            if client is not None:
+                await client.aclose()
+            await super().aclose()
+
+    return PerLoopAsyncClient()
+
+
+@shared_resource
+def get_chat_model() -> Any:
+    from langchain_groq import ChatGroq
+
+    return ChatGroq(
+        model="llama-3.3-70b-versatile",
+        temperature=0,
+        max_tokens=None,
+        timeout=None,
+        max_retries=2,
+        http_async_client=_async_http_pool(),
+    )
+
+
+@shared_resource
+def get_embedding_store() -> SQLiteByteStore:
+    # One SQLite file with an LRU byte budget instead of one file per embedding
+    store = SQLiteByteStore(
+        "./cache/embeddings.sqlite",
+        max_bytes=int(os.environ.get("EMBEDDING_CACHE_MAX_BYTES", str(2 * 1024 ** 3))),
+    )
+    METRICS.gauge("embedding_cache_hit_rate", lambda: store.stats()["hit_rate"])
+    return store
+
+
+@shared_resource
+def get_embeddings() -> QueryCachedEmbeddings:
+    # --- LangChain imports (version-safe) ---
+    try:
+        # Newer LangChain locations
+        from langchain.embeddings.cache import CacheBackedEmbeddings
+    except Exception:
+        # Older LangChain fallback
+        from langchain.embeddings import CacheBackedEmbeddings
+    from langchain.storage import EncoderBackedStore
+    from langchain_openai import OpenAIEmbeddings
+
+    store = get_embedding_store()
+    # ScheduledEmbeddings does the retrying; client retries would stack on its backoff
+    underlying_embeddings = OpenAIEmbeddings(
+        model=EMBEDDING_MODEL, max_retries=0, http_async_client=_async_http_pool()
+    )
+
+    # Cache misses are embedded in concurrent, rate-limited batches
+    scheduled_embeddings = ScheduledEmbeddings(
+        underlying_embeddings,
+        max_concurrency=int(os.environ.get("EMBEDDING_MAX_CONCURRENCY", "4")),
+        tokens_per_minute=int(os.environ.get("EMBEDDING_TOKENS_PER_MINUTE", "1000000")),
+    )
+
+    # Cache embeddings (as raw float32) to avoid repeat costs
+    document_embeddings = CacheBackedEmbeddings(
+        scheduled_embeddings,
+        EncoderBackedStore(
+            store,
+            key_encoder=lambda text: text_key(EMBEDDING_MODEL, text),
+            value_serializer=encode_vector,
+            value_deserializer=decode_vector,
+        ),
+    )
+
+    # Repeated questions skip the embed_query round trip (in-process LRU + shared store)
+    embeddings = QueryCachedEmbeddings(
+        document_embeddings,
+        QueryEmbeddingCache(EMBEDDING_MODEL, store=store),
+    )
+    METRICS.gauge("query_embedding_cache_hit_rate", lambda: embeddings.query_cache.stats()["hit_rate"])
+    return embeddings
+
+
+class LazyEmbeddings(Embeddings):
+    """Forwards to ``get_embeddings()``, so holding one creates no client until it is used."""
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return get_embeddings().embed_documents(texts)
+
+    def embed_query(self, text: str) -> List[float]:
+        return get_embeddings().embed_query(text)
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        return await get_embeddings().aembed_documents(texts)
+
+    async def aembed_query(self, text: str) -> List[float]:
+        return await get_embeddings().aembed_query(text)
+
+    def __getattr__(self, name: str) -> Any:
+        # embed_queries, query_cache, ... (but not copy/pickle probes, which should not create a client)
+        if name.startswith("__"):
+            raise AttributeError(name)
+        return getattr(get_embeddings(), name)
+
+
+@shared_resource
+def preload() -> threading.Thread:
+    """Create the clients in a background thread (started once per process).
+
+    Called after the page is drawn, so the provider SDK imports are done by
+    the time the first question arrives instead of delaying it.
+    """
+    def load() -> None:
+        get_embeddings()
+        get_chat_model()
+
+    thread = threading.Thread(target=load, name="preload-clients", daemon=True)
+    thread.start()
+    return thread
+
+
+def __getattr__(name: str) -> Any:
+    # Module attributes from before the clients were created lazily
+    if name == "chat_model":
+        return get_chat_model()
+    if name == "EMBEDDINGS":
+        return get_embeddings()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -0,0 +1,95 @@
+"""Posting-list indexes over chunk metadata, for filtered retrieval.
+
+Every scalar metadata value (``source``, ``page``, ``topic``, ...) gets a
+posting list of the rows that carry it. A filter turns into a boolean row
+mask built from those lists, so similarity is computed only over the
+matching rows instead of scanning everything and filtering the top k.
+
+Filter syntax (fields are ANDed together)::
+
+    {"source": "handbook.pdf"}                  # equality
+    {"source": ["a.pdf", "b.pdf"]}              # any of
+    {"page": {"gte": 10, "lte": 20}}            # numeric range (gt/gte/lt/lte)
+    {"topic": "bert_model", "page": {"lt": 5}}
+"""
+
+import threading
+from array import array
+from typing import Any, Dict, Iterable, List, Optional
+
+import numpy as np
+
+_RANGE_OPS = {
+    "gt": lambda v, x: v > x,
+    "gte": lambda v, x: v >= x,
+    "lt": lambda v, x: v < x,
+    "lte": lambda v, x: v <= x,
+}
+
+
+class MetadataIndex(object):
+    """Append-only map of field -> value -> row ids."""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._postings: Dict[str, Dict[Any, array]] = {}
+        self._count = 0
+
+    @property
+    def n_indexed(self) -> int:
+        return self._count
+
+    def add(self, metadatas: Iterable[dict]) -> None:
+        """Index the metadata of the next rows."""
+        with self._lock:
+            for metadata in metadatas:
+                for field, value in metadata.items():
+                    if isinstance(value, (str, int, float, bool)):
+                        values = self._postings.setdefault(field, {})
+                        values.setdefault(value, array("i")).append(self._count)
+                self._count += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._postings = {}
+            self._count = 0
+
+    def values(self, field: str, exclude: Optional[np.ndarray] = None) -> List[Any]:
+        """Distinct values of a field, sorted; values only found on ``exclude`` rows are left out."""
+        with self._lock:
+            values = self._postings.get(field, {})
+            if exclude is not None and exclude.size:
+                values = [
+                    v for v, rows in values.items()
+                    if np.setdiff1d(np.frombuffer(rows, dtype=np.int32), exclude).size
+                ]
+            return sorted(values, key=str)
+
+    def mask(self, filter: Dict[str, Any], n_rows: int) -> np.ndarray:
+        """Boolean mask over the first ``n_rows`` rows matching every condition in ``filter``."""
+        allowed = np.ones(n_rows, dtype=bool)
+        with self._lock:
+            for field, condition in filter.items():
+                values = self._postings.get(field, {})
+                if isinstance(condition, dict):
+                    unknown = set(condition) - set(_RANGE_OPS)
+                    if unknown:
+                        raise ValueError(f"Unsupported operators for {field!r}: {sorted(unknown)}")
+                    wanted = [
+                        v for v in values
+                        if isinstance(v, (int, float)) and not isinstance(v, bool)
+                        and all(_RANGE_OPS[op](v, x) for op, x in condition.items())
+                    ]
+                elif isinstance(condition, (list, tuple, set, frozenset)):
+                    wanted = [v for v in condition if v in values]
+                else:
+                    wanted = [condition] if condition in values else []
+
+                field_mask = np.zeros(n_rows, dtype=bool)
+                for value in wanted:
+                    rows = np.frombuffer(values[value], dtype=np.int32)
+                    field_mask[rows[rows < n_rows]] = True
+                    del rows
+                allowed &= field_mask
+        return allowed
+
@@ -0,0 +1,325 @@
+"""In-process metrics: stage timings, token counts, cache hit rates.
+
+``METRICS`` is the process-wide registry. Timings and sizes are kept as a
+rolling window of recent samples (for percentiles) plus a running count and
+sum; counters only go up; gauges are read from a callback at export time.
+The registry exports as Prometheus text (``to_prometheus``) or one JSON
+object per series (``to_jsonl``).
+
+``MetricsCallbackHandler`` is a LangChain callback handler. It times graph
+nodes, chat model calls and retrievals, and counts tokens and retrieved
+chunks.
+"""
+
+import json
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Any, Callable, Deque, Dict, Iterator, List, Optional, Tuple
+from uuid import UUID
+
+import numpy as np
+
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.outputs import LLMResult
+
+from embedding_scheduler import estimate_tokens
+
+PREFIX = "rag_"
+
+_Key = Tuple[str, Tuple[Tuple[str, str], ...]]
+
+
+def _key(name: str, labels: Dict[str, Any]) -> _Key:
+    return name, tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+class MetricsRegistry(object):
+    """Thread-safe store of summaries (rolling window), counters and gauges."""
+
+    def __init__(self, window: int = 1000) -> None:
+        self.window = window
+        self._lock = threading.Lock()
+        self._samples: Dict[_Key, Deque[float]] = {}
+        self._totals: Dict[_Key, List[float]] = {}  # [count, sum]
+        self._counters: Dict[_Key, float] = {}
+        self._gauges: Dict[str, Callable[[], float]] = {}
+
+    def observe(self, name: str, value: float, **labels: Any) -> None:
+        """Record one sample (a duration in seconds, a size, ...)."""
+        key = _key(name, labels)
+        with self._lock:
+            samples = self._samples.get(key)
+            if samples is None:
+                samples = self._samples[key] = deque(maxlen=self.window)
+                self._totals[key] = [0, 0.0]
+            samples.append(value)
+            totals = self._totals[key]
+            totals[0] += 1
+            totals[1] += value
+
+    def inc(self, name: str, value: float = 1.0, **labels: Any) -> None:
+        key = _key(name, labels)
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0.0) + value
+
+    def gauge(self, name: str, read: Callable[[], float]) -> None:
+        """Register a value that is read when metrics are exported."""
+        with self._lock:
+            self._gauges[name] = read
+
+    @contextmanager
+    def timer(self, name: str, **labels: Any) -> Iterator[None]:
+        """Observe the duration of the block."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+
+    @contextmanager
+    def add_time(self, name: str, **labels: Any) -> Iterator[None]:
+        """Add the duration of the block to a counter (for totals split by stage)."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.inc(name, time.perf_counter() - start, **labels)
+
+    def percentiles(self, name: str, percentiles=(50, 95, 99), **labels: Any) -> Dict[int, float]:
+        """Percentiles of the recent samples of one series (empty if none)."""
+        with self._lock:
+            samples = list(self._samples.get(_key(name, labels), ()))
+        if not samples:
+            return {}
+        return {p: float(v) for p, v in zip(percentiles, np.percentile(samples, percentiles))}
+
+    def series(self, name: str) -> List[Dict[str, str]]:
+        """Label sets recorded for a summary."""
+        with self._lock:
+            return [dict(labels) for n, labels in self._samples if n == name]
+
+    def snapshot(self) -> List[dict]:
+        """One dict per series: summaries with count/sum/p50/p95/p99, counters and gauges."""
+        with self._lock:
+            summaries = [(k, list(s), list(self._totals[k])) for k, s in self._samples.items()]
+            counters = list(self._counters.items())
+            gauges = list(self._gauges.items())
+        out = []
+        for (name, labels), samples, (count, total) in summaries:
+            p50, p95, p99 = np.percentile(samples, (50, 95, 99))
+            out.append({
+                "name": name, "type": "summary", "labels": dict(labels), "count": count,
+                "sum": total, "p50": float(p50), "p95": float(p95), "p99": float(p99),
+            })
+        for (name, labels), value in counters:
+            out.append({"name": name, "type": "counter", "labels": dict(labels), "value": value})
+        for name, read in gauges:
+            try:
+                value = float(read())
+            except Exception:
+                continue
+            out.append({"name": name, "type": "gauge", "labels": {}, "value": value})
+        return out
+
+    def to_jsonl(self) -> str:
+        now = time.time()
+        return "".join(json.dumps({"ts": now, **entry}) + "\n" for entry in self.snapshot())
+
+    def to_prometheus(self) -> str:
+        """Prometheus text exposition format (summaries carry 0.5/0.95/0.99 quantiles)."""
+        lines, typed = [], set()
+        for entry in sorted(self.snapshot(), key=lambda e: (e["name"], sorted(e["labels"].items()))):
+            name = PREFIX + entry["name"]
+            if name not in typed:
+                lines.append(f"# TYPE {name} {entry['type']}")
+                typed.add(name)
+            labels = entry["labels"]
+            if entry["type"] == "summary":
+                for q, p in (("0.5", "p50"), ("0.95", "p95"), ("0.99", "p99")):
+                    lines.append(f"{name}{_labels({**labels, 'quantile': q})} {entry[p]:.6g}")
+                lines.append(f"{name}_sum{_labels(labels)} {entry['sum']:.6g}")
+                lines.append(f"{name}_count{_labels(labels)} {entry['count']}")
+            else:
+                lines.append(f"{name}{_labels(labels)} {entry['value']:.6g}")
+        return "\n".join(lines) + "\n"
+
+    def clear(self) -> None:
+        with self._lock:
+            self._samples.clear()
+            self._totals.clear()
+            self._counters.clear()
+
+
+def _labels(labels: Dict[str, str]) -> str:
+    if not labels:
+        return ""
+    escaped = (f'{k}="{v}"'.replace("\n", " ") for k, v in sorted(labels.items()))
+    return "{" + ",".join(escaped) + "}"
+
+
+METRICS = MetricsRegistry()
+
+
+class MetricsCallbackHandler(BaseCallbackHandler):
+    """Times graph nodes, chat model calls and retrievals.
+
+    With a ``registry`` every event is recorded there. Either way the handler
+    keeps ``stages`` (seconds per graph node, plus "llm" and "retriever"),
+    ``tokens`` and ``retrieved_chunks`` for the runs it saw, so one handler
+    per turn gives that turn's breakdown. Token counts come from the
+    provider's usage report, or are estimated from the text when there is none.
+    """
+
+    # Cheap and thread-safe: in async runs, call it on the event loop rather
+    # than through a thread pool (which would also skew the timestamps)
+    run_inline = True
+
+    def __init__(self, registry: Optional[MetricsRegistry] = None) -> None:
+        self.registry = registry
+        self.stages: Dict[str, float] = {}
+        self.tokens: Dict[str, int] = {}
+        self.retrieved_chunks = 0
+        self._lock = threading.Lock()
+        self._starts: Dict[UUID, Tuple[str, float]] = {}
+        self._first_token: Dict[UUID, bool] = {}
+        self._prompt_tokens: Dict[UUID, int] = {}
+
+    def _start(self, run_id: UUID, stage: str) -> None:
+        with self._lock:
+            self._starts[run_id] = (stage, time.perf_counter())
+
+    def _end(self, run_id: UUID) -> Optional[str]:
+        with self._lock:
+            started = self._starts.pop(run_id, None)
+            self._first_token.pop(run_id, None)
+        if started is None:
+            return None
+        stage, start = started
+        seconds = time.perf_counter() - start
+        with self._lock:
+            self.stages[stage] = self.stages.get(stage, 0.0) + seconds
+        if self.registry is not None:
+            if stage in ("llm", "retriever"):
+                self.registry.observe(f"{stage}_seconds", seconds)
+            else:
+                self.registry.observe("graph_node_seconds", seconds, node=stage)
+        return stage
+
+    def on_chain_start(
+        self,
+        serialized: Dict[str, Any],
+        inputs: Any,
+        *,
+        run_id: UUID,
+        metadata: Optional[Dict[str, Any]] = None,
+        **kwargs: Any,
+    ) -> None:
+        node = (metadata or {}).get("langgraph_node")
+        # Runs nested inside a node inherit its metadata; only time the node itself
+        if node and kwargs.get("name") == node and not node.startswith("__"):
+            self._start(run_id, node)
+
+    def on_chain_end(self, outputs: Any, *, run_id: UUID, **kwargs: Any) -> None:
+        self._end(run_id)
+
+    def on_chain_error(self, error: BaseException, *, run_id: UUID, **kwargs: Any) -> None:
+        self._end(run_id)
+
+    def on_chat_model_start(
+        self,
+        serialized: Dict[str, Any],
+        messages: Any,
+        *,
+        run_id: UUID,
+        **kwargs: Any,
+    ) -> None:
+        self._start(run_id, "llm")
+        with self._lock:
+            self._prompt_tokens[run_id] = sum(
+                estimate_tokens(str(m.content)) for batch in messages for m in batch
+            )
+
+    def on_llm_start(
+        self,
+        serialized: Dict[str, Any],
+        prompts: List[str],
+        *,
+        run_id: UUID,
+        **kwargs: Any,
+    ) -> None:
+        self._start(run_id, "llm")
+        with self._lock:
+            self._prompt_tokens[run_id] = sum(estimate_tokens(p) for p in prompts)
+
+    def on_llm_new_token(self, token: str, *, run_id: UUID, **kwargs: Any) -> None:
+        with self._lock:
+            started = self._starts.get(run_id)
+            first = started is not None and run_id not in self._first_token
+            if first:
+                self._first_token[run_id] = True
+        if first and self.registry is not None:
+            self.registry.observe("llm_ttft_seconds", time.perf_counter() - started[1])
+
+    def on_llm_end(self, response: LLMResult, *, run_id: UUID, **kwargs: Any) -> None:
+        self._end(run_id)
+        with self._lock:
+            estimated_prompt = self._prompt_tokens.pop(run_id, 0)
+        usage = (response.llm_output or {}).get("token_usage") or {}
+        prompt, completion = usage.get("prompt_tokens"), usage.get("completion_tokens")
+        if completion is None:
+            generations = [g for batch in response.generations for g in batch]
+            usage_metadata = next(
+                (getattr(g, "message", None).usage_metadata for g in generations
+                 if getattr(getattr(g, "message", None), "usage_metadata", None)),
+                None,
+            )
+            if usage_metadata:
+                prompt, completion = usage_metadata["input_tokens"], usage_metadata["output_tokens"]
+            else:
+                prompt = estimated_prompt
+                completion = sum(estimate_tokens(g.text) for g in generations)
+        counts = {"prompt": prompt or 0, "completion": completion or 0}
+        with self._lock:
+            for kind, n in counts.items():
+                self.tokens[kind] = self.tokens.get(kind, 0) + n
+        if self.registry is not None:
+            for kind, n in counts.items():
+                self.registry.inc("llm_tokens_total", n, kind=kind)
+
+    def on_llm_error(self, error: BaseException, *, run_id: UUID, **kwargs: Any) -> None:
+        self._end(run_id)
+        with self._lock:
+            self._prompt_tokens.pop(run_id, None)
+        if self.registry is not None:
+            self.registry.inc("llm_errors_total", error=type(error).__name__)
+
+    def on_retriever_start(
+        self,
+        serialized: Dict[str, Any],
+        query: str,
+        *,
+        run_id: UUID,
+        **kwargs: Any,
+    ) -> None:
+        self._start(run_id, "retriever")
+
+    def on_retriever_end(self, documents: Any, *, run_id: UUID, **kwargs: Any) -> None:
+        self._end(run_id)
+        with self._lock:
+            self.retrieved_chunks += len(documents)
+        if self.registry is not None:
+            self.registry.observe("retrieved_chunks", len(documents))
+
+    def on_retriever_error(self, error: BaseException, *, run_id: UUID, **kwargs: Any) -> None:
+        self._end(run_id)
+
+    def breakdown(self) -> dict:
+        """This handler's stage seconds, token counts and retrieved chunks."""
+        with self._lock:
+            return {
+                "stages": dict(self.stages),
+                "tokens": dict(self.tokens),
+                "retrieved_chunks": self.retrieved_chunks,
+            }
@@ -0,0 +1,162 @@
+"""Compressed copies of the embedding matrix for a cheaper first search stage.
+
+Codecs:
+  - ``float16``  half precision, 2 bytes per dimension
+  - ``int8``     symmetric scalar quantization with one float32 scale per row
+  - ``float32``  no compression; only useful together with ``dims``
+
+``dims`` keeps only the first N dimensions, renormalized. text-embedding-3
+models are trained so that prefixes remain usable embeddings (Matryoshka
+representation learning).
+
+A search scores every compressed row, over-fetches ``k * rescore_factor``
+candidates, and rescores those against the full-precision float32 matrix.
+The compressed copy is the part that has to stay in RAM. The float32 rows
+are only touched for the few candidates being rescored.
+"""
+
+import threading
+from typing import Optional, Tuple
+
+import numpy as np
+
+from vector_search import drop_excluded, normalize, top_k
+
+CODECS = ("float32", "float16", "int8")
+
+# Rows converted to float32 at a time while scoring (small enough to stay in cache)
+_BLOCK = 4096
+
+
+class QuantizedIndex(object):
+    """Growable compressed copy of a row-major matrix of unit vectors."""
+
+    def __init__(self, codec: str = "int8", dims: Optional[int] = None) -> None:
+        if codec not in CODECS:
+            raise ValueError(f"Unknown codec {codec!r}, expected one of {CODECS}")
+        self.codec = codec
+        self.dims = dims
+        self._lock = threading.Lock()
+        self._codes: Optional[np.ndarray] = None
+        self._scales = np.empty(0, dtype=np.float32)
+        self._count = 0
+
+    @property
+    def n_indexed(self) -> int:
+        return self._count
+
+    @property
+    def nbytes(self) -> int:
+        """Bytes held by the compressed rows (including per-row scales)."""
+        if self._codes is None:
+            return 0
+        row_bytes = self._codes.shape[1] * self._codes.itemsize
+        return self._count * (row_bytes + (4 if self.codec == "int8" else 0))
+
+    def _prepare(self, rows: np.ndarray) -> np.ndarray:
+        rows = np.asarray(rows, dtype=np.float32)
+        if self.dims and self.dims < rows.shape[-1]:
+            rows = normalize(rows[..., :self.dims])
+        return rows
+
+    def encode(self, rows: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """Return (codes, per-row scales) for float32 rows."""
+        rows = self._prepare(rows)
+        if self.codec == "int8":
+            scales = np.maximum(np.abs(rows).max(axis=1), 1e-12) / 127.0
+            codes = np.round(rows / scales[:, None]).astype(np.int8)
+            return codes, scales.astype(np.float32)
+        return rows.astype(self.codec), np.empty(0, dtype=np.float32)
+
+    def sync(self, matrix: np.ndarray, block: int = _BLOCK) -> None:
+        """Encode the rows of the matrix that are not indexed yet."""
+        with self._lock:
+            if matrix.shape[0] < self._count:
+                self.clear()
+            for start in range(self._count, matrix.shape[0], block):
+                codes, scales = self.encode(matrix[start:start + block])
+                self._append(codes, scales)
+
+    def _append(self, codes: np.ndarray, scales: np.ndarray) -> None:
+        n = self._count + codes.shape[0]
+        if self._codes is None or n > self._codes.shape[0]:
+            # Grow geometrically so appends stay amortized O(rows added)
+            capacity = max(n, 2 * (0 if self._codes is None else self._codes.shape[0]), 1024)
+            grown = np.empty((capacity, codes.shape[1]), dtype=codes.dtype)
+            if self._codes is not None:
+                grown[:self._count] = self._codes[:self._count]
+            self._codes = grown
+            if self.codec == "int8":
+                grown_scales = np.empty(capacity, dtype=np.float32)
+                grown_scales[:self._count] = self._scales[:self._count]
+                self._scales = grown_scales
+        self._codes[self._count:n] = codes
+        if self.codec == "int8":
+            self._scales[self._count:n] = scales
+        self._count = n
+
+    def take(self, rows: np.ndarray) -> "QuantizedIndex":
+        """Compressed copy of the given rows only, renumbered 0..n-1 (unencoded rows are left out)."""
+        index = QuantizedIndex(self.codec, self.dims)
+        with self._lock:
+            codes, scales, count = self._codes, self._scales, self._count
+        rows = rows[rows < count]
+        if codes is not None and rows.size:
+            index._append(codes[rows], scales[rows] if self.codec == "int8" else scales)
+        return index
+
+    def clear(self) -> None:
+        self._codes = None
+        self._scales = np.empty(0, dtype=np.float32)
+        self._count = 0
+
+    def scores(
+        self, query: np.ndarray, rows: Optional[np.ndarray] = None
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """Return (row ids, approximate cosine scores) for every indexed row or just ``rows``."""
+        query = self._prepare(normalize(query))
+        with self._lock:
+            codes, scales, count = self._codes, self._scales, self._count
+        if codes is None:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+        if rows is not None:
+            rows = rows[rows < count]
+            out = codes[rows].astype(np.float32) @ query
+            return rows, out * scales[rows] if self.codec == "int8" else out
+
+        out = np.empty(count, dtype=np.float32)
+        for start in range(0, count, _BLOCK):
+            stop = min(start + _BLOCK, count)
+            out[start:stop] = codes[start:stop].astype(np.float32, copy=False) @ query
+        if self.codec == "int8":
+            out *= scales[:count]
+        return np.arange(count), out
+
+    def search(
+        self,
+        query: np.ndarray,
+        k: int,
+        matrix: Optional[np.ndarray] = None,
+        rescore_factor: int = 4,
+        rows: Optional[np.ndarray] = None,
+        exclude: Optional[np.ndarray] = None,
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """Top k rows by compressed score, rescored against ``matrix`` when given.
+
+        With rescoring, ``k * rescore_factor`` candidates are taken from the
+        compressed scores and re-ranked with exact float32 dot products.
+        Rows in ``exclude`` are skipped when searching all rows.
+        """
+        ids, scores = self.scores(query, rows)
+        if rows is None and exclude is not None and exclude.size:
+            scores[exclude[exclude < scores.shape[0]]] = -np.inf
+        if matrix is None or rescore_factor <= 1:
+            best = top_k(scores, k)
+            return drop_excluded(ids[best], scores[best])
+        shortlist = top_k(scores, k * rescore_factor)
+        shortlist = shortlist[np.isfinite(scores[shortlist])]
+        # Sorted ids keep the gather from the memory-mapped matrix sequential
+        candidates = np.sort(ids[shortlist])
+        exact = np.asarray(matrix[candidates]) @ normalize(query)
+        best = top_k(exact, k)
+        return candidates[best], exact[best]
@@ -1,23 +1,63 @@
 """LangGraph RAG pipeline (max compatibility, ASCII-only)."""
 
-from typing import Annotated, List, TypedDict
+import asyncio
+import json
+import logging
+import os
+import queue
+import time
+from typing import Annotated, AsyncIterator, Iterator, List, TypedDict
 
 from langchain_core.documents import Document
-from langchain_core.messages import AIMessage, BaseMessage
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage, RemoveMessage
 from langchain_core.prompts import ChatPromptTemplate
+from langchain_core.runnables import RunnableConfig, RunnableLambda
 
-from langgraph.checkpoint.memory import MemorySaver
 from langgraph.graph import START, END, StateGraph
 from langgraph.graph.message import add_messages
 
-from llms import chat_model
-from retriever import DocumentRetriever
+from answer_cache import SemanticAnswerCache
+from checkpointer import BoundedMemorySaver
+from context_packing import pack_context
+from embedding_scheduler import shared_loop
+from history import compact_messages
+from llms import get_chat_model, get_embeddings
+from metrics import METRICS, MetricsCallbackHandler
+from retriever import DocumentRetriever, get_vector_store
 
 # Shared retriever instance
-retriever = DocumentRetriever()
+retriever = DocumentRetriever(
+    retrieval_mode=os.environ.get("RETRIEVAL_MODE", "vector"),
+    search_mode=os.environ.get("VECTOR_SEARCH_MODE", "exact"),
+)
+
+# Answers to near-identical questions, invalidated whenever the corpus changes
+answer_cache = SemanticAnswerCache(
+    threshold=float(os.environ.get("ANSWER_CACHE_THRESHOLD", "0.95")),
+    max_entries=int(os.environ.get("ANSWER_CACHE_MAX_ENTRIES", "1000")),
+)
+METRICS.gauge("answer_cache_hit_rate", lambda: answer_cache.stats()["hit_rate"])
+METRICS.gauge("vector_store_chunks", lambda: len(get_vector_store()))
+
+# When set, every turn's timing breakdown is appended to this JSONL file
+METRICS_JSONL = os.environ.get("METRICS_JSONL")
+
+# Conversation history kept verbatim in graph state; older turns are folded
+# into a summary so checkpoints stay the same size however long a chat runs
+HISTORY_MAX_TURNS = int(os.environ.get("HISTORY_MAX_TURNS", "6"))
+HISTORY_MAX_TOKENS = int(os.environ.get("HISTORY_MAX_TOKENS", "4000"))
+HISTORY_SUMMARY_TOKENS = int(os.environ.get("HISTORY_SUMMARY_TOKENS", "500"))
 
-# Graph runtime config (thread_id can be any stable value)
-config = {"configurable": {"thread_id": "abc123"}}
+# Prompt tokens spent on retrieved context per question
+CONTEXT_MAX_TOKENS = int(os.environ.get("CONTEXT_MAX_TOKENS", "3000"))
+
+# Marks the end of a turn's tokens in stream_turn
+_END = object()
+
+
+def session_config(thread_id: str, **configurable) -> RunnableConfig:
+    """Graph runtime config for one chat session (one checkpointer thread)."""
+    return {"configurable": {"thread_id": thread_id, **configurable}}
 
 
 class State(TypedDict, total=False):
@@ -27,6 +67,14 @@ class State(TypedDict, total=False):
     docs: List[Document]
     # Final answer text
     answer: str
+    # Whether this turn's answer came from the answer cache
+    cache_hit: bool
+    # Vector store version the retrieved docs came from
+    corpus_version: int
+    # Chunk/token counts from packing the context into the prompt
+    context_stats: dict
+    # Bounded extractive summary of turns compacted out of messages
+    summary: str
 
 
 PROMPT = ChatPromptTemplate.from_messages(
@@ -43,20 +91,86 @@ PROMPT = ChatPromptTemplate.from_messages(
 )
 
 
-def retrieve(state: State) -> State:
+def _bypass_cache(config: RunnableConfig) -> bool:
+    """Per-turn opt-out: pass configurable={"bypass_answer_cache": True}.
+
+    Filtered questions also bypass it, since cached answers are not keyed by filter.
+    """
+    configurable = (config or {}).get("configurable", {})
+    return bool(configurable.get("bypass_answer_cache") or configurable.get("retrieval_filter"))
+
+
+def _retrieval_filter(config: RunnableConfig):
+    """Per-turn metadata filter: pass configurable={"retrieval_filter": {...}}."""
+    return (config or {}).get("configurable", {}).get("retrieval_filter")
+
+
+def lookup_answer(state: State, config: RunnableConfig) -> State:
+    if _bypass_cache(config):
+        return {"cache_hit": False}
+    question = state["messages"][-1].content
+    answer = answer_cache.lookup(get_embeddings().embed_query(question), get_vector_store().version)
+    if answer is None:
+        return {"cache_hit": False}
+    return {"answer": answer, "cache_hit": True, "docs": [], "context_stats": {}}
+
+
+async def alookup_answer(state: State, config: RunnableConfig) -> State:
+    if _bypass_cache(config):
+        return {"cache_hit": False}
+    question = state["messages"][-1].content
+    embedding = await get_embeddings().aembed_query(question)
+    answer = answer_cache.lookup(embedding, get_vector_store().version)
+    if answer is None:
+        return {"cache_hit": False}
+    return {"answer": answer, "cache_hit": True, "docs": [], "context_stats": {}}
+
+
+def route_after_lookup(state: State) -> str:
+    return "finalize" if state.get("cache_hit") else "retrieve"
+
+
+def retrieve(state: State, config: RunnableConfig) -> State:
     question = state["messages"][-1].content
-    docs = retriever.invoke(question)
-    return {"docs": docs}
+    corpus_version = get_vector_store().version
+    docs = retriever.invoke(question, filter=_retrieval_filter(config))
+    return {"docs": docs, "corpus_version": corpus_version}
 
 
-def generate(state: State) -> State:
+async def aretrieve(state: State, config: RunnableConfig) -> State:
     question = state["messages"][-1].content
-    docs = state.get("docs", [])
-    context = "\n\n".join([d.page_content for d in docs])
+    corpus_version = get_vector_store().version
+    docs = await retriever.ainvoke(question, filter=_retrieval_filter(config))
+    return {"docs": docs, "corpus_version": corpus_version}
+
 
-    chain = PROMPT | chat_model
+def generate(state: State, config: RunnableConfig) -> State:
+    question = state["messages"][-1].content
+    context, context_stats = pack_context(state.get("docs", []), CONTEXT_MAX_TOKENS)
+    logging.info("Packed context: %s", context_stats)
+
+    chain = PROMPT | get_chat_model()
     response = chain.invoke({"question": question, "context": context})
-    return {"answer": response.content}
+    if not _retrieval_filter(config):
+        # Query embeddings are cached, so this does not cost another round trip
+        answer_cache.store(
+            get_embeddings().embed_query(question), state.get("corpus_version", 0), response.content
+        )
+    return {"answer": response.content, "context_stats": context_stats}
+
+
+async def agenerate(state: State, config: RunnableConfig) -> State:
+    question = state["messages"][-1].content
+    context, context_stats = pack_context(state.get("docs", []), CONTEXT_MAX_TOKENS)
+    logging.info("Packed context: %s", context_stats)
+
+    chain = PROMPT | get_chat_model()
+    response = await chain.ainvoke({"question": question, "context": context})
+    if not _retrieval_filter(config):
+        answer_cache.store(
+            await get_embeddings().aembed_query(question), state.get("corpus_version", 0), response.content
+        )
+    return {"answer": response.content, "context_stats": context_stats}
 
 
 def finalize(state: State) -> State:
@@ -64,17 +178,127 @@ def finalize(state: State) -> State:
     return {"messages": [AIMessage(content=answer)]}
 
 
+def compact_history(state: State) -> State:
+    dropped, summary = compact_messages(
+        state["messages"],
+        state.get("summary", ""),
+        max_turns=HISTORY_MAX_TURNS,
+        max_tokens=HISTORY_MAX_TOKENS,
+        summary_tokens=HISTORY_SUMMARY_TOKENS,
+    )
+    if not dropped:
+        return {"summary": summary}
+    return {"messages": [RemoveMessage(id=m.id) for m in dropped], "summary": summary}
+
+
 # Build graph using widely supported API calls
 builder = StateGraph(State)
 
-builder.add_node("retrieve", retrieve)
-builder.add_node("generate", generate)
+# Nodes that wait on a provider have async twins, used by graph.ainvoke / astream.
+# The lambdas are named apart from their nodes so metrics time each node once
+builder.add_node("lookup_answer", RunnableLambda(lookup_answer, afunc=alookup_answer, name="lookup_answer_impl"))
+builder.add_node("retrieve", RunnableLambda(retrieve, afunc=aretrieve, name="retrieve_impl"))
+builder.add_node("generate", RunnableLambda(generate, afunc=agenerate, name="generate_impl"))
 builder.add_node("finalize", finalize)
+builder.add_node("compact_history", compact_history)
 
-builder.add_edge(START, "retrieve")
+builder.add_edge(START, "lookup_answer")
+builder.add_conditional_edges("lookup_answer", route_after_lookup, ["retrieve", "finalize"])
 builder.add_edge("retrieve", "generate")
 builder.add_edge("generate", "finalize")
-builder.add_edge("finalize", END)
+builder.add_edge("finalize", "compact_history")
+builder.add_edge("compact_history", END)
+
+# Per-session conversation state; idle sessions are evicted so memory stays bounded
+memory = BoundedMemorySaver(
+    max_threads=int(os.environ.get("CHECKPOINT_MAX_THREADS", "1000")),
+    ttl_seconds=float(os.environ.get("CHECKPOINT_TTL_SECONDS", "7200")),
+    max_bytes=int(os.environ.get("CHECKPOINT_MAX_BYTES", str(256 * 1024 ** 2))),
+)
+# Runs record per-node, LLM and retrieval timings into METRICS (unless given their own callbacks)
+graph = builder.compile(checkpointer=memory).with_config(callbacks=[MetricsCallbackHandler(METRICS)])
+
+
+async def astream_turn(inputs: State, config: RunnableConfig, turn: dict) -> AsyncIterator[str]:
+    """Run one chat turn, yielding answer tokens as the generate node produces them.
+
+    Uses LangGraph's "messages" stream mode for tokens and "values" for the
+    final state, which is still checkpointed as usual. On return ``turn``
+    holds the final ``state``, ``cache_hit``, ``context_stats``,
+    ``ttft_seconds`` (time to first token), ``total_seconds`` and ``metrics``
+    (seconds per stage, tokens, retrieved chunks). A cached answer arrives as a single chunk.
+
+    Provider calls are awaited, so a waiting turn holds no thread. Run it on
+    ``shared_loop()``, which owns the providers' async connection pools.
+    """
+    start = time.perf_counter()
+    streamed = False
+    # Runtime callbacks replace the graph's default handler, so this one also feeds METRICS
+    breakdown = MetricsCallbackHandler(METRICS)
+    config = {**config, "callbacks": [*(config.get("callbacks") or []), breakdown]}
+    async for mode, payload in graph.astream(inputs, config=config, stream_mode=["messages", "values"]):
+        if mode == "values":
+            turn["state"] = payload
+            continue
+        chunk, metadata = payload
+        if (
+            metadata.get("langgraph_node") == "generate"
+            and isinstance(chunk, AIMessageChunk)
+            and chunk.content
+        ):
+            if not streamed:
+                turn["ttft_seconds"] = time.perf_counter() - start
+                streamed = True
+            yield chunk.content
+
+    state = turn["state"]
+    turn["cache_hit"] = bool(state.get("cache_hit"))
+    turn["context_stats"] = state.get("context_stats") or {}
+    if not streamed:
+        turn["ttft_seconds"] = time.perf_counter() - start
+        yield state["messages"][-1].content
+    turn["total_seconds"] = time.perf_counter() - start
+    turn["metrics"] = breakdown.breakdown()
+    METRICS.observe("turn_seconds", turn["total_seconds"], cache_hit=turn["cache_hit"])
+    METRICS.observe("turn_ttft_seconds", turn["ttft_seconds"], cache_hit=turn["cache_hit"])
+    if METRICS_JSONL:
+        record = {
+            "ts": time.time(),
+            "thread_id": config.get("configurable", {}).get("thread_id"),
+            "cache_hit": turn["cache_hit"],
+            "ttft_seconds": turn["ttft_seconds"],
+            "total_seconds": turn["total_seconds"],
+            **turn["metrics"],
+        }
+        with open(METRICS_JSONL, "a", encoding="utf-8") as f:
+            f.write(json.dumps(record) + "\n")
+    logging.info(
+        "Turn done: ttft=%.3fs total=%.3fs cache_hit=%s",
+        turn["ttft_seconds"], turn["total_seconds"], turn["cache_hit"],
+    )
+
+
+def stream_turn(inputs: State, config: RunnableConfig, turn: dict) -> Iterator[str]:
+    """Synchronous ``astream_turn`` for Streamlit: the turn runs on the shared
+    event loop and this thread only receives its tokens.
+    """
+    tokens: "queue.Queue" = queue.Queue()
+
+    async def relay() -> None:
+        try:
+            async for token in astream_turn(inputs, config, turn):
+                tokens.put(token)
+        finally:
+            tokens.put(_END)
 
-memory = MemorySaver()
-graph = builder.compile(checkpointer=memory)
+    future = asyncio.run_coroutine_threadsafe(relay(), shared_loop())
+    try:
+        while True:
+            token = tokens.get()
+            if token is _END:
+                break
+            yield token
+        future.result()
+    finally:
+        # The caller stopped reading (e.g. a Streamlit rerun): stop the turn too
+        future.cancel()
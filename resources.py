@@ -0,0 +1,56 @@
+"""Process-wide resources created on first use.
+
+``shared_resource`` turns a zero-argument factory into a cached accessor in
+the spirit of ``st.cache_resource``: every session and thread gets the same
+instance, created once under a lock the first time it is asked for. Unlike
+``st.cache_resource`` it behaves the same outside a Streamlit run (scripts,
+benchmarks, parser worker processes), and the instance can be replaced with
+``set``, which is how the benchmarks swap in fake models.
+"""
+
+import functools
+import threading
+from typing import Callable, Generic, TypeVar
+
+T = TypeVar("T")
+
+_UNSET = object()
+
+
+class SharedResource(Generic[T]):
+    """Calls ``factory`` once and returns the same instance from then on."""
+
+    def __init__(self, factory: Callable[[], T]) -> None:
+        self._factory = factory
+        self._lock = threading.Lock()
+        self._value = _UNSET
+        functools.update_wrapper(self, factory)
+
+    def __call__(self) -> T:
+        value = self._value
+        if value is _UNSET:
+            with self._lock:
+                if self._value is _UNSET:
+                    self._value = self._factory()
+                value = self._value
+        return value
+
+    @property
+    def loaded(self) -> bool:
+        """Whether the instance exists yet (checking does not create it)."""
+        return self._value is not _UNSET
+
+    def set(self, value: T) -> None:
+        """Use ``value`` from now on instead of what the factory builds."""
+        with self._lock:
+            self._value = value
+
+    def clear(self) -> None:
+        """Forget the instance; the next call creates a new one."""
+        with self._lock:
+            self._value = _UNSET
+
+
+def shared_resource(factory: Callable[[], T]) -> SharedResource[T]:
+    """Decorator form of ``SharedResource``."""
+    return SharedResource(factory)
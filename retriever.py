@@ -2,74 +2,477 @@
 
 import os
 import tempfile
-from typing import List, Any
+import threading
+import time
+from functools import partial
+from itertools import islice
+from typing import Dict, Iterable, Iterator, List, Any, Optional
 
-from pydantic.v1 import Field
-
-from langchain_core.callbacks import CallbackManagerForRetrieverRun
+from langchain_core.callbacks import (
+    AsyncCallbackManagerForRetrieverRun,
+    CallbackManagerForRetrieverRun,
+)
 from langchain_core.documents import Document
 from langchain_core.retrievers import BaseRetriever
-from langchain_core.vectorstores import InMemoryVectorStore
+from langchain_core.runnables import RunnableConfig
+from langchain_core.runnables.config import run_in_executor
 from langchain_text_splitters import RecursiveCharacterTextSplitter
 
-from document_loader import load_document
-from llms import EMBEDDINGS
+from document_loader import (
+    DocumentStream,
+    ParseResult,
+    iter_documents_parallel,
+    load_knowledge_base,
+)
+from ingest_manifest import IngestManifest
+from llms import LazyEmbeddings
+from metrics import METRICS
+from resources import shared_resource
+from vector_store import MmapVectorStore
+
+
+@shared_resource
+def get_vector_store() -> MmapVectorStore:
+    """The disk-persistent vector store shared by every session and worker process."""
+    return MmapVectorStore(
+        # The embeddings client is only created once something is embedded
+        embedding=LazyEmbeddings(),
+        path=os.environ.get("VECTOR_STORE_DIR", "./index"),
+        # Optional compressed copy for search_mode="quantized": float16, int8, float32
+        quantization=os.environ.get("VECTOR_QUANTIZATION") or None,
+        quantized_dims=int(os.environ.get("VECTOR_QUANTIZED_DIMS", "0")) or None,
+        # Share of deleted chunks that triggers a background compaction (0 = never)
+        compact_ratio=float(os.environ.get("VECTOR_STORE_COMPACT_RATIO", "0.2")),
+        # The IVF index is only trained and kept up to date when it is searched
+        ivf=os.environ.get("VECTOR_SEARCH_MODE") == "ivf",
+    )
+
+
+@shared_resource
+def get_manifest() -> IngestManifest:
+    """Which file contents are already in the vector store."""
+    return IngestManifest(get_vector_store().path)
+
+
+# Held while manifest owners change and orphaned chunks are deleted, so a
+# file cannot be released by one session while another claims it
+_OWNERS_LOCK = threading.Lock()
+
+# Upload sessions seen within the TTL. A session idle for longer, or one from
+# before a restart, is gone: a same-name upload replaces the versions it held
+OWNER_TTL_SECONDS = float(os.environ.get("CHECKPOINT_TTL_SECONDS", "7200"))
+_ACTIVE_OWNERS: Dict[str, float] = {}
+
+
+def touch_owner(owner: str) -> None:
+    """Mark an upload session as still open (call on every run of its script)."""
+    now = time.time()
+    with _OWNERS_LOCK:
+        for stale in [o for o, seen in _ACTIVE_OWNERS.items() if now - seen >= OWNER_TTL_SECONDS]:
+            del _ACTIVE_OWNERS[stale]
+        _ACTIVE_OWNERS[owner] = now
+
+
+def _owner_active(owner: str) -> bool:
+    seen = _ACTIVE_OWNERS.get(owner)
+    return seen is not None and time.time() - seen < OWNER_TTL_SECONDS
+
 
-# One in-memory vector store for the app session
-VECTOR_STORE = InMemoryVectorStore(embedding=EMBEDDINGS)
+def __getattr__(name: str) -> Any:
+    # Module attributes from before the store was created lazily
+    if name == "VECTOR_STORE":
+        return get_vector_store()
+    if name == "MANIFEST":
+        return get_manifest()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def _with_metadata(doc: Document, metadata: dict) -> Document:
+    doc.metadata.update(metadata)
+    return doc
+
+
+def _release(keys: List[str], owners: Iterable[str]) -> int:
+    """Drop ``owners`` from these files and delete the chunks of those nobody holds any more."""
+    if not keys:
+        return 0
+    manifest = get_manifest()
+    orphaned = manifest.release(keys, owners)
+    deleted = get_vector_store().delete_where({"ingest_key": orphaned}) if orphaned else 0
+    manifest.remove(orphaned)
+    return deleted
+
+
+def _discard_partial(key: str) -> None:
+    """Delete the chunks of a file that failed part-way and drop its reservation.
+
+    Only called by the session that reserved the key, so no other session
+    has written chunks under it.
+    """
+    with _OWNERS_LOCK:
+        get_vector_store().delete_where({"ingest_key": key})
+        get_manifest().remove([key])
+
+
+def _abandoned(entry: dict) -> bool:
+    """Whether a pending file's ingest died: its process is gone, or it is ours and its sessions are."""
+    pid = entry.get("pid")
+    if pid == os.getpid():
+        return not any(_owner_active(o) for o in entry.get("owners", []))
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return True
+    except (OSError, TypeError):
+        return False
+    return False
+
+
+def _reserve(key: str, name: str, owner: str) -> bool:
+    """Reserve a new file's key for ``owner`` before any of its chunks is written.
+
+    Returns False, after claiming the file for ``owner``, if it is already
+    indexed or another session is indexing it; only the session that
+    reserved a key writes or cleans up its chunks. A reservation left by an
+    ingest that died (crash, restart) is cleaned up and taken over.
+    """
+    manifest = get_manifest()
+    touch_owner(owner)
+    while True:
+        with _OWNERS_LOCK:
+            entry = manifest.get(key)
+            if entry is not None and entry.get("pending") and _abandoned(entry):
+                get_vector_store().delete_where({"ingest_key": key})
+                manifest.remove([key])
+            if manifest.reserve(key, name, owner):
+                return True
+        # Claimed unless it vanished in between (its ingest failed): then try again
+        if DocumentRetriever._replace_versions(key, name, owner):
+            return False
 
 
 class DocumentRetriever(BaseRetriever):
-    """Stores documents in an in-memory vector store and retrieves by similarity search."""
+    """Stores documents in the persistent vector store and retrieves by similarity search."""
 
     k: int = 4
-    documents: List[Document] = Field(default_factory=list)
+    chunk_size: int = 1000
+    chunk_overlap: int = 200
+    # "exact" scans every chunk; "ivf" scans the n_probe closest IVF lists;
+    # "quantized" scans the compressed copy, then rescores k * rescore_factor rows
+    search_mode: str = "exact"
+    n_probe: int = 8
+    rescore_factor: int = 4
+    # "vector" (embeddings), "bm25" (keywords) or "hybrid" (both, fused by reciprocal rank)
+    retrieval_mode: str = "vector"
+    # Candidates taken from each side before hybrid fusion
+    fetch_k: int = 20
+    rrf_k: int = 60
+    # Processes used to parse uploads (None = one per CPU)
+    parse_workers: Optional[int] = None
+    # Chunks embedded and appended to the index per call
+    embed_batch_size: int = 256
 
-    def store_documents(self, docs: List[Document]) -> None:
-        """Split and add docs to the vector store."""
-        if not docs:
-            return
+    def _split(self, docs: Iterable[Document]) -> Iterator[Document]:
+        splitter = RecursiveCharacterTextSplitter(
+            chunk_size=self.chunk_size,
+            chunk_overlap=self.chunk_overlap,
+            # Lets context packing merge overlapping neighbours back together
+            add_start_index=True,
+        )
+        for doc in docs:
+            start = time.perf_counter()
+            chunks = splitter.split_documents([doc])
+            METRICS.inc("ingest_seconds_total", time.perf_counter() - start, stage="split")
+            yield from chunks
 
-        splitter = RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap=200)
-        split_docs = splitter.split_documents(docs)
+    def store_documents(self, docs: Iterable[Document], metadata: Optional[dict] = None) -> int:
+        """Split and add docs to the vector store. Returns the number of chunks added.
 
-        VECTOR_STORE.add_documents(split_docs)
+        ``docs`` may be a lazy iterator: documents are split one at a time and
+        embedded in fixed-size batches, so memory stays flat however large the
+        input is. ``metadata`` is set on every chunk, e.g. to override the
+        ``source`` (loaders record the temp file path there).
+        """
+        if metadata:
+            docs = (_with_metadata(doc, metadata) for doc in docs)
+        chunks = self._split(docs)
+        count = 0
+        while True:
+            batch = list(islice(chunks, self.embed_batch_size))
+            if not batch:
+                return count
+            get_vector_store().add_documents(batch)
+            METRICS.inc("ingest_chunks_total", len(batch))
+            count += len(batch)
 
-    def add_documents_from_uploads(self, uploaded_files: List[Any]) -> None:
-        """Load Streamlit uploaded files and add them to the vector store."""
-        docs: List[Document] = []
+    def add_documents_from_uploads(self, uploaded_files: List[Any], owner: str = "") -> List[ParseResult]:
+        """Load Streamlit uploaded files and add new or changed ones to the vector store.
 
-        for file in uploaded_files:
-            suffix = os.path.splitext(file.name)[-1]
+        Files whose exact contents were already indexed (or are being indexed
+        by another session) with the current splitter settings are not parsed
+        again, only claimed for ``owner`` (the uploading session). The rest
+        are reserved in the manifest and parsed (in parallel when there
+        are several) and streamed into the index in batches; one ParseResult
+        (with parse time and any error) is returned per parsed file. A changed
+        file replaces the owner's earlier versions of it; their chunks are
+        deleted once no other owner holds them.
+        """
+        settings = f"{self.chunk_size}:{self.chunk_overlap}"
+        pending = []  # (manifest key, upload name, temp path)
+        seen = set()
+        started = set()  # reserved keys whose indexing began (and cleans up after itself)
+        results: List[ParseResult] = []
+        try:
+            for file in uploaded_files:
+                data = file.getbuffer()
+                key = IngestManifest.key(data, settings)
+                if key in seen or not _reserve(key, file.name, owner):
+                    continue
+                seen.add(key)
+                pending.append((key, file.name, None))
 
-            with tempfile.NamedTemporaryFile(delete=False, suffix=suffix) as tmp:
-                tmp.write(file.getbuffer())
-                temp_filepath = tmp.name
+                suffix = os.path.splitext(file.name)[-1]
+                with tempfile.NamedTemporaryFile(delete=False, suffix=suffix) as tmp:
+                    pending[-1] = (key, file.name, tmp.name)
+                    tmp.write(data)
 
-            try:
-                file_docs = load_document(temp_filepath)
-                docs.extend(file_docs)
-            except Exception as e:
-                # Keep app running even if one doc fails
-                print(f"Failed to load {file.name}: {e}")
-            finally:
+            workers = min(self.parse_workers or os.cpu_count() or 1, len(pending))
+            if workers > 1:
+                parsed = iter_documents_parallel(
+                    [path for _, _, path in pending],
+                    names=[name for _, name, _ in pending],
+                    max_workers=workers,
+                )
+                for (key, name, _), result in zip(pending, parsed):
+                    started.add(key)
+                    if result.error:
+                        _discard_partial(key)
+                    else:
+                        self._index_file(result.docs, key, name, owner)
+                    # Do not keep parsed text around once it is indexed
+                    results.append(result._replace(docs=[]))
+            else:
+                # Serial: stream page by page straight into the splitter
+                for key, name, path in pending:
+                    started.add(key)
+                    stream = DocumentStream(path, name)
+                    self._index_file(stream, key, name, owner, stream)
+                    results.append(stream.result())
+        finally:
+            for key, _, temp_filepath in pending:
+                if key not in started:
+                    # Reserved but never reached, e.g. an earlier file raised
+                    _discard_partial(key)
+                if temp_filepath is None:
+                    continue
                 try:
                     os.remove(temp_filepath)
                 except Exception:
                     pass
 
-        # Update stored docs and vector store
-        if docs:
-            self.documents.extend(docs)
-            self.store_documents(docs)
+        for result in results:
+            METRICS.inc("ingest_seconds_total", result.seconds, stage="parse")
+            METRICS.inc("ingest_files_total", status="error" if result.error else "ok")
+            if result.error:
+                # Keep app running even if one doc fails
+                print(f"Failed to load {result.name}: {result.error}")
+
+        return results
+
+    def _index_file(
+        self,
+        docs: Iterable[Document],
+        key: str,
+        name: str,
+        owner: str,
+        stream: Optional[DocumentStream] = None,
+    ) -> None:
+        """Index one parsed upload and record it for ``owner``.
+
+        Chunks are committed batch by batch, so when parsing (``stream``) or
+        embedding fails part-way the batches already added are deleted again
+        and the reservation is dropped: nothing of a failed file stays
+        searchable and a retry adds no duplicates.
+        """
+        try:
+            chunks = self.store_documents(docs, {"source": name, "ingest_key": key})
+        except BaseException:
+            # Also a Streamlit rerun/stop, which interrupts the script mid-file
+            _discard_partial(key)
+            raise
+        if stream is not None and stream.error:
+            _discard_partial(key)
+            return
+        self._replace_versions(key, name, owner, chunks)
+
+    @staticmethod
+    def _replace_versions(key: str, name: str, owner: str, chunks: Optional[int] = None) -> bool:
+        """Record that ``owner`` holds this version of ``name`` and replace earlier versions.
+
+        Earlier versions are released by ``owner`` and by every session that
+        is gone (see ``touch_owner``); their chunks are deleted unless an open
+        session still holds them. ``chunks`` is given for a newly indexed
+        file; without it an already indexed one is claimed. Returns False if
+        there was nothing to claim.
+        """
+        manifest = get_manifest()
+        touch_owner(owner)
+        with _OWNERS_LOCK:
+            if chunks is not None:
+                manifest.add(key, name, chunks, owner=owner)
+            elif not manifest.claim(key, owner):
+                return False
+            old_keys = [k for k in manifest.keys_named(name) if k != key]
+            gone = {o for k in old_keys for o in manifest.owners(k) if not _owner_active(o)}
+            _release(old_keys, gone | {owner})
+        return True
+
+    def delete_source(self, name: str, owner: str = "") -> int:
+        """Release ``owner``'s versions of an uploaded file. Returns the number of chunks deleted.
+
+        Chunks are only deleted once no other owner holds the same version.
+        They are tombstoned right away; the store compacts itself in the
+        background once enough of it is deleted.
+        """
+        with _OWNERS_LOCK:
+            return _release(get_manifest().keys_named(name, owner=owner), [owner])
+
+    def release_owner(self, owner: str) -> int:
+        """Release every file ``owner`` uploaded (e.g. on Clear Session). Returns the chunks deleted."""
+        with _OWNERS_LOCK:
+            return _release(get_manifest().keys_owned(owner), [owner])
+
+    def add_knowledge_base(self, path: str = "knowledge_base.json") -> int:
+        """Index a knowledge_base.json file, keeping its source/page/topic metadata.
+
+        Returns the number of chunks added (0 if this exact file was already indexed).
+        """
+        with open(path, "rb") as f:
+            key = IngestManifest.key(f.read(), f"{self.chunk_size}:{self.chunk_overlap}")
+        name = os.path.basename(path)
+        if not _reserve(key, name, ""):
+            return 0
+        try:
+            docs = load_knowledge_base(path)
+            sources = sorted({str(doc.metadata["source"]) for doc in docs if "source" in doc.metadata})
+            chunks = self.store_documents(docs, {"ingest_key": key})
+        except BaseException:
+            _discard_partial(key)
+            raise
+        get_manifest().add(key, name, chunks, sources=sources)
+        return chunks
+
+    def batch(
+        self,
+        inputs: List[str],
+        config: Optional[RunnableConfig | List[RunnableConfig]] = None,
+        *,
+        return_exceptions: bool = False,
+        **kwargs: Any,
+    ) -> List[List[Document]]:
+        """Retrieve for many queries at once.
+
+        Vector and hybrid retrieval with exact search embed every query in one
+        batched call and score them all with matrix-matrix products, instead
+        of one ``invoke`` per query. Other modes (and per-input configs) fall
+        back to ``BaseRetriever.batch``. Accepts ``filter=`` like ``invoke``,
+        applied to every query.
+        """
+        if (
+            not inputs
+            or isinstance(config, list)
+            or return_exceptions
+            or self.retrieval_mode not in ("vector", "hybrid")
+            or self.search_mode != "exact"
+        ):
+            return super().batch(inputs, config, return_exceptions=return_exceptions, **kwargs)
+        store = get_vector_store()
+        if len(store) == 0:
+            return [[] for _ in inputs]
+        search = (
+            store.batch_similarity_search
+            if self.retrieval_mode == "vector"
+            else partial(store.batch_hybrid_search, fetch_k=max(self.fetch_k, self.k), rrf_k=self.rrf_k)
+        )
+        return search(list(inputs), k=self.k, filter=kwargs.get("filter"))
 
     def _get_relevant_documents(
         self,
         query: str,
         *,
         run_manager: CallbackManagerForRetrieverRun,
+        filter: Optional[dict] = None,
+    ) -> List[Document]:
+        """Retrieve relevant chunks from the vector store.
+
+        ``filter`` (passed as ``retriever.invoke(query, filter=...)``) limits
+        the search to chunks with matching metadata, e.g.
+        ``{"source": ["a.pdf"], "page": {"gte": 10, "lte": 20}}``.
+        """
+        store = get_vector_store()
+        if len(store) == 0:
+            return []
+        if self.retrieval_mode == "vector":
+            return store.similarity_search(
+                query=query,
+                k=self.k,
+                search_mode=self.search_mode,
+                n_probe=self.n_probe,
+                filter=filter,
+                rescore_factor=self.rescore_factor,
+            )
+        if self.retrieval_mode == "bm25":
+            hits = store.lexical_search_with_score(query, k=self.k, filter=filter)
+        elif self.retrieval_mode == "hybrid":
+            hits = store.hybrid_search(
+                query,
+                k=self.k,
+                fetch_k=max(self.fetch_k, self.k),
+                rrf_k=self.rrf_k,
+                search_mode=self.search_mode,
+                n_probe=self.n_probe,
+                filter=filter,
+                rescore_factor=self.rescore_factor,
+            )
+        else:
+            raise ValueError(f"Unknown retrieval mode {self.retrieval_mode!r}")
+        return [doc for doc, _ in hits]
+
+    async def _aget_relevant_documents(
+        self,
+        query: str,
+        *,
+        run_manager: AsyncCallbackManagerForRetrieverRun,
+        filter: Optional[dict] = None,
     ) -> List[Document]:
-        """Retrieve relevant chunks from the vector store."""
-        if not self.documents:
+        """Async ``_get_relevant_documents``: the query embedding is awaited, not waited for in a thread."""
+        store = get_vector_store()
+        if len(store) == 0:
             return []
-        return VECTOR_STORE.similarity_search(query=query, k=self.k)
+        if self.retrieval_mode == "vector":
+            return await store.asimilarity_search(
+                query=query,
+                k=self.k,
+                search_mode=self.search_mode,
+                n_probe=self.n_probe,
+                filter=filter,
+                rescore_factor=self.rescore_factor,
+            )
+        if self.retrieval_mode == "bm25":
+            hits = await run_in_executor(
+                None, partial(store.lexical_search_with_score, query, k=self.k, filter=filter)
+            )
+        elif self.retrieval_mode == "hybrid":
+            hits = await store.ahybrid_search(
+                query,
+                k=self.k,
+                fetch_k=max(self.fetch_k, self.k),
+                rrf_k=self.rrf_k,
+                search_mode=self.search_mode,
+                n_probe=self.n_probe,
+                filter=filter,
+                rescore_factor=self.rescore_factor,
+            )
+        else:
+            raise ValueError(f"Unknown retrieval mode {self.retrieval_mode!r}")
+        return [doc for doc, _ in hits]
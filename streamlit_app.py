@@ -3,6 +3,9 @@ Run:
   streamlit run streamlit_app.py
 """
 
+import hashlib
+from uuid import uuid4
+
 import streamlit as st
 
 try:
@@ -11,7 +14,10 @@ except ImportError:
     from langchain.schema import HumanMessage
 
 from document_loader import DocumentLoader
-from rag import graph, config, retriever
+from llms import get_embeddings, preload
+from metrics import METRICS
+from rag import answer_cache, memory, retriever, session_config, stream_turn
+from retriever import get_manifest, get_vector_store, touch_owner
 
 
 # =========================
@@ -27,8 +33,19 @@ if "chat_history" not in st.session_state:
     st.session_state.chat_history = []
 if "uploaded_files" not in st.session_state:
     st.session_state.uploaded_files = []
+    # Upload name -> content hash of the file kept under that name
+    st.session_state.upload_digests = {}
+if "owner_id" not in st.session_state:
+    # Owner of this session's uploads in the shared index (released on Clear Session)
+    st.session_state.owner_id = uuid4().hex
+# Versions held by sessions not seen for a while are replaced by newer uploads
+touch_owner(st.session_state.owner_id)
+if "thread_id" not in st.session_state:
+    # Each browser session gets its own conversation thread in the checkpointer
+    st.session_state.thread_id = uuid4().hex
 if "rag_ready" not in st.session_state:
-    st.session_state.rag_ready = False
+    # A persisted index from an earlier run is usable right away
+    st.session_state.rag_ready = len(get_vector_store()) > 0
 
 # =========================
 # Tabs
@@ -50,6 +67,15 @@ with tab_chat:
             with st.chat_message(msg["role"]):
                 st.markdown(msg["content"])
 
+        bypass_cache = st.toggle(
+            "Bypass answer cache", help="Generate a fresh answer for the next question."
+        )
+        search_sources = st.multiselect(
+            "Search only in",
+            # From the manifest: listing them from the index would read every chunk
+            get_manifest().sources(),
+            help="Leave empty to search every indexed document.",
+        )
         user_input = st.chat_input("Ask a question about your documents...")
 
         if user_input:
@@ -64,13 +90,32 @@ with tab_chat:
                     st.markdown(reply)
             else:
                 with st.chat_message("assistant"):
-                    with st.spinner("Thinking..."):
-                        result = graph.invoke(
+                    turn_config = session_config(
+                        st.session_state.thread_id,
+                        bypass_answer_cache=bypass_cache,
+                        retrieval_filter={"source": search_sources} if search_sources else None,
+                    )
+                    turn = {}
+                    # Tokens appear in the bubble as the model produces them
+                    answer = st.write_stream(
+                        stream_turn(
                             {"messages": [HumanMessage(content=user_input)]},
-                            config=config,
+                            turn_config,
+                            turn,
                         )
-                        answer = result["messages"][-1].content
-                        st.markdown(answer)
+                    )
+                    context_stats = turn["context_stats"]
+                    st.caption(
+                        ("Answered from cache. " if turn["cache_hit"] else "")
+                        + f"First token after {turn['ttft_seconds']:.2f}s, "
+                        f"complete after {turn['total_seconds']:.2f}s."
+                        + (
+                            f" Context: {context_stats['packed_tokens']} tokens "
+                            f"({context_stats['saved_tokens']} saved by packing)."
+                            if context_stats else ""
+                        )
+                    )
+                st.session_state.last_turn = turn
                 st.session_state.chat_history.append({"role": "assistant", "content": answer})
 
     with col2:
@@ -83,10 +128,16 @@ with tab_chat:
         )
 
         if uploads:
-            existing = {f.name for f in st.session_state.uploaded_files}
+            # Deduplicated by content: a changed file under a known name replaces the old one
+            digests = st.session_state.upload_digests
             for f in uploads:
-                if f.name not in existing:
-                    st.session_state.uploaded_files.append(f)
+                digest = hashlib.sha256(f.getbuffer()).hexdigest()
+                if digest in digests.values():
+                    continue
+                st.session_state.uploaded_files = [
+                    u for u in st.session_state.uploaded_files if u.name != f.name
+                ] + [f]
+                digests[f.name] = digest
 
         st.write("### Uploaded Files")
         if st.session_state.uploaded_files:
@@ -100,15 +151,102 @@ with tab_chat:
                 st.warning("Please upload documents first.")
             else:
                 with st.spinner("Indexing documents..."):
-                    retriever.add_documents_from_uploads(st.session_state.uploaded_files)
+                    results = retriever.add_documents_from_uploads(
+                        st.session_state.uploaded_files, owner=st.session_state.owner_id
+                    )
                     st.session_state.rag_ready = True
-                st.success("Knowledge base ready.")
+                indexed = [r for r in results if not r.error]
+                skipped = len(st.session_state.uploaded_files) - len(results)
+                st.success(
+                    f"Knowledge base ready. Indexed {len(indexed)} new or changed file(s), "
+                    f"skipped {skipped} already indexed."
+                )
+                for r in results:
+                    if r.error:
+                        st.warning(f"Could not parse {r.name}: {r.error}")
+                if results:
+                    with st.expander("Parse times"):
+                        for r in sorted(results, key=lambda r: -r.seconds):
+                            st.write(f"- {r.name}: {r.seconds:.2f}s, {r.sections} section(s)")
+
+        if st.button("Load sample knowledge base"):
+            added = retriever.add_knowledge_base()
+            st.session_state.rag_ready = True
+            st.success(f"Sample knowledge base ready ({added} new chunk(s)).")
 
         if st.button("Clear Session"):
+            memory.delete_thread(st.session_state.thread_id)
+            removed = retriever.release_owner(st.session_state.owner_id)
+            st.session_state.thread_id = uuid4().hex
             st.session_state.chat_history = []
             st.session_state.uploaded_files = []
-            st.session_state.rag_ready = False
-            st.success("Session cleared.")
+            st.session_state.upload_digests = {}
+            st.session_state.rag_ready = len(get_vector_store()) > 0
+            st.success(f"Session cleared ({removed} chunk(s) removed from the index).")
+
+        # Reading the stats must not create the embeddings client before it is needed
+        if get_embeddings.loaded:
+            query_stats = get_embeddings().query_cache.stats()
+            st.caption(
+                f"Query embedding cache: {query_stats['hit_rate']:.0%} hit rate "
+                f"({query_stats['hits']} hits), ~{query_stats['saved_seconds']:.1f}s of retrieval latency saved."
+            )
+        answer_stats = answer_cache.stats()
+        st.caption(
+            f"Answer cache: {answer_stats['hit_rate']:.0%} hit rate "
+            f"({answer_stats['hits']} hits, {answer_stats['entries']} entries)."
+        )
+
+        with st.expander("Performance"):
+            last_turn = st.session_state.get("last_turn")
+            if last_turn:
+                breakdown = last_turn["metrics"]
+                stages = {
+                    "time to first token": last_turn["ttft_seconds"],
+                    "total": last_turn["total_seconds"],
+                    **breakdown["stages"],
+                }
+                st.markdown(
+                    "**Last turn**\n\n| stage | ms |\n|---|---:|\n"
+                    + "".join(f"| {stage} | {seconds * 1000:.1f} |\n" for stage, seconds in stages.items())
+                )
+                tokens = breakdown["tokens"]
+                st.caption(
+                    f"{tokens.get('prompt', 0)} prompt / {tokens.get('completion', 0)} completion tokens, "
+                    f"{breakdown['retrieved_chunks']} chunk(s) retrieved."
+                )
+            else:
+                st.info("Ask a question to see where the time goes.")
+
+            rows = [
+                ("turn", "turn_seconds", {"cache_hit": False}),
+                ("time to first token", "turn_ttft_seconds", {"cache_hit": False}),
+                ("llm", "llm_seconds", {}),
+                ("retriever", "retriever_seconds", {}),
+            ] + [(labels["node"], "graph_node_seconds", labels) for labels in METRICS.series("graph_node_seconds")]
+            rolling = ""
+            for label, name, labels in rows:
+                p = METRICS.percentiles(name, **labels)
+                if p:
+                    rolling += f"| {label} | {p[50] * 1000:.1f} | {p[95] * 1000:.1f} | {p[99] * 1000:.1f} |\n"
+            if rolling:
+                st.markdown(
+                    "**Recent turns (all sessions)**\n\n"
+                    "| stage | p50 ms | p95 ms | p99 ms |\n|---|---:|---:|---:|\n" + rolling
+                )
+
+            ingest = {
+                e["labels"]["stage"]: e["value"]
+                for e in METRICS.snapshot() if e["name"] == "ingest_seconds_total"
+            }
+            if ingest:
+                st.caption(
+                    "Knowledge base builds so far: "
+                    + ", ".join(f"{stage} {seconds:.1f}s" for stage, seconds in sorted(ingest.items()))
+                    + "."
+                )
+            st.download_button("Prometheus metrics", METRICS.to_prometheus(), file_name="metrics.prom")
+            st.download_button("Metrics JSONL", METRICS.to_jsonl(), file_name="metrics.jsonl")
 
 # =========================
 # TAB 2: ABOUT
@@ -165,13 +303,13 @@ Together, they form a layered AI strategy:
 - Indexes content for semantic retrieval
 - Answers questions grounded strictly in provided knowledge
 - Demonstrates the **Retrieve → Reason → Respond** agentic loop
-- Operates with session-scoped data for safety and experimentation
+- Keeps indexed content in a local persistent index shared by all sessions (see the README's data handling section)
 
 
 ### How this evolves beyond the prototype
 
 The architecture is intentionally designed to evolve into a production-grade platform with:
-- Persistent vector storage and metadata management
+- Managed vector storage and metadata management
 - Enterprise authentication and role-based access control
 - Audit logging and usage observability
 - Integration with systems such as SharePoint, Confluence, and MarTech tools
@@ -240,7 +378,7 @@ Use natural language to:
 
 ### Current limitations (intentional)
 
-- Knowledge is session-scoped (no persistence yet)
+- Indexed knowledge persists on the host's disk and is shared by all sessions; Clear Session only removes this session's uploads
 - Manual upload is used instead of automated ingestion
 - Workflow outputs are draft-only
 
@@ -269,32 +407,39 @@ The Agentic AI Knowledge Platform is built on a **modular, enterprise-oriented a
 
 The two diagrams below illustrate this progression:
 
-1. **Current Prototype (Ephemeral Only)** — optimized for speed, safety, and iteration  
-2. **Production Evolution (Ephemeral + Persistent Layers)** — optimized for trust, scale, and governance
+1. **Current Prototype (Local Persistent Index)** — optimized for speed and iteration on a single host  
+2. **Production Evolution (Governed Persistent Layers)** — optimized for trust, scale, and governance
 
 Together, they show how the platform moves from a proof-of-capability into a durable enterprise system without architectural rework.
 
-### Data Flow: Current Prototype (Ephemeral Only)
+### Data Flow: Current Prototype (Local Persistent Index)
 
-This diagram represents the **current state of the platform**, intentionally designed to be lightweight, low-risk, and fast to iterate.
+This diagram represents the **current state of the platform**: lightweight and fast to iterate, with its knowledge kept on the host's local disk.
 
 Key characteristics:
-- All document processing (parsing, chunking, embedding) happens **ephemerally at runtime**
-- Uploaded content exists only in **session memory** and temporary storage
-- No files, embeddings, or chat history persist across restarts
-- The AI reasons **only over content explicitly provided by the user**
-
-This design allows stakeholders to safely evaluate:
+- Uploaded files are held in **session memory** and written briefly to a temporary file for parsing; the temporary file is deleted right after
+- Parsed chunks and their embeddings go into a **persistent index** (`./index/`, or `VECTOR_STORE_DIR`) that survives restarts and is **shared by every session**. It stores the **full chunk text in plaintext** (`docs.jsonl`) next to the vectors, plus a manifest of indexed files and the sessions holding them
+- Two SQLite caches under `./cache/` also persist: embeddings keyed by a hash of the chunk text, and the **extracted text of parsed PDF pages in plaintext**
+- Chat history and the answer cache live in memory only and are lost on restart
+- The AI reasons **only over content in the index**, which includes files uploaded by other sessions and earlier runs
+
+What is removed, and when:
+- **Clear Session** releases only the files this session uploaded; their chunks are deleted unless another open session uploaded the same file. Everything else stays in the index
+- Uploading a changed file under an existing name replaces the earlier versions held by this session or by sessions that are gone
+- The caches are never cleared by the app; they only evict least recently used entries once over their size cap
+- Deleting `./index/` and `./cache/` while the app is stopped discards all indexed and cached content
+
+This design allows stakeholders to evaluate:
 - The quality of retrieval-augmented reasoning
 - The usefulness of responses for real business questions
 - The agentic interaction pattern (Retrieve → Reason → Respond)
 
-without introducing data retention, access, or governance risk.
+Documents that must not be kept on the host's disk should not be uploaded.
 
         """
     )
 
-    diagram_ephemeral = r"""
+    diagram_prototype = r"""
 +------------------------+        +-------------------------+
 |     Ops Team Member    |        |       Streamlit UI      |
 |     (upload + ask)     |------->|  upload + chat interface|
@@ -306,25 +451,29 @@ without introducing data retention, access, or governance risk.
                                   |  Session Memory    |
                                   | - uploaded_files   |
                                   | - chat_history     |
-                                  | - rag_ready flag   |
+                                  | - owner_id         |
                                   +---------+----------+
                                             |
                                             | (temp write for parsing)
                                             v
                                   +---------+----------+
                                   | Temp File (/tmp)   |
-                                  | short-lived         |
+                                  | short-lived        |
                                   +---------+----------+
                                             |
                                             v
 +---------------------+     +----------------+     +-------------------+
 | Parse docs to text  |---->| Chunk text     |---->| Create embeddings |
-+---------------------+     +----------------+     +---------+---------+
+| (PDF page cache:    |     +----------------+     | (embedding cache: |
+|  ./cache, on disk)  |                            |  ./cache, on disk)|
++---------------------+                            +---------+---------+
                                                               |
                                                               v
                                                    +----------+----------+
-                                                   | In-Memory Vector    |
-                                                   | Store (ephemeral)   |
+                                                   | Persistent Index    |
+                                                   | ./index (on disk,   |
+                                                   | shared by sessions) |
+                                                   | vectors + chunk text|
                                                    +----------+----------+
                                                               ^
                                                               |
@@ -339,18 +488,19 @@ without introducing data retention, access, or governance risk.
 
 Notes:
 - Temp files are deleted after parsing.
-- Nothing is persisted across app restarts.
+- ./index and ./cache persist across app restarts; chat history does not.
+- Clear Session removes only this session's uploads from ./index.
 """
-    st.code(diagram_ephemeral, language="text")
+    st.code(diagram_prototype, language="text")
 
     st.markdown(
         """
 **Why this design matters**
 
-The ephemeral prototype establishes confidence in three critical areas:
+The prototype establishes confidence in three critical areas:
 - **Accuracy** — responses are grounded in known sources
 - **Consistency** — definitions and standards are interpreted uniformly
-- **Trust** — the system does not retain or reuse data unintentionally
+- **Transparency** — what is stored, where, and for how long is stated above rather than assumed
 
 This ensures the platform is evaluated as an **internal enablement tool**, not a black-box chatbot.
         """
@@ -360,16 +510,16 @@ This ensures the platform is evaluated as an **internal enablement tool**, not a
 
     st.markdown(
 """
-### Data Flow: Production Evolution (Ephemeral + Persistent Layers)
+### Data Flow: Production Evolution (Governed Persistent Layers)
 
 This diagram illustrates the **target production architecture**, where the same agentic reasoning pattern is preserved while introducing enterprise-grade capabilities.
 
-The key architectural shift is **intentional persistence**:
+The key architectural shift is **governed persistence**:
 - Knowledge is stored deliberately
 - Access is governed explicitly
 - Usage is observable and auditable
 
-Importantly, ephemeral processing remains — it is complemented, not replaced, by persistent layers.
+Importantly, parsing and embedding stay short-lived processing steps; what they produce moves from a local index into governed, access-controlled stores.
 """
     )
 
@@ -437,8 +587,8 @@ Also:
 
 In a production deployment, the platform introduces:
 
-- **Persistent vector storage**  
-  Enables reliable retrieval across sessions and users
+- **Managed vector storage**  
+  Enables reliable, access-controlled retrieval across users
 
 - **Metadata and ownership tracking**  
   Associates knowledge with source systems, timestamps, and stewardship
@@ -465,8 +615,8 @@ This progression enables AI to move from **informational support** to **operatio
 ### Executive takeaway
 
 The architecture demonstrates a deliberate progression:
-- Start ephemeral to prove value safely
-- Add persistence to scale knowledge reliably
+- Start with a local index to prove value quickly
+- Move to managed, governed storage to scale knowledge reliably
 - Introduce governance to enable enterprise adoption
 - Extend into workflows to unlock productivity gains
 
@@ -487,3 +637,6 @@ st.markdown(
 """,
     unsafe_allow_html=True,
 )
+
+# The page is drawn; create the model clients in the background before the first question needs them
+preload()
@@ -0,0 +1,109 @@
+"""Exact top-k similarity search over a matrix of L2-normalized embeddings."""
+
+from typing import Optional, Tuple
+
+import numpy as np
+
+
+def normalize(vectors: np.ndarray) -> np.ndarray:
+    """Return float32 copies of the rows (or a single vector) scaled to unit length."""
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+
+def top_k(scores: np.ndarray, k: int) -> np.ndarray:
+    """Indices of the k highest scores, best first.
+
+    Uses a partial sort (O(n)) and only fully sorts the k winners.
+    """
+    n = scores.shape[0]
+    if k <= 0 or n == 0:
+        return np.empty(0, dtype=np.int64)
+    if k < n:
+        candidates = np.argpartition(scores, n - k)[n - k:]
+    else:
+        candidates = np.arange(n)
+    return candidates[np.argsort(-scores[candidates], kind="stable")]
+
+
+def search(
+    matrix: np.ndarray, query: np.ndarray, k: int, exclude: Optional[np.ndarray] = None
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Score every row with one matrix-vector product and return (ids, scores).
+
+    Rows listed in ``exclude`` (deleted chunks) are never returned.
+    """
+    scores = matrix @ normalize(query)
+    if exclude is not None and exclude.size:
+        scores[exclude] = -np.inf
+    ids = top_k(scores, k)
+    return drop_excluded(ids, scores[ids])
+
+
+def drop_excluded(ids: np.ndarray, scores: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Remove results whose score was set to -inf to exclude them."""
+    keep = np.isfinite(scores)
+    if keep.all():
+        return ids, scores
+    return ids[keep], scores[keep]
+
+
+def top_k_rows(scores: np.ndarray, k: int) -> np.ndarray:
+    """Per-row version of ``top_k`` for a (queries, candidates) score matrix."""
+    n = scores.shape[1]
+    k = min(k, n)
+    if k <= 0:
+        return np.empty((scores.shape[0], 0), dtype=np.int64)
+    if k < n:
+        candidates = np.argpartition(scores, n - k, axis=1)[:, n - k:]
+    else:
+        candidates = np.broadcast_to(np.arange(n), scores.shape)
+    order = np.argsort(-np.take_along_axis(scores, candidates, axis=1), axis=1, kind="stable")
+    return np.take_along_axis(candidates, order, axis=1)
+
+
+def search_many(
+    matrix: np.ndarray,
+    queries: np.ndarray,
+    k: int,
+    rows: Optional[np.ndarray] = None,
+    max_block_bytes: int = 256 * 1024 ** 2,
+    exclude: Optional[np.ndarray] = None,
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Top k for many queries at once: (ids, scores), each shaped (queries, k).
+
+    Queries are scored in blocks with one matrix-matrix product each, sized
+    so the block's score matrix stays under ``max_block_bytes``. Rows in
+    ``exclude`` (only used without ``rows``) come back with a -inf score.
+    """
+    queries = normalize(queries)
+    candidates = matrix if rows is None else matrix[rows]
+    n = candidates.shape[0]
+    block = max(1, max_block_bytes // max(1, n * 4))
+    k = min(k, n)
+    ids = np.empty((queries.shape[0], k), dtype=np.int64)
+    scores = np.empty((queries.shape[0], k), dtype=np.float32)
+    for start in range(0, queries.shape[0], block):
+        block_scores = queries[start:start + block] @ candidates.T
+        if rows is None and exclude is not None and exclude.size:
+            block_scores[:, exclude] = -np.inf
+        best = top_k_rows(block_scores, k)
+        scores[start:start + block] = np.take_along_axis(block_scores, best, axis=1)
+        ids[start:start + block] = best if rows is None else rows[best]
+    return ids, scores
+
+
+def search_rows(
+    matrix: np.ndarray,
+    query: np.ndarray,
+    k: int,
+    rows: Optional[np.ndarray] = None,
+    exclude: Optional[np.ndarray] = None,
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Like ``search``, but only over the given row ids (all rows except ``exclude`` when None)."""
+    if rows is None:
+        return search(matrix, query, k, exclude)
+    scores = matrix[rows] @ normalize(query)
+    best = top_k(scores, k)
+    return rows[best], scores[best]
@@ -0,0 +1,850 @@
+"""Disk-persistent vector store backed by a memory-mapped float32 matrix.
+
+Layout of the store directory:
+  - vectors.f32   contiguous row-major float32 matrix (one L2-normalized row per chunk)
+  - docs.jsonl    one JSON record per chunk (id, page_content, metadata)
+  - offsets.u64   byte offset of every record in docs.jsonl
+  - tombstones.i64  row ids of deleted chunks
+  - meta.json     committed row count, dimension, file sizes, corpus version,
+                  tombstone count and generation
+
+Appends write the data files first and publish them by atomically replacing
+meta.json, so a crash mid-write never exposes a half-written row.
+
+Deletes only append row ids to the tombstone file; searches skip those rows.
+Compaction copies the live rows into the files of the next generation
+(``vectors.1.f32``, ``docs.1.jsonl``, ...), publishes them through meta.json
+and removes the old generation, so the matrix shrinks back to the live corpus.
+"""
+
+import json
+import logging
+import mmap
+import os
+import threading
+import uuid
+from contextlib import contextmanager
+from functools import partial
+from typing import Any, Callable, Iterable, Iterator, List, Optional, Tuple, TypeVar
+
+import numpy as np
+
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from langchain_core.runnables.config import run_in_executor
+from langchain_core.vectorstores import VectorStore
+
+import ann_index
+from ann_index import IVFIndex
+from lexical_index import BM25Index, reciprocal_rank_fusion
+from metadata_index import MetadataIndex
+from metrics import METRICS
+from quantization import QuantizedIndex
+from vector_search import drop_excluded, normalize, search_many, search_rows
+
+try:
+    import fcntl
+except ImportError:  # Windows: single writer per directory is assumed
+    fcntl = None
+
+VECTORS_FILE = "vectors.f32"
+DOCS_FILE = "docs.jsonl"
+OFFSETS_FILE = "offsets.u64"
+TOMBSTONES_FILE = "tombstones.i64"
+META_FILE = "meta.json"
+LOCK_FILE = ".lock"
+# Held while the IVF index is synced, so it never blocks appends
+IVF_LOCK_FILE = ".ivf.lock"
+
+# Rows copied per step while compacting
+_COMPACT_BLOCK = 65536
+
+T = TypeVar("T")
+
+
+class MmapVectorStore(VectorStore):
+    """Vector store persisted as a float32 matrix plus a JSONL side file.
+
+    Everything is memory-mapped read-only, so a warm start does not re-embed
+    anything and several processes share one page-cached copy of the index.
+    With ``quantization`` ("float16", "int8" or "float32") and/or
+    ``quantized_dims`` set, an in-memory compressed copy is kept for
+    ``search_mode="quantized"``. With ``ivf`` set, an IVF index is kept for
+    ``search_mode="ivf"``; a background thread trains and extends it.
+
+    Once deleted rows make up ``compact_ratio`` of the store, a background
+    thread compacts it (0 disables automatic compaction).
+    """
+
+    def __init__(
+        self,
+        embedding: Embeddings,
+        path: str,
+        quantization: Optional[str] = None,
+        quantized_dims: Optional[int] = None,
+        compact_ratio: float = 0.2,
+        ivf: bool = False,
+    ) -> None:
+        self.embedding = embedding
+        self.path = path
+        self.compact_ratio = compact_ratio
+        self.ivf_enabled = ivf
+        os.makedirs(path, exist_ok=True)
+
+        self._lock = threading.RLock()
+        # Serializes writers in this process; the file lock covers other processes
+        self._write_lock = threading.Lock()
+        self._compacting = False
+        self._ivf_lock = threading.Lock()
+        self._ivf_syncing = False
+        self._ivf_signature = (0, 0)
+        self._meta_mtime: Optional[int] = None
+        self._dim = 0
+        self._count = 0
+        self._docs_bytes = 0
+        self._version = 0
+        self._generation: Optional[int] = None
+        self._deleted = np.empty(0, dtype=np.int64)
+        self._matrix = np.empty((0, 0), dtype=np.float32)
+        self._offsets = np.empty(0, dtype=np.uint64)
+        self._docs_map: Optional[mmap.mmap] = None
+        # Built from docs.jsonl on first use, then kept in step with appends
+        self._bm25 = BM25Index()
+        self._lexical_lock = threading.Lock()
+        self._metadata = MetadataIndex()
+        self._metadata_lock = threading.Lock()
+        self._quantized: Optional[QuantizedIndex] = None
+        if quantization or quantized_dims:
+            self._quantized = QuantizedIndex(quantization or "float32", quantized_dims)
+        self._load()
+        self._refresh_ivf()
+
+    @property
+    def embeddings(self) -> Embeddings:
+        return self.embedding
+
+    def __len__(self) -> int:
+        """Number of live (not deleted) chunks."""
+        self._maybe_reload()
+        with self._lock:
+            return self._count - self._deleted.size
+
+    @property
+    def n_deleted(self) -> int:
+        """Deleted chunks still taking up space until the next compaction."""
+        self._maybe_reload()
+        return int(self._deleted.size)
+
+    @property
+    def version(self) -> int:
+        """Corpus version; changes whenever the indexed content changes."""
+        self._maybe_reload()
+        return self._version
+
+    # ------------------------------------------------------------------
+    # Persistence
+    # ------------------------------------------------------------------
+    def _file(self, name: str, generation: Optional[int] = None) -> str:
+        """Path of a store file; data files of generation g > 0 carry a ``.g`` suffix."""
+        if generation:
+            stem, ext = os.path.splitext(name)
+            name = f"{stem}.{generation}{ext}"
+        return os.path.join(self.path, name)
+
+    def _read_meta(self) -> dict:
+        try:
+            with open(self._file(META_FILE), encoding="utf-8") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {"count": 0, "dim": 0, "docs_bytes": 0, "version": 0}
+
+    def _write_meta(self, **changes: Any) -> None:
+        """Atomically publish the current state with ``changes`` applied."""
+        meta = {
+            "count": self._count,
+            "dim": self._dim,
+            "docs_bytes": self._docs_bytes,
+            "version": self._version,
+            "deleted": int(self._deleted.size),
+            "generation": self._generation or 0,
+        }
+        meta.update(changes)
+        tmp_path = self._file(META_FILE + ".tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(meta, f)
+        os.replace(tmp_path, self._file(META_FILE))
+
+    @contextmanager
+    def _file_lock(self, name: str = LOCK_FILE, lock: Optional[Any] = None) -> Iterator[None]:
+        """Exclusive writer lock, shared with other processes using this directory."""
+        with lock or self._write_lock, open(self._file(name), "a") as lock_file:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _load(self) -> None:
+        """(Re)map the committed part of the data files."""
+        with self._lock:
+            for attempt in range(3):
+                meta_path = self._file(META_FILE)
+                self._meta_mtime = os.stat(meta_path).st_mtime_ns if os.path.exists(meta_path) else None
+                meta = self._read_meta()
+                try:
+                    self._map(meta)
+                    return
+                except FileNotFoundError:
+                    # Another process compacted between reading meta.json and mapping
+                    if attempt == 2:
+                        raise
+
+    def _map(self, meta: dict) -> None:
+        count, dim = int(meta["count"]), int(meta["dim"])
+        generation = int(meta.get("generation", 0))
+        n_deleted = int(meta.get("deleted", 0))
+
+        if count and dim:
+            matrix = np.memmap(
+                self._file(VECTORS_FILE, generation), dtype=np.float32, mode="r", shape=(count, dim)
+            )
+            offsets = np.memmap(
+                self._file(OFFSETS_FILE, generation), dtype=np.uint64, mode="r", shape=(count,)
+            )
+            with open(self._file(DOCS_FILE, generation), "rb") as f:
+                docs_map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        else:
+            matrix = np.empty((0, dim), dtype=np.float32)
+            offsets = np.empty(0, dtype=np.uint64)
+            docs_map = None
+        if n_deleted:
+            deleted = np.unique(
+                np.fromfile(self._file(TOMBSTONES_FILE, generation), dtype=np.int64, count=n_deleted)
+            )
+        else:
+            deleted = np.empty(0, dtype=np.int64)
+
+        if generation != self._generation:
+            # Row ids were renumbered by a compaction: derived indexes start over
+            # (the IVF index is loaded from disk by the next background sync)
+            self._ivf = IVFIndex(tag=_tag(generation))
+            self._bm25 = BM25Index()
+            self._metadata = MetadataIndex()
+            if self._quantized is not None:
+                self._quantized = QuantizedIndex(self._quantized.codec, self._quantized.dims)
+        self._dim, self._count = dim, count
+        self._docs_bytes = int(meta["docs_bytes"])
+        self._version = int(meta.get("version", 0))
+        self._generation, self._deleted = generation, deleted
+        self._matrix, self._offsets, self._docs_map = matrix, offsets, docs_map
+
+    def _maybe_reload(self) -> None:
+        """Pick up rows committed by another process sharing this directory."""
+        meta_path = self._file(META_FILE)
+        try:
+            mtime = os.stat(meta_path).st_mtime_ns
+        except FileNotFoundError:
+            return
+        if mtime != self._meta_mtime:
+            self._load()
+
+    def _append(self, vectors: np.ndarray, records: List[bytes]) -> None:
+        """Append rows to the data files and publish them via meta.json."""
+        with self._file_lock():
+            self._maybe_reload()
+            if self._dim and vectors.shape[1] != self._dim:
+                raise ValueError(
+                    f"Embedding dimension {vectors.shape[1]} does not match "
+                    f"the store dimension {self._dim}"
+                )
+
+            row_bytes = vectors.shape[1] * 4
+            offsets = np.empty(len(records), dtype=np.uint64)
+            pos = self._docs_bytes
+            for i, record in enumerate(records):
+                offsets[i] = pos
+                pos += len(record)
+
+            # Truncate anything left behind by an interrupted append first
+            generation = self._generation
+            _append_bytes(self._file(VECTORS_FILE, generation), self._count * row_bytes, vectors.tobytes())
+            _append_bytes(self._file(OFFSETS_FILE, generation), self._count * 8, offsets.tobytes())
+            _append_bytes(self._file(DOCS_FILE, generation), self._docs_bytes, b"".join(records))
+
+            self._write_meta(
+                count=self._count + len(records),
+                dim=vectors.shape[1],
+                docs_bytes=pos,
+                version=self._version + 1,
+            )
+            self._load()
+            quantized = self._quantized
+        if quantized is not None:
+            quantized.sync(self._matrix)
+        self._refresh_ivf()
+
+    def _tombstone(self, select: Callable[[], np.ndarray]) -> int:
+        """Mark the rows ``select()`` returns as deleted and publish the new tombstones.
+
+        ``select`` runs under the writer lock, so a compaction cannot renumber
+        the rows between choosing and deleting them. Returns how many were new.
+        """
+        with self._file_lock():
+            self._maybe_reload()
+            rows = np.setdiff1d(np.asarray(select(), dtype=np.int64), self._deleted)
+            rows = rows[(rows >= 0) & (rows < self._count)]
+            if rows.size:
+                _append_bytes(
+                    self._file(TOMBSTONES_FILE, self._generation), self._deleted.size * 8, rows.tobytes()
+                )
+                self._write_meta(deleted=self._deleted.size + rows.size, version=self._version + 1)
+                self._load()
+        self._maybe_compact()
+        return int(rows.size)
+
+    def _maybe_compact(self) -> None:
+        """Start a background compaction once enough of the store is deleted."""
+        with self._lock:
+            if (
+                self._compacting
+                or not self.compact_ratio
+                or not self._count
+                or self._deleted.size < self.compact_ratio * self._count
+            ):
+                return
+            self._compacting = True
+        threading.Thread(target=self._compact_in_background, name="vector-store-compaction", daemon=True).start()
+
+    def _compact_in_background(self) -> None:
+        try:
+            self.compact()
+        except Exception:
+            logging.exception("Vector store compaction failed")
+        finally:
+            self._compacting = False
+
+    def compact(self) -> bool:
+        """Rewrite the store without its deleted rows. Returns False if there was nothing to drop.
+
+        Searches keep running on the old generation while the new one is
+        written; only other writers wait. The derived indexes in use (IVF,
+        quantized copy, BM25, metadata) are carried over to the new row ids
+        during the copy and swapped in together with it.
+        """
+        # The IVF lock keeps a background sync from writing index files of the old generation
+        with self._file_lock(), self._file_lock(IVF_LOCK_FILE, self._ivf_lock):
+            self._maybe_reload()
+            if not self._deleted.size:
+                return False
+            with self._lock:
+                matrix, offsets, docs_map = self._matrix, self._offsets, self._docs_map
+                old_generation, ivf, quantized = self._generation, self._ivf, self._quantized
+                warm_lexical, warm_metadata = self._bm25.n_indexed > 0, self._metadata.n_indexed > 0
+                live = np.setdiff1d(np.arange(self._count), self._deleted)
+            generation = old_generation + 1
+            bm25, metadata = BM25Index(), MetadataIndex()
+
+            pos = 0
+            with open(self._file(VECTORS_FILE, generation), "wb") as vectors_file, \
+                    open(self._file(DOCS_FILE, generation), "wb") as docs_file, \
+                    open(self._file(OFFSETS_FILE, generation), "wb") as offsets_file:
+                for start in range(0, live.size, _COMPACT_BLOCK):
+                    block = live[start:start + _COMPACT_BLOCK]
+                    vectors_file.write(np.ascontiguousarray(matrix[block]).tobytes())
+                    new_offsets = np.empty(block.size, dtype=np.uint64)
+                    records = []
+                    for i, row in enumerate(block):
+                        begin = int(offsets[row])
+                        record = docs_map[begin:docs_map.find(b"\n", begin) + 1]
+                        new_offsets[i] = pos
+                        pos += len(record)
+                        docs_file.write(record)
+                        if warm_lexical or warm_metadata:
+                            records.append(json.loads(record))
+                    offsets_file.write(new_offsets.tobytes())
+                    if warm_lexical:
+                        bm25.add(r["page_content"] for r in records)
+                    if warm_metadata:
+                        metadata.add(r["metadata"] for r in records)
+                for f in (vectors_file, docs_file, offsets_file):
+                    f.flush()
+                    os.fsync(f.fileno())
+            new_ivf = ivf.take(live, self.path if ivf.path else None, _tag(generation))
+            new_quantized = quantized.take(live) if quantized is not None else None
+
+            self._write_meta(
+                count=int(live.size),
+                docs_bytes=pos,
+                version=self._version + 1,
+                deleted=0,
+                generation=generation,
+            )
+            with self._lock:
+                self._load()
+                if self._generation == generation:
+                    self._ivf, self._ivf_signature = new_ivf, new_ivf.file_signature()
+                    self._bm25, self._metadata = bm25, metadata
+                    if new_quantized is not None:
+                        self._quantized = new_quantized
+            for name in (VECTORS_FILE, DOCS_FILE, OFFSETS_FILE, TOMBSTONES_FILE):
+                # Open memory maps of the old files stay valid after unlinking
+                try:
+                    os.remove(self._file(name, old_generation))
+                except OSError:
+                    pass
+            ann_index.remove_files(self.path, _tag(old_generation))
+        logging.info(
+            "Compacted vector store to generation %d: %d live rows, %d deleted rows dropped",
+            generation, live.size, matrix.shape[0] - live.size,
+        )
+        # Rows the IVF index had not assigned yet
+        self._refresh_ivf()
+        return True
+
+    def _consistent(self, read: Callable[[], T]) -> T:
+        """Run a read, repeating it if a compaction renumbered the rows meanwhile."""
+        for _ in range(2):
+            generation = self._generation
+            try:
+                result = read()
+            except (IndexError, ValueError):
+                if self._generation == generation:
+                    raise
+                continue
+            if self._generation == generation:
+                return result
+        return read()
+
+    def _refresh_ivf(self) -> None:
+        """Start a background IVF sync unless one is running or there is nothing to do.
+
+        Searches keep using the current index meanwhile; rows it does not
+        cover yet are scored exactly.
+        """
+        with self._lock:
+            if (
+                not self.ivf_enabled
+                or self._ivf_syncing
+                or self._count < ann_index.MIN_TRAIN_ROWS
+                or self._ivf.n_indexed == self._count
+            ):
+                return
+            self._ivf_syncing = True
+        threading.Thread(target=self._sync_ivf_in_background, name="ivf-sync", daemon=True).start()
+
+    def _sync_ivf_in_background(self) -> None:
+        try:
+            while self._sync_ivf():
+                pass
+        except Exception:
+            logging.exception("IVF index sync failed")
+        finally:
+            self._ivf_syncing = False
+
+    def _sync_ivf(self) -> bool:
+        """Train or extend the IVF index outside the store locks, then swap it in.
+
+        Returns True if rows were committed while it ran (another sync is due).
+        """
+        with self._file_lock(IVF_LOCK_FILE, self._ivf_lock):
+            self._maybe_reload()
+            with self._lock:
+                matrix, count, generation, ivf = self._matrix, self._count, self._generation, self._ivf
+                signature = self._ivf_signature
+            if ivf.path is None or ivf.file_signature() != signature:
+                # First sync, or another process synced the files since: start from disk
+                ivf = IVFIndex(self.path, tag=_tag(generation))
+            if ivf.n_indexed > count:
+                # Index files are ahead of the data files: start over
+                ivf.clear()
+            ivf.sync(matrix)
+            with self._lock:
+                if self._generation != generation:
+                    return False
+                self._ivf, self._ivf_signature = ivf, ivf.file_signature()
+                return ivf.is_trained and self._count > ivf.n_indexed
+
+    def _sync_lexical(self) -> BM25Index:
+        """BM25 index over the committed rows, built on first use.
+
+        Only bm25 and hybrid retrieval call this, so other modes never hold
+        an inverted index.
+        """
+        return self._sync_row_index("_bm25", self._lexical_lock, "page_content", BM25Index)
+
+    def _sync_metadata(self) -> MetadataIndex:
+        """Metadata posting lists over the committed rows, built on the first filter."""
+        return self._sync_row_index("_metadata", self._metadata_lock, "metadata", MetadataIndex)
+
+    def _sync_row_index(self, attr: str, lock: threading.Lock, field: str, factory: Callable[[], T]) -> T:
+        """Extend a per-row index (``_bm25`` / ``_metadata``) with the rows committed since its last sync.
+
+        The first sync reads all of docs.jsonl. It runs outside the store
+        lock, so searches that do not use this index never wait for it.
+        """
+        with lock:
+            with self._lock:
+                index, count, generation = getattr(self, attr), self._count, self._generation
+                offsets, docs_map = self._offsets, self._docs_map
+            if index.n_indexed > count:
+                index = factory()
+            index.add(
+                _read_record(offsets, docs_map, row)[field] for row in range(index.n_indexed, count)
+            )
+            with self._lock:
+                if self._generation == generation:
+                    setattr(self, attr, index)
+            return index
+
+    # ------------------------------------------------------------------
+    # VectorStore API
+    # ------------------------------------------------------------------
+    def add_texts(
+        self,
+        texts: Iterable[str],
+        metadatas: Optional[List[dict]] = None,
+        ids: Optional[List[str]] = None,
+        **kwargs: Any,
+    ) -> List[str]:
+        texts = list(texts)
+        if not texts:
+            return []
+        metadatas = metadatas or [{} for _ in texts]
+        ids = [i or str(uuid.uuid4()) for i in ids] if ids else [str(uuid.uuid4()) for _ in texts]
+
+        with METRICS.add_time("ingest_seconds_total", stage="embed"):
+            vectors = normalize(self.embedding.embed_documents(texts))
+
+        records = [
+            json.dumps(
+                {"id": doc_id, "page_content": text, "metadata": metadata},
+                ensure_ascii=False,
+                default=str,
+            ).encode("utf-8")
+            + b"\n"
+            for doc_id, text, metadata in zip(ids, texts, metadatas)
+        ]
+        with METRICS.add_time("ingest_seconds_total", stage="index"):
+            self._append(vectors, records)
+        return ids
+
+    def delete(self, ids: Optional[List[str]] = None, **kwargs: Any) -> Optional[bool]:
+        """Delete chunks by id. Scans the side file; prefer ``delete_where`` for whole sources."""
+        if not ids:
+            return False
+        wanted = set(ids)
+
+        def select() -> np.ndarray:
+            with self._lock:
+                count, offsets, docs_map = self._count, self._offsets, self._docs_map
+            return np.asarray(
+                [row for row in range(count) if _read_record(offsets, docs_map, row)["id"] in wanted],
+                dtype=np.int64,
+            )
+
+        return self._tombstone(select) > 0
+
+    def delete_where(self, filter: dict) -> int:
+        """Delete every chunk whose metadata matches ``filter``. Returns the number deleted."""
+        if not filter:
+            raise ValueError("delete_where needs a non-empty filter")
+        return self._tombstone(lambda: self._filter_rows(filter))
+
+    def _record(self, row: int) -> dict:
+        return _read_record(self._offsets, self._docs_map, row)
+
+    def get_document(self, row: int) -> Document:
+        """Read one stored chunk back from the side file."""
+        record = self._record(row)
+        return Document(
+            id=record["id"], page_content=record["page_content"], metadata=record["metadata"]
+        )
+
+    def similarity_search_with_score_by_vector(
+        self,
+        embedding: List[float],
+        k: int = 4,
+        search_mode: str = "exact",
+        n_probe: int = 8,
+        filter: Optional[dict] = None,
+        rescore_factor: int = 4,
+        **kwargs: Any,
+    ) -> List[Tuple[Document, float]]:
+        """Search by vector.
+
+        ``search_mode="ivf"`` scores only the ``n_probe`` closest IVF lists
+        (store created with ``ivf=True``); it falls back to exact search until
+        the index is trained.
+        ``search_mode="quantized"`` scores the compressed copy and rescores the
+        best ``k * rescore_factor`` rows at full precision (1 skips rescoring).
+        ``filter`` restricts the search to chunks whose metadata matches (see
+        ``metadata_index``); only those rows are scored.
+        """
+        def read() -> List[Tuple[Document, float]]:
+            ids, scores = self._vector_rows(
+                embedding, k, search_mode, n_probe, self._filter_rows(filter), rescore_factor
+            )
+            return [(self.get_document(int(i)), float(s)) for i, s in zip(ids, scores)]
+
+        return self._consistent(read)
+
+    def _filter_rows(self, filter: Optional[dict]) -> Optional[np.ndarray]:
+        """Live row ids matching a metadata filter, or None for no filter."""
+        if not filter:
+            return None
+        self._maybe_reload()
+        metadata = self._sync_metadata()
+        with self._lock:
+            count, deleted = self._count, self._deleted
+        mask = metadata.mask(filter, count)
+        mask[deleted] = False
+        return np.flatnonzero(mask)
+
+    def metadata_values(self, field: str) -> List[Any]:
+        """Distinct values of a metadata field across the live chunks (e.g. every ``source``).
+
+        Builds the metadata index on first use, which reads every record.
+        """
+        self._maybe_reload()
+        metadata = self._sync_metadata()
+        with self._lock:
+            deleted = self._deleted
+        return metadata.values(field, exclude=deleted)
+
+    def _vector_rows(
+        self,
+        embedding: List[float],
+        k: int,
+        search_mode: str,
+        n_probe: int,
+        rows: Optional[np.ndarray] = None,
+        rescore_factor: int = 4,
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        if search_mode == "quantized" and self._quantized is None:
+            raise ValueError("search_mode='quantized' needs a store created with quantization")
+        if search_mode == "ivf" and not self.ivf_enabled:
+            raise ValueError("search_mode='ivf' needs a store created with ivf=True")
+        if search_mode not in ("exact", "ivf", "quantized"):
+            raise ValueError(f"Unknown search mode {search_mode!r}")
+        self._maybe_reload()
+        with self._lock:
+            matrix, count, ivf, deleted = self._matrix, self._count, self._ivf, self._deleted
+            quantized = self._quantized
+        if search_mode == "quantized":
+            quantized.sync(matrix)
+        if search_mode == "ivf" and ivf.n_indexed < count:
+            self._refresh_ivf()
+        if count == 0:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+
+        query = np.asarray(embedding, dtype=np.float32)
+        if search_mode == "quantized":
+            return quantized.search(
+                query, k, matrix=matrix, rescore_factor=rescore_factor, rows=rows, exclude=deleted
+            )
+        if rows is not None:
+            # Filtered: scoring just the matching rows beats probing IVF lists
+            return search_rows(matrix, query, k, rows[rows < count])
+        if search_mode == "ivf" and ivf.is_trained:
+            return ivf.search(matrix, query, k, n_probe=n_probe, exclude=deleted)
+        return search_rows(matrix, query, k, exclude=deleted)
+
+    def _vector_rows_many(
+        self,
+        embeddings: List[List[float]],
+        k: int,
+        search_mode: str,
+        n_probe: int,
+        rows: Optional[np.ndarray] = None,
+        rescore_factor: int = 4,
+    ) -> List[Tuple[np.ndarray, np.ndarray]]:
+        """``_vector_rows`` for many queries; exact search uses one matrix-matrix product."""
+        self._maybe_reload()
+        with self._lock:
+            matrix, count, deleted = self._matrix, self._count, self._deleted
+        if search_mode != "exact" or count == 0 or not embeddings:
+            return [
+                self._vector_rows(e, k, search_mode, n_probe, rows, rescore_factor)
+                for e in embeddings
+            ]
+        if rows is not None:
+            rows = rows[rows < count]
+            if rows.size == 0:
+                empty = (np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32))
+                return [empty for _ in embeddings]
+        ids, scores = search_many(
+            matrix, np.asarray(embeddings, dtype=np.float32), k, rows, exclude=deleted
+        )
+        return [drop_excluded(i, s) for i, s in zip(ids, scores)]
+
+    def _embed_queries(self, queries: List[str]) -> List[List[float]]:
+        """Embed many queries in one batched call (through the query cache when there is one)."""
+        embed_queries = getattr(self.embedding, "embed_queries", None)
+        if embed_queries is not None:
+            return embed_queries(queries)
+        return self.embedding.embed_documents(queries)
+
+    def batch_similarity_search(
+        self,
+        queries: List[str],
+        k: int = 4,
+        search_mode: str = "exact",
+        n_probe: int = 8,
+        filter: Optional[dict] = None,
+        rescore_factor: int = 4,
+    ) -> List[List[Document]]:
+        """``similarity_search`` for many queries: one embedding call, one scoring pass."""
+        embeddings = self._embed_queries(queries)
+
+        def read() -> List[List[Document]]:
+            hits = self._vector_rows_many(
+                embeddings, k, search_mode, n_probe, self._filter_rows(filter), rescore_factor
+            )
+            return [[self.get_document(int(i)) for i in ids] for ids, _ in hits]
+
+        return self._consistent(read)
+
+    def batch_hybrid_search(
+        self,
+        queries: List[str],
+        k: int = 4,
+        fetch_k: int = 20,
+        rrf_k: int = 60,
+        search_mode: str = "exact",
+        n_probe: int = 8,
+        filter: Optional[dict] = None,
+        rescore_factor: int = 4,
+    ) -> List[List[Document]]:
+        """``hybrid_search`` for many queries, with the vector side batched."""
+        embeddings = self._embed_queries(queries)
+
+        def read() -> List[List[Document]]:
+            rows = self._filter_rows(filter)
+            vector_hits = self._vector_rows_many(
+                embeddings, fetch_k, search_mode, n_probe, rows, rescore_factor
+            )
+            results = []
+            for query, (vector_ids, _) in zip(queries, vector_hits):
+                lexical_ids, _ = self._lexical_rows(query, fetch_k, rows)
+                fused = reciprocal_rank_fusion([vector_ids, lexical_ids], k, rrf_k=rrf_k)
+                results.append([self.get_document(row) for row, _ in fused])
+            return results
+
+        return self._consistent(read)
+
+    def _lexical_rows(
+        self, query: str, k: int, rows: Optional[np.ndarray] = None
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        self._maybe_reload()
+        bm25 = self._sync_lexical()
+        with self._lock:
+            deleted = self._deleted
+        return bm25.search(query, k, rows, exclude=deleted)
+
+    def lexical_search_with_score(
+        self, query: str, k: int = 4, filter: Optional[dict] = None
+    ) -> List[Tuple[Document, float]]:
+        """BM25 keyword search; only chunks containing a query term are returned."""
+        def read() -> List[Tuple[Document, float]]:
+            ids, scores = self._lexical_rows(query, k, self._filter_rows(filter))
+            return [(self.get_document(int(i)), float(s)) for i, s in zip(ids, scores)]
+
+        return self._consistent(read)
+
+    def hybrid_search(
+        self,
+        query: str,
+        k: int = 4,
+        fetch_k: int = 20,
+        rrf_k: int = 60,
+        search_mode: str = "exact",
+        n_probe: int = 8,
+        filter: Optional[dict] = None,
+        rescore_factor: int = 4,
+        embedding: Optional[List[float]] = None,
+    ) -> List[Tuple[Document, float]]:
+        """Fuse the top ``fetch_k`` vector and BM25 hits with reciprocal rank fusion.
+
+        ``embedding`` is the query's embedding when the caller already has it.
+        """
+        if embedding is None:
+            embedding = self.embedding.embed_query(query)
+
+        def read() -> List[Tuple[Document, float]]:
+            rows = self._filter_rows(filter)
+            vector_ids, _ = self._vector_rows(embedding, fetch_k, search_mode, n_probe, rows, rescore_factor)
+            lexical_ids, _ = self._lexical_rows(query, fetch_k, rows)
+            fused = reciprocal_rank_fusion([vector_ids, lexical_ids], k, rrf_k=rrf_k)
+            return [(self.get_document(row), score) for row, score in fused]
+
+        return self._consistent(read)
+
+    def similarity_search_by_vector(
+        self, embedding: List[float], k: int = 4, **kwargs: Any
+    ) -> List[Document]:
+        return [doc for doc, _ in self.similarity_search_with_score_by_vector(embedding, k, **kwargs)]
+
+    def similarity_search_with_score(
+        self, query: str, k: int = 4, **kwargs: Any
+    ) -> List[Tuple[Document, float]]:
+        embedding = self.embedding.embed_query(query)
+        return self.similarity_search_with_score_by_vector(embedding, k, **kwargs)
+
+    def similarity_search(self, query: str, k: int = 4, **kwargs: Any) -> List[Document]:
+        return [doc for doc, _ in self.similarity_search_with_score(query, k, **kwargs)]
+
+    # Async variants await the provider for the query embedding; only the
+    # (CPU-bound) search itself borrows a worker thread
+
+    async def asimilarity_search_with_score(
+        self, query: str, k: int = 4, **kwargs: Any
+    ) -> List[Tuple[Document, float]]:
+        embedding = await self.embedding.aembed_query(query)
+        return await run_in_executor(
+            None, partial(self.similarity_search_with_score_by_vector, embedding, k, **kwargs)
+        )
+
+    async def asimilarity_search(self, query: str, k: int = 4, **kwargs: Any) -> List[Document]:
+        return [doc for doc, _ in await self.asimilarity_search_with_score(query, k, **kwargs)]
+
+    async def ahybrid_search(self, query: str, k: int = 4, **kwargs: Any) -> List[Tuple[Document, float]]:
+        embedding = await self.embedding.aembed_query(query)
+        return await run_in_executor(None, partial(self.hybrid_search, query, k, embedding=embedding, **kwargs))
+
+    @classmethod
+    def from_texts(
+        cls,
+        texts: List[str],
+        embedding: Embeddings,
+        metadatas: Optional[List[dict]] = None,
+        *,
+        path: str = "./index",
+        **kwargs: Any,
+    ) -> "MmapVectorStore":
+        store = cls(embedding=embedding, path=path)
+        store.add_texts(texts, metadatas=metadatas, **kwargs)
+        return store
+
+
+def _read_record(offsets: np.ndarray, docs_map: mmap.mmap, row: int) -> dict:
+    """One record of docs.jsonl, by row id."""
+    start = int(offsets[row])
+    return json.loads(docs_map[start:docs_map.find(b"\n", start)])
+
+
+def _tag(generation: Optional[int]) -> str:
+    """Suffix of the IVF index files of a store generation."""
+    return f".{generation}" if generation else ""
+
+
+def _append_bytes(path: str, committed: int, data: bytes) -> None:
+    """Write data right after the committed prefix of a file."""
+    mode = "r+b" if os.path.exists(path) else "w+b"
+    with open(path, mode) as f:
+        f.truncate(committed)
+        f.seek(committed)
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())